@@ -0,0 +1,65 @@
+# cache.py
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Cache LRU thread-safe yang dibatasi jumlah entri dan total ukuran (byte).
+    Dipakai Partition sebagai read cache untuk value dari cold storage yang sudah di-decode.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (value, size), yang paling baru dipakai di akhir
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Mengembalikan value yang di-cache atau None, sekaligus mencatat hit/miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int, still_valid=None):
+        """
+        still_valid: fungsi tanpa argumen yang dipanggil di bawah lock cache; jika hasilnya False entri tidak disimpan.
+        Karena invalidate memakai lock yang sama, penulis yang mengubah data lalu meng-invalidate tidak bisa
+        terselip di antara pemeriksaan dan penyimpanan.
+        """
+        if size > self.max_bytes: return
+        with self.lock:
+            if still_valid is not None and not still_valid(): return
+            old = self.entries.pop(key, None)
+            if old is not None: self.total_bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None: self.total_bytes -= old[1]
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries), "bytes": self.total_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
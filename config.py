@@ -20,4 +20,116 @@ CLUSTER_TOPOLOGY = {
         # Partisi 3: Leader di Node 0, Follower di Node 2
         3: {"leader": 0, "followers": [2]},
     }
-}
\ No newline at end of file
+}
+
+# Mode server untuk setiap node: 'thread' (ThreadingTCPServer, satu thread per koneksi)
+# atau 'asyncio' (satu event loop dengan executor terbatas untuk operasi partisi).
+NODE_SERVER_MODE = "thread"
+
+# Jumlah proses worker per node. 1 = satu proses seperti biasa. Lebih dari 1 = front-end meneruskan setiap request
+# ke worker pemilik partisinya (partition_id % NODE_WORKERS) lewat Unix socket, agar node bisa memakai banyak core.
+NODE_WORKERS = 1
+
+# Memtable (hot storage) setiap partisi. Begitu salah satu batas tercapai, memtable ditukar dengan
+# yang kosong dan ditulis ke segment.log oleh thread flusher di latar belakang.
+MEMTABLE_MAX_ENTRIES = 5
+MEMTABLE_MAX_BYTES = 1024 * 1024
+# Penulis ditahan (backpressure) jika sudah sebanyak ini memtable yang menunggu di-flush.
+MAX_PENDING_FLUSHES = 4
+
+# Segmen log: segment.log ditutup menjadi segment_<seq>.log begitu ukurannya melewati batas ini.
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+# Compaction di latar belakang menggabungkan segmen tertutup dan membuang record yang sudah ditimpa.
+COMPACTION_MIN_SEGMENTS = 2
+COMPACTION_INTERVAL = 10.0 # detik
+COMPACTION_MAX_BYTES_PER_SEC = 8 * 1024 * 1024
+
+# Durabilitas memtable lewat write-ahead log per partisi:
+#   'none'      : tanpa WAL (paling cepat, data di memtable hilang jika node mati sebelum di-flush)
+#   'batched'   : group commit, PUT yang datang selama fsync sebelumnya berjalan berbagi satu fsync
+#   'per-write' : satu fsync untuk setiap PUT
+DURABILITY_MODE = "batched"
+# Jeda tambahan (detik) sebelum committer menulis batch. 0 = batch hanya dibentuk oleh fsync yang sedang
+# berjalan; nilai kecil (mis. 0.001) memperbesar batch di disk yang fsync-nya lambat, dengan biaya latensi.
+GROUP_COMMIT_WINDOW = 0.0
+
+# Replikasi leader -> follower: satu stream (antrean + thread pengirim) per (partisi, follower).
+# Penulis di leader ditahan jika antrean penuh selama follower masih bisa dihubungi; jika follower tidak
+# bisa dihubungi dan antrean penuh, antreannya dibuang (dicatat sebagai 'dropped' di INSPECT) dan follower
+# disusulkan dengan resync (seluruh isi partisi dikirim ulang) begitu bisa dihubungi lagi.
+REPLICATION_QUEUE_MAX_ENTRIES = 10000
+REPLICATION_BATCH_MAX_ENTRIES = 256
+REPLICATION_RETRY_INTERVAL = 0.5 # detik
+# Saat SHUTDOWN, sisa antrean masih dikirim paling lama selama ini sebelum node berhenti.
+REPLICATION_DRAIN_TIMEOUT = 2.0 # detik
+
+# Routing baca di Coordinator.get:
+#   'leader'            : selalu membaca dari leader (read-your-writes)
+#   'round-robin'       : bergiliran antara leader dan follower
+#   'least-outstanding' : replika dengan request baca yang sedang berjalan paling sedikit
+READ_POLICY = "leader"
+# Batas ketertinggalan follower yang masih boleh dibaca (None = tanpa batas), berdasarkan lag yang
+# dilaporkan leader. Info lag di koordinator diperbarui paling lama setiap READ_LAG_REFRESH_INTERVAL detik.
+READ_MAX_STALENESS_MS = None
+READ_MAX_LAG_ENTRIES = None
+READ_LAG_REFRESH_INTERVAL = 0.5 # detik
+
+# Deteksi kegagalan dan failover: node saling mengirim heartbeat setiap HEARTBEAT_INTERVAL detik.
+# Node yang tidak terdengar lebih dari FAILURE_TIMEOUT detik dianggap mati, dan follower pertama yang
+# masih hidup dari setiap partisi yang dipimpinnya mempromosikan diri menjadi leader (epoch partisi naik).
+HEARTBEAT_INTERVAL = 0.5 # detik
+FAILURE_TIMEOUT = 2.0 # detik
+# Batas waktu membuka koneksi TCP ke node lain. Harus lebih kecil dari FAILURE_TIMEOUT, agar percobaan koneksi
+# ke node yang mati tidak menahan heartbeat dan request lebih lama dari batas deteksi kegagalan.
+CONNECT_TIMEOUT = 1.0 # detik
+
+# Routing kunci ke partisi memakai consistent hashing (hashring.py): setiap partisi menempati sejumlah
+# virtual node di ring, sehingga menambah partisi hanya memindahkan sebagian kecil kunci.
+VNODES_PER_PARTITION = 64
+# Migrasi online saat partisi baru ditambahkan: kunci dipindahkan per halaman, lalu perubahan yang terjadi
+# selama penyalinan disusulkan sampai tersisa sedikit, baru rentangnya dibekukan sebentar dan routing dipindah.
+MIGRATION_PAGE_ENTRIES = 500
+MIGRATION_CATCHUP_THRESHOLD = 50
+# Write ke rentang yang sedang dibekukan menunggu paling lama selama ini sebelum dijawab "dipindah".
+MIGRATION_FREEZE_TIMEOUT = 2.0 # detik
+
+# Format value dict di Serializer: 4 = encoding biner ringkas, 3 = teks JSON (pakai 3 selama masih ada node
+# versi lama di cluster yang belum bisa membaca skema 4). Semua versi tetap bisa di-decode.
+SERIALIZER_DICT_SCHEMA_VERSION = 4
+# Value yang hasil encode-nya minimal sebesar ini dikompresi dengan zlib, jika memang jadi lebih kecil (None = nonaktif).
+SERIALIZER_COMPRESS_MIN_BYTES = 1024
+
+# Storage engine untuk partisi baru (data yang sudah ada harus dibuka dengan engine yang sama):
+#   'log'     : segmen append-only dengan index setiap kunci di memori (GET cold = satu kali baca disk)
+#   'sstable' : memtable di-flush menjadi SSTable urut dengan sparse index dan bloom filter per tabel,
+#               sehingga memori tidak lagi bertambah sebanding jumlah kunci
+STORAGE_ENGINE = "log"
+# Ukuran blok data SSTable; sparse index menyimpan satu kunci per blok.
+SSTABLE_BLOCK_BYTES = 4096
+# Bit bloom filter per kunci (10 bit ~ 1% false positive).
+SSTABLE_BLOOM_BITS_PER_KEY = 10
+
+# SCAN/PREFIX mengembalikan kunci secara urut per halaman, dengan cursor untuk melanjutkan ke halaman berikutnya.
+# Halaman dibatasi di node (berapapun yang diminta klien), agar scan besar tidak pernah dibangun utuh di memori.
+SCAN_PAGE_ENTRIES = 100
+SCAN_MAX_PAGE_ENTRIES = 1000
+SCAN_MAX_PAGE_BYTES = 1024 * 1024
+
+# Value besar: PUT bertahap dikirim per potongan STREAM_CHUNK_BYTES (juga ukuran potongan yang dibaca klien saat
+# GET streaming), dan value cold storage minimal STREAM_MIN_BYTES dikirim node langsung dari file segmen dengan
+# sendfile. Upload bertahap yang tidak selesai dalam STREAM_UPLOAD_TIMEOUT detik (klien putus) dibuang.
+STREAM_CHUNK_BYTES = 256 * 1024
+STREAM_MIN_BYTES = 64 * 1024
+STREAM_UPLOAD_TIMEOUT = 30.0 # detik
+STREAM_MAX_VALUE_BYTES = 512 * 1024 * 1024
+
+# TTL per kunci: PUT dengan TTL menyimpan waktu kedaluwarsa absolut (ms sejak epoch, dihitung koordinator, sehingga
+# jam antar mesin diasumsikan sinkron). Kunci kedaluwarsa langsung terbaca NOT_FOUND, lalu dibuang dari memori oleh
+# sweep timer wheel (TTL_WHEEL_SLOTS slot selebar TTL_TICK_SECONDS) dan dari disk oleh compaction.
+TTL_TICK_SECONDS = 1.0
+TTL_WHEEL_SLOTS = 3600
+# Sweep memegang lock partisi paling lama untuk sejumlah kunci ini sekaligus.
+TTL_SWEEP_BATCH = 256
+
+# Metrik node (perintah STATS): batas bucket histogram latensi dalam milidetik, dipakai semua histogram.
+METRICS_LATENCY_BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
@@ -1,58 +1,380 @@
 # coordinator.py
 
-import hashlib
+import os
+import copy
 import json
-from network import send_request
+import heapq
+import time
+import threading
+import itertools
+import protocol
+from collections import deque
+from serializer import Serializer, StringStreamDecoder
+from network import send_binary_request, send_binary_requests, get_pipeline, open_binary_stream
+from membership import decode_topology, merge_topology
+from hashring import HashRing
+from keyindex import prefix_range
+from ttl import expires_at_for
+from config import (READ_POLICY, READ_MAX_STALENESS_MS, READ_MAX_LAG_ENTRIES, READ_LAG_REFRESH_INTERVAL, HEARTBEAT_INTERVAL,
+                    SCAN_PAGE_ENTRIES, STREAM_CHUNK_BYTES)
+
+READ_POLICIES = ("leader", "round-robin", "least-outstanding")
+
+def _rechunk(chunks, size):
+    """Potongan bytes dari iterable chunks, masing-masing tepat size byte (kecuali yang terakhir)."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size]); del buffer[:size]
+    if buffer: yield bytes(buffer)
 
 class Coordinator:
     """
     Bertindak sebagai koordinator partisi.
     Mengatur partisi-partisi dan memindahkan permintaan ke partisi yang sesuai.
     """
-    def __init__(self, cluster_topology):
-        self.cluster_topology = cluster_topology
-        self.num_partitions = len(cluster_topology['partitions'])
+    READ_LAG_REFRESH_INTERVAL = READ_LAG_REFRESH_INTERVAL
+    ROUTE_REFRESH_TIMEOUT = HEARTBEAT_INTERVAL * 2
+    STREAM_CHUNK_BYTES = STREAM_CHUNK_BYTES
+    # Jumlah potongan PUT bertahap yang boleh dikirim sebelum balasan potongan paling awal ditunggu
+    STREAM_IN_FLIGHT_CHUNKS = 8
+
+    def __init__(self, cluster_topology, read_policy=None, max_staleness_ms=READ_MAX_STALENESS_MS,
+                 max_lag_entries=READ_MAX_LAG_ENTRIES):
+        # Salinan route milik koordinator ini, diperbarui dari node setelah failover (lihat refresh_routes)
+        self.cluster_topology = copy.deepcopy(cluster_topology)
+        self.routes_lock = threading.Lock()
+        self.ring = HashRing(self.cluster_topology['partitions'])
+        self.serializer = Serializer()
+        self.read_policy = read_policy or READ_POLICY
+        if self.read_policy not in READ_POLICIES:
+            raise ValueError(f"Unknown read policy '{self.read_policy}', expected one of {READ_POLICIES}")
+        self.max_staleness_ms = max_staleness_ms
+        self.max_lag_entries = max_lag_entries
+        # Status routing baca: giliran round-robin per partisi dan jumlah request baca yang sedang berjalan per node
+        self.read_turns = {p_id: itertools.count() for p_id in cluster_topology['partitions']}
+        self.outstanding = {node_id: 0 for node_id in cluster_topology['nodes']}
+        self.routing_lock = threading.Lock()
+        # Lag follower yang dilaporkan leader: {(partition_id, follower_id): {"lag_entries", "lag_ms", "healthy"}}
+        self.replication_lag = {}
+        self.lag_fetched_at = 0.0
+        self.lag_lock = threading.Lock()
+
+    def _get_partition_for_key(self, key: str) -> int:
+        return self.ring.partition_for(key)
 
     def _get_leader_for_key(self, key: str):
-        hash_val = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16)
-        partition_id = hash_val % self.num_partitions
+        partition_id = self._get_partition_for_key(key)
         
         leader_id = self.cluster_topology['partitions'][partition_id]['leader']
         leader_info = self.cluster_topology['nodes'][leader_id]
         return partition_id, leader_info['host'], leader_info['port']
 
-    def put(self, key: str, value: any):
+    def refresh_routes(self) -> bool:
+        """
+        Mengambil topologi dari setiap node yang bisa dihubungi dan memakai info partisi dengan epoch tertinggi.
+        Mengembalikan True jika ada partisi yang berubah (failover, partisi baru, atau rentang migrasi yang diaktifkan).
+        """
+        with self.routes_lock:
+            partitions = self.cluster_topology['partitions']
+            changed = []
+            for info in list(self.cluster_topology['nodes'].values()):
+                status, body = send_binary_request(info['host'], info['port'], protocol.OP_TOPOLOGY, 0, '',
+                                                   timeout=self.ROUTE_REFRESH_TIMEOUT)
+                if status != protocol.STATUS_OK: continue
+                new_nodes, changed_partitions = merge_topology(self.cluster_topology, decode_topology(body))
+                with self.routing_lock:
+                    for node_id in new_nodes: self.outstanding.setdefault(node_id, 0)
+                changed += changed_partitions
+            for p_id in sorted(set(changed)):
+                self.read_turns.setdefault(p_id, itertools.count())
+                print(f"Coordinator: Partition-{p_id} is now led by Node-{partitions[p_id]['leader']} (epoch {partitions[p_id]['epoch']})")
+            if changed: self.ring = HashRing(partitions)
+            return bool(changed)
+
+    def add_partition(self, partition_id: int, leader: int, followers: list) -> str:
+        """
+        Menambah partisi baru ke cluster yang sedang berjalan. Leader-nya lalu menarik rentang kunci miliknya
+        dari partisi lain sambil tetap melayani traffic; routing berpindah per rentang begitu datanya menyusul.
+        """
+        info = self.cluster_topology['nodes'][leader]
+        roles = json.dumps({"leader": leader, "followers": followers}).encode('utf-8')
+        status, body = send_binary_request(info['host'], info['port'], protocol.OP_ADD_PARTITION, partition_id, '', roles)
+        return body.decode('utf-8')
+
+    def put(self, key: str, value: any, ttl: float = None):
+        """ttl: umur kunci dalam detik (None = tidak pernah kedaluwarsa); setelah itu kunci terbaca NOT_FOUND."""
+        value_bytes = self.serializer.encode_value(value, expires_at_for(ttl))
+        for attempt in range(2):
+            partition_id, host, port = self._get_leader_for_key(key)
+            print(f"Coordinator: Routing PUT key '{key}' to leader of Partition-{partition_id} at {host}:{port}")
+            status, body = send_binary_request(host, port, protocol.OP_PUT, partition_id, key, value_bytes)
+            # Leader mati atau sudah bukan leader (failover): perbarui route lalu coba sekali lagi
+            if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
+        return body.decode('utf-8')
+
+    def put_stream(self, key: str, chunks, size: int, ttl: float = None) -> str:
+        """
+        PUT value string besar dari iterable potongan bytes UTF-8 (mis. file yang dibaca per blok) yang totalnya tepat
+        size byte, tanpa membangun seluruh value di memori klien: dikirim sebagai request PUT_CHUNK sebesar
+        STREAM_CHUNK_BYTES lewat koneksi pipelined ke leader. Berbeda dengan put(), tidak diulang otomatis setelah
+        failover, karena potongannya sudah terpakai.
+        """
         partition_id, host, port = self._get_leader_for_key(key)
-        print(f"Coordinator: Routing PUT key '{key}' to leader of Partition-{partition_id} at {host}:{port}")
-        
-        value_str = json.dumps(value)
-        message = f"PUT {partition_id} {key} {value_str}"
-        return send_request(host, port, message)
+        print(f"Coordinator: Streaming PUT key '{key}' ({size} bytes) to leader of Partition-{partition_id} at {host}:{port}")
+        header = Serializer.string_header(size, expires_at_for(ttl))
+        total = len(header) + size
+        upload_id = int.from_bytes(os.urandom(8), 'big')
+        in_flight = deque()
+        message = None
+        def collect(future):
+            status, body = future.result()
+            text = body.decode('utf-8')
+            # Balasan potongan yang melengkapi value adalah balasan PUT-nya (tidak selalu potongan terakhir)
+            if status == protocol.STATUS_ERROR or text != "SUCCESS: Chunk received.": return text
+            return None
+        try:
+            connection = get_pipeline(host, port)
+            offset = 0
+            for piece in _rechunk(itertools.chain([header], chunks), self.STREAM_CHUNK_BYTES):
+                if offset + len(piece) > total: raise ValueError(f"Chunks for '{key}' are longer than {size} bytes")
+                value = protocol.PUT_CHUNK_HEADER.pack(upload_id, offset, total) + piece
+                in_flight.append(connection.submit(protocol.OP_PUT_CHUNK, partition_id, key, value))
+                offset += len(piece)
+                if len(in_flight) > self.STREAM_IN_FLIGHT_CHUNKS:
+                    message = collect(in_flight.popleft()) or message
+                    if message and message.startswith(("ERROR", "SERVER_ERROR")): return message
+            if offset != total: raise ValueError(f"Chunks for '{key}' ended after {offset - len(header)} of {size} bytes")
+            while in_flight: message = collect(in_flight.popleft()) or message
+        except OSError as e:
+            return f"Error: {e}"
+        return message
+
+    def delete(self, key: str):
+        """Menghapus kunci lewat leader partisinya; menghapus kunci yang tidak ada tetap berhasil."""
+        for attempt in range(2):
+            partition_id, host, port = self._get_leader_for_key(key)
+            print(f"Coordinator: Routing DELETE key '{key}' to leader of Partition-{partition_id} at {host}:{port}")
+            status, body = send_binary_request(host, port, protocol.OP_DELETE, partition_id, key)
+            if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
+        return body.decode('utf-8')
 
     def get(self, key: str) -> any:
-        partition_id, host, port = self._get_leader_for_key(key)
-        print(f"Coordinator: Routing GET key '{key}' to leader of Partition-{partition_id} at {host}:{port}")
-        
-        message = f"GET {partition_id} {key}"
-        response = send_request(host, port, message)
+        for attempt in range(2):
+            partition_id = self._get_partition_for_key(key)
+            leader_id = self.cluster_topology['partitions'][partition_id]['leader']
+            node_id = self._choose_read_replica(partition_id)
+            role = "leader" if node_id == leader_id else "follower"
+            info = self.cluster_topology['nodes'][node_id]
+            print(f"Coordinator: Routing GET key '{key}' to {role} of Partition-{partition_id} at {info['host']}:{info['port']}")
+            
+            status, body = self._send_read(node_id, partition_id, key)
+            if status == protocol.STATUS_ERROR and node_id != leader_id:
+                # Follower tidak bisa dihubungi: baca ulang dari leader
+                status, body = self._send_read(leader_id, partition_id, key)
+            if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
         
-        # Cek jika respons adalah error dari network.py sebelum di-parse
-        if response is None or response.startswith("Error:"):
-            return response # Kembalikan pesan error apa adanya
+        # Kembalikan pesan error (mis. dari network.py) apa adanya
+        if status == protocol.STATUS_ERROR:
+            return body.decode('utf-8')
 
-        if response != "NOT_FOUND":
-            return json.loads(response)
+        if status == protocol.STATUS_OK:
+            return self.serializer.decode_to_value(body)
             
         return None
     
+    def get_stream(self, key: str, chunk_size: int = STREAM_CHUNK_BYTES):
+        """
+        Membaca value string besar per potongan: mengembalikan iterator bytes UTF-8 isi value, dibaca dari socket
+        selama datanya tiba sehingga value tidak pernah utuh di memori klien (node mengirim value cold storage yang
+        besar langsung dari file segmennya dengan sendfile). KeyError jika kunci tidak ada, RuntimeError jika request
+        gagal, dan TypeError saat iterasi jika value-nya bukan string.
+        """
+        for attempt in range(2):
+            partition_id = self._get_partition_for_key(key)
+            leader_id = self.cluster_topology['partitions'][partition_id]['leader']
+            node_id = self._choose_read_replica(partition_id)
+            info = self.cluster_topology['nodes'][node_id]
+            print(f"Coordinator: Streaming GET key '{key}' from Partition-{partition_id} at {info['host']}:{info['port']}")
+            status, body = self._open_read_stream(node_id, partition_id, key)
+            if status == protocol.STATUS_ERROR and node_id != leader_id:
+                status, body = self._open_read_stream(leader_id, partition_id, key)
+            if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
+        if status == protocol.STATUS_NOT_FOUND: raise KeyError(key)
+        if status == protocol.STATUS_ERROR: raise RuntimeError(f"GET of '{key}' failed: {body.decode('utf-8')}")
+        return self._iter_stream(body, chunk_size)
+
+    def _open_read_stream(self, node_id, partition_id, key):
+        info = self.cluster_topology['nodes'][node_id]
+        return open_binary_stream(info['host'], info['port'], protocol.OP_GET, partition_id, key)
+
+    @staticmethod
+    def _iter_stream(stream, chunk_size):
+        decoder = StringStreamDecoder()
+        try:
+            for chunk in stream.iter_chunks(chunk_size):
+                data = decoder.feed(chunk)
+                if data: yield data
+            tail = decoder.finish()
+            if tail: yield tail
+        finally:
+            # Iterasi yang dihentikan di tengah jalan menutup koneksinya (sisa value masih di socket)
+            stream.close()
+
+    def _send_read(self, node_id, partition_id, key):
+        info = self.cluster_topology['nodes'][node_id]
+        with self.routing_lock:
+            self.outstanding[node_id] += 1
+        try:
+            return send_binary_request(info['host'], info['port'], protocol.OP_GET, partition_id, key)
+        finally:
+            with self.routing_lock:
+                self.outstanding[node_id] -= 1
+
+    def _choose_read_replica(self, partition_id) -> int:
+        """Memilih node untuk membaca partisi sesuai read_policy, hanya dari follower yang lag-nya masih dalam batas."""
+        roles = self.cluster_topology['partitions'][partition_id]
+        if self.read_policy == "leader" or not roles['followers']: return roles['leader']
+        candidates = [roles['leader']] + [f_id for f_id in roles['followers'] if self._is_fresh_enough(partition_id, f_id)]
+        turn = next(self.read_turns[partition_id]) % len(candidates)
+        if self.read_policy == "round-robin":
+            return candidates[turn]
+        # least-outstanding: kandidat diputar sesuai giliran, sehingga saat jumlahnya sama beban tetap tersebar
+        rotated = candidates[turn:] + candidates[:turn]
+        with self.routing_lock:
+            return min(rotated, key=self.outstanding.__getitem__)
+
+    def _is_fresh_enough(self, partition_id, follower_id) -> bool:
+        if self.max_staleness_ms is None and self.max_lag_entries is None: return True
+        self._refresh_replication_lag()
+        lag = self.replication_lag.get((partition_id, follower_id))
+        # Lag yang tidak diketahui (mis. leader tidak membalas) dianggap terlalu tertinggal
+        if lag is None or not lag['healthy']: return False
+        if self.max_staleness_ms is not None and lag['lag_ms'] > self.max_staleness_ms: return False
+        if self.max_lag_entries is not None and lag['lag_entries'] > self.max_lag_entries: return False
+        return True
+
+    def _refresh_replication_lag(self):
+        """Mengambil lag follower dari setiap leader, paling sering sekali per READ_LAG_REFRESH_INTERVAL."""
+        if time.monotonic() - self.lag_fetched_at < self.READ_LAG_REFRESH_INTERVAL: return
+        # Hanya satu thread yang memperbarui; thread lain memakai info lag yang ada
+        if not self.lag_lock.acquire(blocking=False): return
+        try:
+            requests = []
+            for node_id in sorted({roles['leader'] for roles in list(self.cluster_topology['partitions'].values())}):
+                info = self.cluster_topology['nodes'][node_id]
+                requests.append((info['host'], info['port'], protocol.OP_REPLICATION_LAG, 0, '', b''))
+            lag = {}
+            for status, body in send_binary_requests(requests):
+                if status != protocol.STATUS_OK: continue
+                for p_id, followers in json.loads(body).items():
+                    for f_id, stats in followers.items(): lag[(int(p_id), int(f_id))] = stats
+            self.replication_lag = lag
+            self.lag_fetched_at = time.monotonic()
+        finally:
+            self.lag_lock.release()
+
     def status(self, key: str):
         """Me-routing permintaan STATUS ke leader yang sesuai."""
-        p_id, host, port = self._get_leader_for_key(key)
-        message = f"STATUS {p_id} {key}"
-        return send_request(host, port, message)
+        for attempt in range(2):
+            p_id, host, port = self._get_leader_for_key(key)
+            status, body = send_binary_request(host, port, protocol.OP_STATUS, p_id, key)
+            if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
+        return body.decode('utf-8')
     
     def hex(self, key: str):
         """Me-routing permintaan HEX ke leader yang sesuai."""
-        p_id, host, port = self._get_leader_for_key(key)
-        message = f"HEX {p_id} {key}"
-        return send_request(host, port, message)
\ No newline at end of file
+        for attempt in range(2):
+            p_id, host, port = self._get_leader_for_key(key)
+            status, body = send_binary_request(host, port, protocol.OP_HEX, p_id, key)
+            if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
+        if status == protocol.STATUS_OK:
+            return body.hex()
+        return body.decode('utf-8') if status == protocol.STATUS_ERROR else "NOT_FOUND"
+
+    def _group_by_leader(self, keys):
+        """Mengelompokkan kunci per node leader: {(host, port): [(partition_id, key), ...]}."""
+        groups = {}
+        for key in keys:
+            partition_id, host, port = self._get_leader_for_key(key)
+            groups.setdefault((host, port), []).append((partition_id, key))
+        return groups
+
+    def _send_batches(self, opcode, groups, value_for_key):
+        """Mengirim satu request batch per node secara paralel, mengembalikan {key: (status, body)}."""
+        requests = []
+        for (host, port), entries in groups.items():
+            print(f"Coordinator: Routing {len(entries)} keys to node at {host}:{port}")
+            batch = protocol.encode_batch((p_id, key, value_for_key(key)) for p_id, key in entries)
+            requests.append((host, port, opcode, 0, '', batch))
+
+        results = {}
+        for entries, (status, body) in zip(groups.values(), send_binary_requests(requests)):
+            if status == protocol.STATUS_OK:
+                per_key = protocol.decode_batch_results(body)
+            else:
+                # Seluruh batch ke node ini gagal (mis. node mati): setiap kunci mendapat error yang sama
+                per_key = [(status, body)] * len(entries)
+            for (_, key), result in zip(entries, per_key):
+                results[key] = result
+        return results
+
+    def _send_batches_to_leaders(self, opcode, keys, value_for_key):
+        """_send_batches ke leader setiap kunci; kunci yang gagal dikirim ulang sekali jika route berubah (failover)."""
+        results = self._send_batches(opcode, self._group_by_leader(keys), value_for_key)
+        failed = [key for key, (status, _) in results.items() if status == protocol.STATUS_ERROR]
+        if failed and self.refresh_routes():
+            results.update(self._send_batches(opcode, self._group_by_leader(failed), value_for_key))
+        return results
+
+    def mget(self, keys) -> dict:
+        """Mengambil banyak kunci sekaligus: satu request MGET per node leader, dikirim paralel."""
+        results = self._send_batches_to_leaders(protocol.OP_MGET, keys, lambda key: b'')
+        values = {}
+        for key, (status, body) in results.items():
+            if status == protocol.STATUS_OK: values[key] = self.serializer.decode_to_value(body)
+            elif status == protocol.STATUS_ERROR: values[key] = body.decode('utf-8')
+            else: values[key] = None
+        return values
+
+    def mput(self, mapping: dict, ttl: float = None) -> dict:
+        """Menyimpan banyak pasangan key-value sekaligus: satu request MPUT per node leader, dikirim paralel."""
+        expires_at = expires_at_for(ttl)
+        encoded = {key: self.serializer.encode_value(value, expires_at) for key, value in mapping.items()}
+        results = self._send_batches_to_leaders(protocol.OP_MPUT, mapping, encoded.__getitem__)
+        return {key: body.decode('utf-8') for key, (_, body) in results.items()}
+
+    def mdelete(self, keys) -> dict:
+        """Menghapus banyak kunci sekaligus: satu request MDELETE per node leader, dikirim paralel."""
+        results = self._send_batches_to_leaders(protocol.OP_MDELETE, keys, lambda key: b'')
+        return {key: body.decode('utf-8') for key, (_, body) in results.items()}
+
+    def scan(self, start: str = None, end: str = None, prefix: str = None, page_size: int = SCAN_PAGE_ENTRIES):
+        """
+        Generator (key, value) untuk semua kunci dengan start <= kunci < end (atau berawalan prefix), urut menurut
+        kunci di seluruh cluster. Setiap partisi dibaca per halaman dari leader-nya dan hasilnya di-merge, sehingga
+        yang ada di memori hanya satu halaman per partisi. Scan bukan snapshot: write selama scan mungkin terlihat.
+        """
+        if prefix is not None: start, end = prefix_range(prefix)
+        pages = [self._scan_partition(p_id, start or '', end, page_size) for p_id in sorted(self.cluster_topology['partitions'])]
+        for key, value_bytes in heapq.merge(*pages):
+            yield key, self.serializer.decode_to_value(value_bytes)
+
+    def _scan_partition(self, partition_id, start, end, page_size):
+        """Kunci satu partisi secara urut, halaman demi halaman mengikuti cursor dari node."""
+        cursor = None
+        while True:
+            request = json.dumps({"start": start, "end": end, "cursor": cursor, "limit": page_size}).encode('utf-8')
+            for attempt in range(2):
+                leader_id = self.cluster_topology['partitions'][partition_id]['leader']
+                info = self.cluster_topology['nodes'][leader_id]
+                status, body = send_binary_request(info['host'], info['port'], protocol.OP_SCAN, partition_id, '', request)
+                if status != protocol.STATUS_ERROR or attempt or not self.refresh_routes(): break
+            if status != protocol.STATUS_OK: raise RuntimeError(f"SCAN of Partition-{partition_id} failed: {body.decode('utf-8')}")
+            entries, cursor = protocol.decode_scan_page(body)
+            for key, value_bytes in entries:
+                # Sumber menghapus salinan kunci yang sudah pindah begitu migrasi rentangnya selesai; sampai saat itu
+                # (atau jika penghapusannya terputus) salinan tersebut tidak ikut dikembalikan
+                if self.ring.partition_for(key) == partition_id: yield key, value_bytes
+            if cursor is None: return
@@ -0,0 +1,216 @@
+# frontend.py
+import os
+import json
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import protocol
+from network import send_frame, recv_frame
+from membership import decode_topology, encode_topology, merge_topology
+from metrics import MetricsRegistry, format_prometheus, merge_prometheus
+
+# Mode node multi-proses (NODE_WORKERS > 1): satu proses front-end menerima semua koneksi di port node, dan setiap
+# partisi dimiliki tepat satu proses worker (worker_for_partition). Worker adalah Node biasa yang hanya membuka
+# partisinya sendiri dan melayani frame yang sama lewat Unix socket, sehingga parsing, serialisasi, dan operasi
+# partisi tersebar ke beberapa interpreter (beberapa GIL). Front-end hanya meneruskan frame tanpa men-decode value.
+
+def worker_for_partition(partition_id: int, num_workers: int) -> int:
+    """Index worker pemilik partisi; tetap sama untuk partisi yang ditambahkan setelah node berjalan."""
+    return partition_id % num_workers
+
+# Request tingkat node yang dijawab oleh semua worker, lalu balasannya digabung
+_BROADCAST_OPCODES = {protocol.OP_HEARTBEAT, protocol.OP_TOPOLOGY, protocol.OP_REPLICATION_LAG}
+_BATCH_OPCODES = {protocol.OP_MGET, protocol.OP_MPUT, protocol.OP_MREPLICATE, protocol.OP_MDELETE}
+
+class WorkerChannel:
+    """Koneksi Unix socket persisten dari front-end ke satu worker. Koneksi idle dipakai ulang, satu request per koneksi."""
+    CONNECT_TIMEOUT = 5.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.CONNECT_TIMEOUT)
+            sock.connect(self.path)
+            sock.settimeout(None)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, payload: bytes) -> bytes:
+        """Mengirim satu frame ke worker dan mengembalikan frame balasannya."""
+        with self.lock:
+            sock = self.idle.pop() if self.idle else None
+        if sock is None: sock = self._connect()
+        try:
+            send_frame(sock, payload)
+            response = recv_frame(sock)
+        except OSError:
+            sock.close()
+            raise
+        if response is None:
+            sock.close()
+            raise ConnectionError(f"Worker at {self.path} closed the connection.")
+        with self.lock:
+            self.idle.append(sock)
+        return response
+
+    def close(self):
+        with self.lock:
+            for sock in self.idle: sock.close()
+            self.idle = []
+
+class NodeFrontend:
+    """
+    Front-end node multi-proses. Antarmukanya sama dengan Node untuk NodeTCPHandler dan AsyncNodeServer
+    (dispatch_binary, dispatch_text, close, metrics), sehingga kedua mode server dipakai apa adanya.
+    Request diteruskan ke worker pemilik partisinya; MGET/MPUT/MREPLICATE/MDELETE dipecah per worker, dan
+    HEARTBEAT/TOPOLOGY/REPLICATION_LAG/STATS/INSPECT dikirim ke semua worker lalu balasannya digabung.
+    """
+    STARTUP_TIMEOUT = 60.0
+
+    def __init__(self, node_id, host, port, cluster_topology, num_workers: int, start_worker):
+        self.node_id = node_id; self.host = host; self.port = port
+        self.num_workers = num_workers
+        # Latensi per perintah dari sisi front-end (termasuk IPC ke worker); metrik worker diberi label worker=<index>
+        self.metrics = MetricsRegistry(worker="frontend")
+        self.socket_dir = tempfile.mkdtemp(prefix=f"kv-node{node_id}-")
+        self.processes = []
+        self.channels = []
+        for index in range(num_workers):
+            path = os.path.join(self.socket_dir, f"worker_{index}.sock")
+            process = multiprocessing.Process(target=start_worker,
+                                              args=(node_id, host, port, cluster_topology, index, num_workers, path))
+            process.start()
+            self.processes.append(process)
+            self.channels.append(WorkerChannel(path))
+        # Untuk request yang dikirim ke beberapa worker sekaligus (broadcast dan batch)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self._wait_for_workers()
+        print(f"Node-{node_id}: {num_workers} worker processes ready")
+
+    def _wait_for_workers(self):
+        """Menunggu sampai setiap worker selesai memulihkan partisinya dan socket-nya bisa dihubungi."""
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        for process, channel in zip(self.processes, self.channels):
+            while True:
+                try:
+                    channel.idle.append(channel._connect())
+                    break
+                except OSError:
+                    if not process.is_alive(): raise RuntimeError(f"Worker process for Node-{self.node_id} exited during startup.")
+                    if time.monotonic() > deadline: raise RuntimeError(f"Worker process for Node-{self.node_id} did not start in time.")
+                    time.sleep(0.05)
+
+    def _observe_command(self, command, started, failed):
+        self.metrics.histogram("command_ms", command=command).observe((time.perf_counter() - started) * 1000)
+        if failed: self.metrics.counter("command_errors", command=command).inc()
+
+    def _broadcast(self, payload: bytes) -> list:
+        return list(self.executor.map(lambda channel: channel.request(payload), self.channels))
+
+    def dispatch_binary(self, payload):
+        started = time.perf_counter()
+        opcode, request_id, p_id = protocol.REQUEST_HEADER.unpack_from(payload)[:3]
+        try:
+            if opcode in _BROADCAST_OPCODES: response = self._dispatch_broadcast(opcode, request_id, payload)
+            elif opcode in _BATCH_OPCODES: response = self._dispatch_batch(payload)
+            # Pada HEARTBEAT field partition_id berisi id node, jadi routing per partisi hanya untuk opcode lain
+            else: response = self.channels[worker_for_partition(p_id, self.num_workers)].request(payload)
+        except Exception as e:
+            response = protocol.encode_response(protocol.STATUS_ERROR, request_id, f"SERVER_ERROR: {e}".encode('utf-8'))
+        self._observe_command(protocol.OPCODE_NAMES[opcode], started, response[0] == protocol.STATUS_ERROR)
+        return response
+
+    def _dispatch_broadcast(self, opcode, request_id, payload):
+        bodies = []
+        for response in self._broadcast(payload):
+            status, _, body = protocol.decode_response(response)
+            if status != protocol.STATUS_OK: return response
+            bodies.append(body)
+        if opcode == protocol.OP_REPLICATION_LAG:
+            lag = {}
+            for body in bodies: lag.update(json.loads(body))
+            merged = json.dumps(lag).encode('utf-8')
+        else:
+            # HEARTBEAT dan TOPOLOGY: topologi terbaru dari semua worker (epoch tertinggi per partisi)
+            topology = decode_topology(bodies[0])
+            for body in bodies[1:]: merge_topology(topology, decode_topology(body))
+            merged = encode_topology(topology)
+        return protocol.encode_response(protocol.STATUS_OK, request_id, merged)
+
+    def _dispatch_batch(self, payload):
+        opcode, request_id, _, _, batch_bytes = protocol.decode_request(payload)
+        by_worker = {}
+        for index, entry in enumerate(protocol.decode_batch(batch_bytes)):
+            by_worker.setdefault(worker_for_partition(entry[0], self.num_workers), []).append((index, entry))
+        if len(by_worker) == 1: return self.channels[next(iter(by_worker))].request(payload)
+        def send(item):
+            worker, entries = item
+            sub_payload = protocol.encode_request(opcode, request_id, 0, '', protocol.encode_batch(entry for _, entry in entries))
+            return entries, protocol.decode_response(self.channels[worker].request(sub_payload))
+        results = [None] * sum(len(entries) for entries in by_worker.values())
+        for entries, (status, _, body) in self.executor.map(send, by_worker.items()):
+            sub_results = protocol.decode_batch_results(body) if status == protocol.STATUS_OK else [(status, body)] * len(entries)
+            for (index, _), result in zip(entries, sub_results): results[index] = result
+        return protocol.encode_response(protocol.STATUS_OK, request_id, protocol.encode_batch_results(results))
+
+    def dispatch_text(self, data):
+        started = time.perf_counter()
+        parts = data.split(' ', 3); command = parts[0].upper()
+        try:
+            if command == 'STATS' and len(parts) <= 2: response = self._merge_stats(parts[1].lower() if len(parts) == 2 else 'json', data)
+            elif command == 'INSPECT': response = self._merge_inspect(data)
+            else:
+                # Perintah per partisi (PUT/GET/DELETE/STATUS/HEX/SCAN/PREFIX <p_id> ...); selebihnya dijawab worker 0
+                try:
+                    worker = worker_for_partition(int(parts[1]), self.num_workers)
+                except (IndexError, ValueError):
+                    worker = 0
+                response = self.channels[worker].request(data.encode('utf-8')).decode('utf-8')
+        except Exception as e:
+            response = f"SERVER_ERROR: {e}"
+        self._observe_command(command if response != "ERROR: Invalid command" else "INVALID", started,
+                              response.startswith(("ERROR", "SERVER_ERROR")))
+        return response
+
+    def _merge_stats(self, fmt, data):
+        responses = [response.decode('utf-8') for response in self._broadcast(data.encode('utf-8'))]
+        if fmt == 'prometheus' and not responses[0].startswith("ERROR"):
+            return merge_prometheus([format_prometheus([self.metrics])] + responses)
+        if fmt != 'json': return responses[0]
+        stats = {"node_id": self.node_id, "commands": self.metrics.snapshot(), "workers": {}, "partitions": {}, "replication": {}}
+        for index, worker_stats in enumerate(map(json.loads, responses)):
+            stats["workers"][f"worker_{index}"] = {"commands": worker_stats["commands"]}
+            stats["partitions"].update(worker_stats["partitions"])
+            stats["replication"].update(worker_stats["replication"])
+        return json.dumps(stats, indent=2)
+
+    def _merge_inspect(self, data):
+        summary = {}
+        for response in self._broadcast(data.encode('utf-8')):
+            for key, value in json.loads(response).items():
+                if isinstance(value, dict): summary.setdefault(key, {}).update(value)
+                else: summary[key] = value
+        return json.dumps(summary, indent=2)
+
+    def close(self):
+        """Menutup semua worker (masing-masing mem-flush partisinya) lalu menghapus socket-nya."""
+        for channel in self.channels:
+            try:
+                channel.request(b"SHUTDOWN")
+            except OSError:
+                pass
+            channel.close()
+        for process in self.processes: process.join(timeout=10)
+        self.executor.shutdown(wait=False)
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
@@ -0,0 +1,74 @@
+# hashring.py
+import os
+import json
+import bisect
+import hashlib
+from config import VNODES_PER_PARTITION
+
+def key_hash(key: str) -> int:
+    """Posisi kunci di ring: 64 bit pertama SHA-1."""
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big')
+
+def vnode_token(partition_id: int, vnode: int) -> int:
+    return key_hash(f"partition-{partition_id}#vnode-{vnode}")
+
+class HashRing:
+    """
+    Consistent hashing dengan virtual node. Setiap partisi menempati VNODES_PER_PARTITION titik (token) di ring,
+    dan sebuah kunci milik partisi dengan token pertama searah jarum jam dari hash kunci tersebut.
+    Menambah partisi hanya memindahkan kunci di rentang yang diambil alih token-token barunya.
+
+    Partisi yang sedang menerima migrasi mencantumkan `active_vnodes` di topologi: hanya token tersebut yang
+    dipakai untuk routing, sehingga rentang berpindah satu per satu begitu datanya sudah menyusul.
+    """
+    def __init__(self, partitions: dict, vnodes: int = VNODES_PER_PARTITION):
+        self.vnodes = vnodes
+        points = []
+        for p_id, roles in partitions.items():
+            active = roles.get('active_vnodes')
+            for vnode in (range(vnodes) if active is None else active):
+                points.append((vnode_token(p_id, vnode), p_id))
+        points.sort()
+        self.tokens = [token for token, _ in points]
+        self.owners = [p_id for _, p_id in points]
+
+    def partition_for_hash(self, hash_val: int) -> int:
+        index = bisect.bisect_left(self.tokens, hash_val)
+        return self.owners[index % len(self.owners)]
+
+    def partition_for(self, key: str) -> int:
+        return self.partition_for_hash(key_hash(key))
+
+def ring_with_partition(partitions: dict, partition_id: int, vnodes=None) -> HashRing:
+    """Ring setelah partition_id (atau sebagian vnode-nya saja) aktif penuh, dipakai untuk menentukan kunci yang berpindah."""
+    partitions = dict(partitions)
+    roles = dict(partitions[partition_id])
+    roles['active_vnodes'] = vnodes
+    partitions[partition_id] = roles
+    return HashRing(partitions)
+
+# Penanda di direktori data node bahwa kuncinya disimpan menurut hash ring. Data dari versi lama (partisi dipilih
+# dengan hash % jumlah partisi) tidak memiliki penanda ini: sebagian besar kuncinya berada di partisi yang berbeda
+# dari pilihan ring, sehingga tidak akan pernah ditemukan lagi.
+RING_LAYOUT_FILE = "ring_layout.json"
+
+def check_ring_layout(data_dir: str, vnodes: int = VNODES_PER_PARTITION):
+    """
+    Dipanggil saat node start. Direktori data baru ditandai; direktori berisi partisi tanpa penanda (routing modulo)
+    atau dengan jumlah vnode yang berbeda ditolak, karena kuncinya harus dipindahkan ulang lewat PUT ke cluster baru.
+    """
+    path = os.path.join(data_dir, RING_LAYOUT_FILE)
+    layout = {"routing": "hashring", "vnodes_per_partition": vnodes}
+    if os.path.exists(path):
+        with open(path) as f: existing = json.load(f)
+        if existing != layout:
+            raise RuntimeError(f"{data_dir} was written with ring layout {existing}, but this node uses {layout}.")
+        return
+    os.makedirs(data_dir, exist_ok=True)
+    if any(name.startswith("partition_") for name in os.listdir(data_dir)):
+        raise RuntimeError(f"{data_dir} holds data from modulo routing (hash % partitions), which the hash ring cannot "
+                           f"find. Re-import its keys through a coordinator into an empty data directory.")
+    # Worker-worker satu node bisa menulis penanda bersamaan; isinya sama, jadi cukup diganti secara atomik
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f: json.dump(layout, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,252 @@
+# keyindex.py
+import os
+import sys
+import json
+import heapq
+import bisect
+import struct
+import hashlib
+from array import array
+
+# Snapshot index ditulis saat partisi ditutup dengan normal, agar startup berikutnya tidak perlu membaca hint:
+#   [panjang header (4b)] [header JSON] [hash slot (8b x kapasitas)] [lokasi slot (8b x kapasitas)]
+#   [fingerprint slot (4b x kapasitas)]
+# Array ditulis dengan byte order mesin (dicatat di header), karena snapshot hanya dibaca ulang oleh node yang sama.
+# Snapshot dengan versi lain (mis. sebelum ada fingerprint) diabaikan, dan index dibangun dari hint.
+SNAPSHOT_NAME = "index.snapshot"
+SNAPSHOT_HEADER_LEN = struct.Struct('!I')
+SNAPSHOT_VERSION = 2
+
+# Nilai hash yang dicadangkan: slot kosong dan slot bekas kunci yang dihapus (probing harus melewatinya).
+# Hash kunci yang kebetulan bernilai 0 atau 1 digeser menjadi 2.
+_EMPTY = 0
+_DELETED = 1
+
+def key_hash(key: str):
+    """
+    (hash 64 bit, fingerprint 32 bit) kunci, sama di setiap proses (hash() bawaan Python diacak per proses, jadi
+    tidak bisa di-snapshot). Keduanya diambil dari satu digest, sehingga kunci dibedakan dengan 96 bit.
+    """
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=12).digest()
+    return max(2, int.from_bytes(digest[:8], 'big')), int.from_bytes(digest[8:], 'big')
+
+class CompactKeyIndex:
+    """
+    Index kunci -> lokasi record berbasis open addressing (linear probing) di atas array hash 64 bit kunci,
+    lokasinya, dan fingerprint 32 bit kunci. Kunci sendiri tidak disimpan di memori: dua kunci dianggap sama jika
+    hash dan fingerprint-nya sama, sehingga index tidak pernah membaca disk (juga saat hash bertabrakan).
+    Pembaca value tetap mencocokkan kunci di record yang ditunjuk. Pemakaiannya sama seperti dict untuk
+    get/in/[]=/del/update/len.
+    Penulis harus berbagi satu lock, tetapi get/in boleh dipanggil tanpa lock: pembaca memakai snapshot tabel
+    (self.table) yang ditukar utuh saat tabel membesar, dan slot baru diisi lokasi dan fingerprint sebelum hash-nya.
+    """
+    MAX_LOAD = 0.7
+    MIN_CAPACITY = 1024
+
+    def __init__(self, capacity: int = MIN_CAPACITY):
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.hashes = array('Q', bytes(8 * capacity))
+        self.locations = array('Q', bytes(8 * capacity))
+        self.fingerprints = array('I', bytes(4 * capacity))
+        self.count = 0
+        self.deleted = 0
+        self._publish()
+
+    def _publish(self):
+        # Satu atribut untuk semuanya, agar pembaca tanpa lock tidak mencampur array tabel baru dan tabel lama
+        self.table = (self.hashes, self.locations, self.fingerprints, self.mask)
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, h, fp):
+        """Slot milik kunci dengan (h, fp), atau slot kosong tempat kunci itu akan disisipkan."""
+        hashes, fingerprints, i = self.hashes, self.fingerprints, h & self.mask
+        while True:
+            slot_hash = hashes[i]
+            if slot_hash == _EMPTY or (slot_hash == h and fingerprints[i] == fp): return i
+            i = (i + 1) & self.mask
+
+    def get(self, key, default=None):
+        # Lokasi dan fingerprint dibaca di slot yang sama saat hash-nya cocok, sehingga aman walau penulis
+        # sedang mengubah tabel
+        hashes, locations, fingerprints, mask = self.table
+        h, fp = key_hash(key)
+        i = h & mask
+        while True:
+            slot_hash = hashes[i]
+            if slot_hash == _EMPTY: return default
+            if slot_hash == h:
+                location = locations[i]
+                if fingerprints[i] == fp: return location
+            i = (i + 1) & mask
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        location = self.get(key)
+        if location is None: raise KeyError(key)
+        return location
+
+    def __setitem__(self, key, location):
+        h, fp = key_hash(key)
+        hashes, locations, fingerprints, i = self.hashes, self.locations, self.fingerprints, h & self.mask
+        reusable = None
+        while True:
+            slot_hash = hashes[i]
+            if slot_hash == _EMPTY: break
+            if slot_hash == _DELETED:
+                if reusable is None: reusable = i
+            elif slot_hash == h and fingerprints[i] == fp:
+                locations[i] = location
+                return
+            i = (i + 1) & self.mask
+        if reusable is not None:
+            i = reusable; self.deleted -= 1
+        # Lokasi dan fingerprint lebih dulu: pembaca yang sudah melihat hash-nya pasti juga melihat keduanya
+        locations[i] = location; fingerprints[i] = fp; hashes[i] = h
+        self.count += 1
+        if self.count + self.deleted > self.capacity * self.MAX_LOAD: self._grow()
+
+    def __delitem__(self, key):
+        i = self._find(*key_hash(key))
+        if self.hashes[i] == _EMPTY: raise KeyError(key)
+        # Slot tidak dikosongkan, karena kunci lain mungkin berada di ujung rantai probing yang melewatinya
+        self.hashes[i] = _DELETED; self.locations[i] = 0
+        self.count -= 1; self.deleted += 1
+
+    def pop(self, key, default=None):
+        location = self.get(key)
+        try:
+            del self[key]
+        except KeyError:
+            return default
+        return location
+
+    def update(self, mapping):
+        for key, location in mapping.items(): self[key] = location
+
+    def _grow(self):
+        # Jika yang memenuhi tabel kebanyakan slot terhapus, cukup dibangun ulang dengan kapasitas yang sama
+        capacity = self.capacity * 2 if self.count > self.capacity * self.MAX_LOAD / 2 else self.capacity
+        hashes, locations, fingerprints = array('Q', bytes(8 * capacity)), array('Q', bytes(8 * capacity)), array('I', bytes(4 * capacity))
+        mask = capacity - 1
+        for h, location, fp in zip(self.hashes, self.locations, self.fingerprints):
+            if h == _EMPTY or h == _DELETED: continue
+            i = h & mask
+            while hashes[i] != _EMPTY: i = (i + 1) & mask
+            hashes[i] = h; locations[i] = location; fingerprints[i] = fp
+        # Tabel baru baru terlihat oleh pembaca setelah terisi penuh
+        self.capacity, self.mask, self.deleted = capacity, mask, 0
+        self.hashes, self.locations, self.fingerprints = hashes, locations, fingerprints
+        self._publish()
+
+    def values(self):
+        """Lokasi semua kunci (urutan slot)."""
+        return [location for h, location in zip(self.hashes, self.locations) if h != _EMPTY and h != _DELETED]
+
+    def memory_bytes(self) -> int:
+        return self.capacity * (self.hashes.itemsize + self.locations.itemsize + self.fingerprints.itemsize)
+
+    def save(self, path: str, header: dict):
+        """Menulis snapshot index (lewat file sementara). header berisi info segmen untuk validasi saat load."""
+        header = dict(header, version=SNAPSHOT_VERSION, capacity=self.capacity, count=self.count, deleted=self.deleted,
+                      byteorder=sys.byteorder)
+        header_bytes = json.dumps(header).encode('utf-8')
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER_LEN.pack(len(header_bytes))); f.write(header_bytes)
+            self.hashes.tofile(f); self.locations.tofile(f); self.fingerprints.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_snapshot_header(path: str):
+        """Header snapshot, atau None jika file tidak ada, rusak, atau versinya berbeda."""
+        try:
+            with open(path, 'rb') as f:
+                header_len, = SNAPSHOT_HEADER_LEN.unpack(f.read(SNAPSHOT_HEADER_LEN.size))
+                header = json.loads(f.read(header_len))
+        except (OSError, ValueError, struct.error):
+            return None
+        return header if header.get('version') == SNAPSHOT_VERSION else None
+
+    @classmethod
+    def load(cls, path: str):
+        """Memuat snapshot yang ditulis save(); array dibaca langsung dari file tanpa mengiterasi setiap kunci."""
+        index = cls(capacity=1)
+        with open(path, 'rb') as f:
+            header_len, = SNAPSHOT_HEADER_LEN.unpack(f.read(SNAPSHOT_HEADER_LEN.size))
+            header = json.loads(f.read(header_len))
+            if header.get('version') != SNAPSHOT_VERSION: raise ValueError(f"Unsupported index snapshot version in {path}")
+            index.capacity = header['capacity']; index.mask = index.capacity - 1
+            index.hashes = array('Q'); index.hashes.fromfile(f, index.capacity)
+            index.locations = array('Q'); index.locations.fromfile(f, index.capacity)
+            index.fingerprints = array('I'); index.fingerprints.fromfile(f, index.capacity)
+        index.count = header['count']; index.deleted = header.get('deleted', 0)
+        index._publish()
+        return index
+
+def prefix_range(prefix: str):
+    """Rentang [start, end) yang berisi tepat semua kunci berawalan prefix (end None = tanpa batas atas)."""
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+    if not stripped: return prefix, None
+    return prefix, stripped[:-1] + chr(ord(stripped[-1]) + 1)
+
+class SortedKeys:
+    """
+    Kunci terurut untuk SCAN: list utama yang sudah urut ditambah kunci baru yang belum digabung. Kunci baru
+    hanya diurutkan sendiri (kecil), dan digabung ke list utama begitu jumlahnya melewati seperdelapan list
+    utama, sehingga write tidak perlu menyisipkan ke tengah list besar satu per satu.
+    """
+    MIN_MERGE_KEYS = 4096
+
+    def __init__(self, keys):
+        self.keys = sorted(set(keys))
+        self.pending = set()
+        self.pending_sorted = []
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending)
+
+    def add(self, keys):
+        self.pending.update(keys)
+        if len(self.pending) > max(self.MIN_MERGE_KEYS, len(self.keys) // 8): self._merge()
+        else: self.pending_sorted = None
+
+    def discard(self, keys):
+        """Membuang kunci yang dihapus. Untuk banyak kunci sekaligus, list utama disaring sekali saja."""
+        keys = set(keys)
+        if not keys: return
+        self.pending -= keys; self.pending_sorted = None
+        if len(keys) > 16:
+            self.keys = [key for key in self.keys if key not in keys]
+            return
+        for key in keys:
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key: del self.keys[i]
+
+    def _merge(self):
+        merged = []
+        for key in heapq.merge(self.keys, sorted(self.pending)):
+            if not merged or merged[-1] != key: merged.append(key)
+        self.keys, self.pending, self.pending_sorted = merged, set(), []
+
+    def range(self, start: str, end, limit: int) -> list:
+        """Paling banyak limit kunci urut dengan start <= kunci < end (end None = tanpa batas atas)."""
+        if self.pending_sorted is None: self.pending_sorted = sorted(self.pending)
+        parts = []
+        for keys in (self.keys, self.pending_sorted):
+            i = bisect.bisect_left(keys, start)
+            parts.append(keys[i:i + limit])
+        result = []
+        for key in heapq.merge(*parts):
+            if end is not None and key >= end or len(result) == limit: break
+            if not result or result[-1] != key: result.append(key)
+        return result
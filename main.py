@@ -1,5 +1,5 @@
 # main.py
-import os, shutil, time, multiprocessing, json
+import os, re, shutil, time, multiprocessing, json
 from datetime import datetime
 from coordinator import Coordinator
 from config import CLUSTER_TOPOLOGY
@@ -32,10 +32,17 @@ def run_interactive_mode():
     print("==============================================================")
     print("Perintah: put <key> <value>             -> Khusus untuk string")
     print("Perintah: put <key> '{\"json\":\"value\"}'  -> Khusus untuk JSON")
+    print("Perintah: put <key> <value> ttl=<detik> -> Kunci kedaluwarsa setelah sekian detik")
     print("Perintah: get <key>")
+    print("Perintah: delete <key> [key ...]        -> Hapus satu atau beberapa kunci")
     print("Perintah: status <key>                  -> Cek lokasi data (hot/cold)")
     print("Perintah: inspect <node_id>             -> Lihat isi memori (hot) sebuah node")
+    print("Perintah: stats <node_id> [prometheus]   -> Metrik node (latensi, lock wait, flush, storage)")
     print("Perintah: hex <key>                     -> Lihat hasil encoding (hexdump)")
+    print("Perintah: scan <start> [end]            -> Daftar key-value urut dalam rentang [start, end)")
+    print("Perintah: prefix <prefix>               -> Daftar key-value urut yang berawalan prefix")
+    print("Perintah: putfile <key> <path>          -> Simpan isi file teks besar secara bertahap (streaming)")
+    print("Perintah: getfile <key> <path>          -> Tulis value besar ke file secara bertahap (streaming)")
     print("Perintah: exit atau quit")
     print("--------------------------------------------------------------")
 
@@ -49,6 +56,9 @@ def run_interactive_mode():
             elif command == "put":
                 if len(parts) != 3: print("Error: Format -> put <key> <value>"); continue
                 key, value_str = parts[1], parts[2]
+                ttl_match = re.search(r'\s+ttl=(\d+(?:\.\d+)?)$', value_str)
+                ttl = float(ttl_match.group(1)) if ttl_match else None
+                if ttl_match: value_str = value_str[:ttl_match.start()]
                 if (value_str.startswith("'") and value_str.endswith("'")) or \
                    (value_str.startswith('"') and value_str.endswith('"')):
                     value_str = value_str[1:-1]
@@ -60,7 +70,7 @@ def run_interactive_mode():
                             value['timestamp'] = int(dt_obj.timestamp())
                         except ValueError: print("Error: Format timestamp salah."); continue
                 except json.JSONDecodeError: value = value_str
-                response = coordinator.put(key, value); print(f"Server Response: {response}")
+                response = coordinator.put(key, value, ttl=ttl); print(f"Server Response: {response}")
             elif command == "get":
                 if len(parts) != 2: print("Error: Format -> get <key>"); continue
                 key = parts[1]
@@ -70,6 +80,12 @@ def run_interactive_mode():
                         response['timestamp'] = datetime.fromtimestamp(response['timestamp']).strftime("%Y-%m-%d %H:%M:%S")
                     except: pass
                 print(f"Value: {response}")
+            elif command == "delete":
+                keys = command_line.split()[1:]
+                if not keys: print("Error: Format -> delete <key> [key ...]"); continue
+                if len(keys) == 1: print(f"Server Response: {coordinator.delete(keys[0])}")
+                else:
+                    for key, response in coordinator.mdelete(keys).items(): print(f"  {key}: {response}")
             elif command == "status":
                 if len(parts) != 2:
                     print("Error: Format -> status <key>")
@@ -84,6 +100,38 @@ def run_interactive_mode():
                 key = parts[1]
                 response = coordinator.hex(key)
                 print(f"Hexdump: {response}")
+            elif command in ("scan", "prefix"):
+                if len(parts) < 2 or (command == "prefix" and len(parts) != 2):
+                    print("Error: Format -> scan <start> [end] atau prefix <prefix>")
+                    continue
+                if command == "scan": entries = coordinator.scan(start=parts[1], end=parts[2] if len(parts) == 3 else None)
+                else: entries = coordinator.scan(prefix=parts[1])
+                count = 0
+                for key, value in entries:
+                    print(f"  {key}: {value}"); count += 1
+                print(f"({count} kunci)")
+            elif command == "putfile":
+                if len(parts) != 3: print("Error: Format -> putfile <key> <path>"); continue
+                path = parts[2]
+                with open(path, 'rb') as f:
+                    response = coordinator.put_stream(parts[1], iter(lambda: f.read(1024 * 1024), b''), os.path.getsize(path))
+                print(f"Server Response: {response}")
+            elif command == "getfile":
+                if len(parts) != 3: print("Error: Format -> getfile <key> <path>"); continue
+                try:
+                    chunks = coordinator.get_stream(parts[1])
+                except KeyError:
+                    print("Value: None"); continue
+                written = 0
+                with open(parts[2], 'wb') as f:
+                    for chunk in chunks: f.write(chunk); written += len(chunk)
+                print(f"{written} byte ditulis ke {parts[2]}")
+            elif command == "stats":
+                if len(parts) not in (2, 3) or not parts[1].isdigit() or int(parts[1]) not in CLUSTER_TOPOLOGY['nodes']:
+                    print("Error: Format -> stats <node_id> [prometheus]")
+                    continue
+                node_info = CLUSTER_TOPOLOGY['nodes'][int(parts[1])]
+                print(send_request(node_info['host'], node_info['port'], " ".join(["STATS"] + parts[2:])))
             elif command == "inspect":
                 if len(parts) != 2:
                     print("Error: Format -> inspect <node_id>")
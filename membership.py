@@ -0,0 +1,181 @@
+# membership.py
+import os
+import json
+import threading
+import time
+import protocol
+from network import send_binary_request
+from config import HEARTBEAT_INTERVAL, FAILURE_TIMEOUT
+
+# Setiap partisi di topologi punya epoch yang naik setiap kali leader-nya diganti oleh failover.
+# Partisi di config.py tidak mencantumkan epoch, artinya epoch 0.
+def partition_epoch(roles: dict) -> int:
+    return roles.get('epoch', 0)
+
+def is_newer(incoming: dict, current: dict) -> bool:
+    """Info partisi incoming menggantikan current jika epoch-nya lebih tinggi; pada epoch sama, leader ber-id kecil menang."""
+    return (partition_epoch(incoming), -incoming['leader']) > (partition_epoch(current), -current['leader'])
+
+def encode_topology(topology: dict) -> bytes:
+    return json.dumps({"nodes": topology['nodes'], "partitions": topology['partitions']}).encode('utf-8')
+
+def decode_topology(body: bytes) -> dict:
+    # Kunci JSON selalu string; id partisi dan node dikembalikan ke int seperti di config.py
+    raw = json.loads(body)
+    partitions = {}
+    for p_id, roles in raw['partitions'].items():
+        roles = dict(roles, leader=int(roles['leader']), followers=[int(f) for f in roles['followers']])
+        roles['epoch'] = partition_epoch(roles)
+        partitions[int(p_id)] = roles
+    return {"nodes": {int(node_id): info for node_id, info in raw['nodes'].items()}, "partitions": partitions}
+
+# Topologi terakhir yang diketahui node disimpan di direktori datanya, agar batas kepemilikan rentang kunci
+# (active_vnodes hasil migrasi) tetap berlaku setelah restart, juga sebelum node lain bisa dihubungi.
+TOPOLOGY_FILE = "topology.json"
+
+def load_topology(data_dir: str):
+    """Topologi yang disimpan save_topology, atau None jika belum ada."""
+    path = os.path.join(data_dir, TOPOLOGY_FILE)
+    if not os.path.exists(path): return None
+    with open(path, 'rb') as f: return decode_topology(f.read())
+
+def save_topology(data_dir: str, topology: dict):
+    # Worker-worker satu node menyimpan ke file yang sama, jadi setiap proses memakai file sementaranya sendiri
+    path = os.path.join(data_dir, TOPOLOGY_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(encode_topology(topology))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def merge_topology(topology: dict, incoming: dict):
+    """
+    Menggabungkan topologi incoming ke topology (in-place): node dan partisi yang belum dikenal ditambahkan,
+    partisi yang sudah ada diganti jika info incoming lebih baru. Mengembalikan (node_baru, partisi_berubah).
+    """
+    new_nodes = [node_id for node_id in incoming['nodes'] if node_id not in topology['nodes']]
+    for node_id in new_nodes: topology['nodes'][node_id] = incoming['nodes'][node_id]
+    changed = []
+    for p_id, roles in incoming['partitions'].items():
+        current = topology['partitions'].get(p_id)
+        if current is None or is_newer(roles, current):
+            topology['partitions'][p_id] = roles
+            changed.append(p_id)
+    return new_nodes, changed
+
+class Membership:
+    """
+    Heartbeat antar node, deteksi kegagalan, dan failover leader untuk satu node.
+    Heartbeat membawa topologi partisi pengirim dan balasannya membawa topologi penerima, sehingga epoch
+    hasil failover menyebar ke seluruh cluster tanpa koordinator pusat.
+    Saat start semua partisi lokal berjalan sebagai follower sampai topologi dari node lain diterima: leader yang
+    di-restart mungkin sudah digantikan lewat failover, dan tidak boleh melayani write dengan epoch lamanya.
+    """
+    HEARTBEAT_INTERVAL = HEARTBEAT_INTERVAL
+    FAILURE_TIMEOUT = FAILURE_TIMEOUT
+
+    def __init__(self, node):
+        self.node = node
+        self.node_id = node.node_id
+        # Node lain dianggap hidup sejak start, agar tidak langsung dinyatakan mati sebelum heartbeat pertama
+        now = time.monotonic()
+        self.last_seen = {peer: now for peer in node.cluster_topology['nodes'] if peer != self.node_id}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # Diset begitu topologi dari node lain pertama kali diterima (balasan heartbeat atau heartbeat masuk)
+        self.fetched = threading.Event()
+        self.synced = False
+        self.peer_threads = {}
+        self.heartbeater = threading.Thread(target=self._heartbeat_loop)
+        self.heartbeater.daemon = True; self.heartbeater.start()
+
+    def is_alive(self, node_id) -> bool:
+        if node_id == self.node_id: return True
+        return time.monotonic() - self.last_seen[node_id] <= self.FAILURE_TIMEOUT
+
+    def handle_heartbeat(self, sender_id, body) -> bytes:
+        """Mencatat heartbeat dari node lain, menggabungkan topologinya, lalu membalas dengan topologi node ini."""
+        self.merge(decode_topology(body))
+        with self.lock:
+            self.last_seen[sender_id] = time.monotonic()
+        self.fetched.set()
+        return self.topology_bytes()
+
+    def topology_bytes(self) -> bytes:
+        with self.lock:
+            return encode_topology(self.node.cluster_topology)
+
+    def merge(self, topology: dict):
+        """Mengambil node baru dan info partisi yang lebih baru, lalu menyesuaikan role partisi lokal."""
+        with self.lock:
+            new_nodes, changed = merge_topology(self.node.cluster_topology, topology)
+            now = time.monotonic()
+            for node_id in new_nodes:
+                if node_id != self.node_id: self.last_seen[node_id] = now
+            if new_nodes or changed: save_topology(self.node.data_dir, self.node.cluster_topology)
+        if changed: self.node.apply_partition_roles(changed)
+
+    def update_partition(self, p_id, roles):
+        """Mengganti info satu partisi dari node ini sendiri (mis. partisi baru atau rentang migrasi yang diaktifkan)."""
+        with self.lock:
+            self.node.cluster_topology['partitions'][p_id] = roles
+            save_topology(self.node.data_dir, self.node.cluster_topology)
+        self.node.apply_partition_roles([p_id])
+
+    def _heartbeat_loop(self):
+        deadline = time.monotonic() + self.FAILURE_TIMEOUT
+        while not self.stopped.is_set():
+            # Satu thread heartbeat per node lain, agar node yang lambat atau mati tidak menunda heartbeat ke node lainnya
+            for peer in list(self.last_seen):
+                if peer in self.peer_threads: continue
+                thread = self.peer_threads[peer] = threading.Thread(target=self._peer_loop, args=(peer,))
+                thread.daemon = True; thread.start()
+            if not self.synced:
+                # Tanpa balasan dari node lain dalam FAILURE_TIMEOUT (mis. seluruh cluster start bersamaan),
+                # topologi milik node ini yang dipakai
+                remaining = deadline - time.monotonic()
+                if self.last_seen and remaining > 0 and not self.fetched.wait(min(remaining, self.HEARTBEAT_INTERVAL)): continue
+                self.synced = True
+                self.node.apply_partition_roles(list(self.node.replicas))
+                continue
+            self._detect_failures()
+            self.stopped.wait(self.HEARTBEAT_INTERVAL)
+
+    def _peer_loop(self, peer):
+        while not self.stopped.is_set():
+            info = self.node.cluster_topology['nodes'][peer]
+            status, body = send_binary_request(info['host'], info['port'], protocol.OP_HEARTBEAT, self.node_id, '',
+                                               self.topology_bytes(), timeout=self.HEARTBEAT_INTERVAL)
+            if status == protocol.STATUS_OK:
+                with self.lock:
+                    self.last_seen[peer] = time.monotonic()
+                self.merge(decode_topology(body))
+                self.fetched.set()
+            self.stopped.wait(self.HEARTBEAT_INTERVAL)
+
+    def _detect_failures(self):
+        """Mempromosikan node ini menjadi leader untuk partisi yang leader-nya dianggap mati."""
+        promoted = []
+        with self.lock:
+            partitions = self.node.cluster_topology['partitions']
+            for p_id, roles in partitions.items():
+                leader = roles['leader']
+                if leader == self.node_id or self.node_id not in roles['followers'] or self.is_alive(leader): continue
+                # Hanya follower hidup pertama di daftar yang dipromosikan, agar tidak ada dua leader baru
+                alive = [f_id for f_id in roles['followers'] if self.is_alive(f_id)]
+                if alive[0] != self.node_id: continue
+                # Leader lama tetap dicatat sebagai follower, sehingga bisa menyusul begitu hidup kembali
+                partitions[p_id] = dict(roles, leader=self.node_id,
+                                        followers=[f_id for f_id in roles['followers'] if f_id != self.node_id] + [leader],
+                                        epoch=partition_epoch(roles) + 1)
+                promoted.append(p_id)
+                print(f"Node-{self.node_id}: Leader Node-{leader} of Partition-{p_id} is down, "
+                      f"promoting self (epoch {partitions[p_id]['epoch']})")
+            if promoted: save_topology(self.node.data_dir, self.node.cluster_topology)
+        if promoted: self.node.apply_partition_roles(promoted)
+
+    def stop(self):
+        self.stopped.set()
+        self.heartbeater.join()
+        for thread in list(self.peer_threads.values()): thread.join()
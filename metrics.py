@@ -0,0 +1,216 @@
+# metrics.py
+import bisect
+import threading
+import time
+from config import METRICS_LATENCY_BUCKETS_MS
+
+# Metrik node untuk perintah STATS. Semua metrik hidup di memori dan hanya berupa penjumlahan, sehingga
+# biaya pencatatannya kecil (satu lock tanpa antrean dan satu bisect per sampel) dan boleh selalu aktif.
+# Histogram memakai batas bucket tetap (ms) dari config, sama untuk semua histogram agar mudah dibandingkan.
+
+class Counter:
+    __slots__ = ('value', 'lock')
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock: self.value += amount
+
+class Gauge:
+    """Nilai saat ini (mis. ukuran segmen); diisi ulang oleh pemiliknya sesaat sebelum STATS dijawab."""
+    __slots__ = ('value',)
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+class Histogram:
+    """Histogram latensi (ms) dengan bucket tetap; persentil diperkirakan dari bucket-nya (interpolasi linear)."""
+    def __init__(self, bounds=METRICS_LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        # Satu slot per bucket, ditambah satu untuk sampel di atas batas terbesar (+Inf)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value_ms: float):
+        i = bisect.bisect_left(self.bounds, value_ms)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value_ms
+            if value_ms > self.max: self.max = value_ms
+
+    def time(self):
+        """Context manager yang mencatat lama blok with ke histogram ini."""
+        return _Timer(self)
+
+    def _quantile(self, q, counts, total, maximum):
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = min(self.bounds[i], maximum) if i < len(self.bounds) else maximum
+                return lower + (max(upper, lower) - lower) * (rank - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            counts, total, total_ms, maximum = list(self.counts), self.count, self.sum, self.max
+        buckets, cumulative = {}, 0
+        for bound, count in zip(self.bounds + ('+Inf',), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": total, "sum_ms": round(total_ms, 3), "max_ms": round(maximum, 3),
+                **{name: round(self._quantile(q, counts, total, maximum), 3)
+                   for name, q in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99))},
+                "buckets": buckets}
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self.started) * 1000)
+
+class TimedLock:
+    """
+    Pengganti threading.Lock yang mencatat lama menunggu lock ke sebuah histogram. Acquire pertama dicoba
+    tanpa blocking, jadi lock yang sedang bebas tidak diukur sama sekali: histogram hanya berisi acquire
+    yang benar-benar harus menunggu. Bisa dipakai sebagai lock untuk threading.Condition.
+    """
+    __slots__ = ('_lock', 'wait_histogram')
+    def __init__(self, wait_histogram: Histogram):
+        self._lock = threading.Lock()
+        self.wait_histogram = wait_histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False): return True
+        if not blocking: return False
+        started = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        self.wait_histogram.observe((time.perf_counter() - started) * 1000)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+class MetricsRegistry:
+    """
+    Kumpulan metrik milik satu komponen (node, partisi, atau stream replikasi). labels ditempelkan ke setiap
+    metrik saat diekspor ke Prometheus; metrik sendiri bisa punya label tambahan (mis. command="GET").
+    """
+    def __init__(self, **labels):
+        self.labels = {key: str(value) for key, value in labels.items()}
+        self.metrics = {} # (nama, ((label, nilai), ...)) -> Counter / Gauge / Histogram
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, labels):
+        key = (name, tuple(labels.items()))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(key, cls())
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get(Gauge, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(Histogram, name, labels)
+
+    def snapshot(self) -> dict:
+        """
+        Semua metrik untuk STATS (JSON): {nama: nilai} untuk counter dan gauge, {nama: snapshot} untuk histogram.
+        Metrik berlabel dikelompokkan per nilai labelnya, mis. {"command_ms": {"GET": {...}, "PUT": {...}}}.
+        """
+        result = {}
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda item: item[0])
+        for (name, labels), metric in items:
+            value = metric.snapshot() if isinstance(metric, Histogram) else metric.value
+            if labels: result.setdefault(name, {})[",".join(str(v) for _, v in labels)] = value
+            else: result[name] = value
+        return result
+
+    def collect(self):
+        """(nama, labels lengkap, metrik) untuk setiap metrik, dipakai format_prometheus."""
+        with self.lock:
+            items = list(self.metrics.items())
+        for (name, labels), metric in items:
+            yield name, dict(self.labels, **{key: str(value) for key, value in labels}), metric
+
+def _format_labels(labels, **extra) -> str:
+    labels = dict(labels, **extra)
+    if not labels: return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def format_prometheus(registries, prefix: str = "kv_") -> str:
+    """Metrik dari beberapa registry dalam format teks Prometheus (exposition format 0.0.4)."""
+    families = {}
+    for registry in registries:
+        for name, labels, metric in registry.collect():
+            families.setdefault(name, []).append((labels, metric))
+    lines = []
+    for name in sorted(families):
+        samples = families[name]
+        kind = samples[0][1]
+        if isinstance(kind, Counter):
+            full_name = f"{prefix}{name}_total"
+            lines.append(f"# TYPE {full_name} counter")
+            lines += [f"{full_name}{_format_labels(labels)} {metric.value}" for labels, metric in samples]
+        elif isinstance(kind, Gauge):
+            full_name = prefix + name
+            lines.append(f"# TYPE {full_name} gauge")
+            lines += [f"{full_name}{_format_labels(labels)} {metric.value}" for labels, metric in samples]
+        else:
+            full_name = prefix + name
+            lines.append(f"# TYPE {full_name} histogram")
+            for labels, metric in samples:
+                snapshot = metric.snapshot()
+                for bound, cumulative in snapshot["buckets"].items():
+                    lines.append(f"{full_name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {snapshot['sum_ms']}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {snapshot['count']}")
+    return "\n".join(lines) + "\n"
+
+def merge_prometheus(texts) -> str:
+    """
+    Menggabungkan beberapa keluaran format_prometheus (mis. dari proses worker yang sama-sama punya metrik
+    command_ms) menjadi satu: sampel metrik yang sama dikelompokkan di bawah satu baris # TYPE.
+    """
+    families = {}
+    for text in texts:
+        name = None
+        for line in text.splitlines():
+            if not line: continue
+            if line.startswith("# TYPE "):
+                name = line.split()[2]
+                families.setdefault(name, [line])
+            else:
+                families[name].append(line)
+    return "\n".join(line for name in sorted(families) for line in families[name]) + "\n"
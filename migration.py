@@ -0,0 +1,181 @@
+# migration.py
+import json
+import threading
+import time
+import protocol
+from network import send_binary_request
+from serializer import TOMBSTONE_BYTES
+from hashring import HashRing, ring_with_partition, vnode_token
+from config import MIGRATION_PAGE_ENTRIES, MIGRATION_CATCHUP_THRESHOLD
+
+# Migrasi rentang kunci dari partisi sumber ke partisi baru, sambil cluster tetap melayani request:
+#   copy    : sumber mengambil snapshot kunci yang pindah, lalu mengirimkannya per halaman (cursor)
+#   catchup : kunci yang ditulis selama penyalinan (dirty) dikirim ulang sampai tersisa sedikit
+#   freeze  : write ke rentang itu ditolak sebentar, sisa kunci dirty dikirim untuk terakhir kali
+#   done    : partisi baru mengaktifkan vnode-nya untuk rentang ini; sumber menerapkan routing barunya, melepas write
+#             yang tertahan, lalu menghapus salinan kunci yang sudah pindah
+PHASES = ("copy", "catchup", "freeze", "done")
+# Cursor 0 di balasan MIGRATE_PULL berarti tidak ada halaman lagi.
+
+class KeyRangeMovedError(Exception):
+    """Write ditolak karena rentang kuncinya sedang dipindahkan ke partisi lain."""
+    def __init__(self, target_partition_id):
+        super().__init__(f"Key range is moving to Partition-{target_partition_id}.")
+        self.target_partition_id = target_partition_id
+
+class MigrationSource:
+    """Status migrasi di leader partisi sumber: kunci yang pindah ke target, snapshot penyalinan, dan kunci dirty."""
+    def __init__(self, source_partition_id, target_partition_id, ring_after: HashRing):
+        self.source_partition_id = source_partition_id
+        self.target_partition_id = target_partition_id
+        self.ring_after = ring_after
+        self.snapshot = []
+        self.dirty = set()
+        self.frozen = False
+        self.done = threading.Event()
+
+    def moves(self, key) -> bool:
+        return self.ring_after.partition_for(key) == self.target_partition_id
+
+    def check_writes(self, keys):
+        """Dipanggil di bawah lock partisi sumber sebelum write diterapkan."""
+        moving = [key for key in keys if self.moves(key)]
+        if moving and self.frozen: raise KeyRangeMovedError(self.target_partition_id)
+        self.dirty.update(moving)
+
+def source_vnodes(partitions: dict, target_partition_id: int) -> dict:
+    """Vnode partisi target yang belum aktif, dikelompokkan per partisi yang saat ini memiliki rentangnya."""
+    current = HashRing(partitions)
+    active = set(partitions[target_partition_id].get('active_vnodes') or [])
+    groups = {}
+    for vnode in range(current.vnodes):
+        if vnode in active: continue
+        groups.setdefault(current.partition_for_hash(vnode_token(target_partition_id, vnode)), []).append(vnode)
+    return groups
+
+class Migrator:
+    """
+    Dijalankan di leader partisi baru: menarik rentang kunci dari setiap partisi sumber secara berurutan,
+    dan memindahkan routing rentang tersebut begitu datanya sudah menyusul.
+    """
+    PAGE_ENTRIES = MIGRATION_PAGE_ENTRIES
+    CATCHUP_THRESHOLD = MIGRATION_CATCHUP_THRESHOLD
+    MAX_CATCHUP_ROUNDS = 10
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, node, partition_id):
+        self.node = node
+        self.partition_id = partition_id
+        self.stats = {"state": "running", "ranges_done": 0, "keys_copied": 0, "keys_caught_up": 0, "errors": 0}
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True; self.thread.start()
+
+    def _run(self):
+        while True:
+            if self.node.cluster_topology['partitions'][self.partition_id]['leader'] != self.node.node_id:
+                # Leader baru partisi ini yang akan melanjutkan migrasinya
+                self.stats["state"] = "stopped"
+                return
+            groups = source_vnodes(self.node.cluster_topology['partitions'], self.partition_id)
+            if not groups: break
+            source_id, vnodes = next(iter(groups.items()))
+            try:
+                self._migrate_from(source_id, vnodes)
+                self.stats["ranges_done"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Node-{self.node.node_id}: Migration from Partition-{source_id} to Partition-{self.partition_id} "
+                      f"failed ({e}), retrying...")
+                time.sleep(self.RETRY_INTERVAL)
+        self.stats["state"] = "done"
+        print(f"Node-{self.node.node_id}: Partition-{self.partition_id} now owns all of its key ranges")
+
+    def _pull(self, source_id, phase, vnodes, cursor=0, target_roles=None):
+        roles = self.node.cluster_topology['partitions'][source_id]
+        info = self.node.cluster_topology['nodes'][roles['leader']]
+        request = json.dumps({"target": self.partition_id, "phase": phase, "vnodes": vnodes, "cursor": cursor,
+                              "limit": self.PAGE_ENTRIES, "target_roles": target_roles}).encode('utf-8')
+        status, body = send_binary_request(info['host'], info['port'], protocol.OP_MIGRATE_PULL, source_id, '', request)
+        if status != protocol.STATUS_OK: raise RuntimeError(body.decode('utf-8', errors='replace'))
+        next_cursor, = protocol.MIGRATION_CURSOR.unpack_from(body)
+        entries = protocol.decode_batch(body[protocol.MIGRATION_CURSOR.size:])
+        partition = self.node.replicas[self.partition_id]
+        if entries:
+            # TTL ikut dipindahkan bersama value (expires_at ada di value bytes)
+            partition.put_encoded_many([(key, value) for _, key, value in entries])
+        return next_cursor, len(entries)
+
+    def _migrate_from(self, source_id, vnodes):
+        started = time.perf_counter()
+        cursor, copied = 0, 0
+        while True:
+            cursor, count = self._pull(source_id, "copy", vnodes, cursor)
+            copied += count
+            if not cursor: break
+        self.stats["keys_copied"] += copied
+        for _ in range(self.MAX_CATCHUP_ROUNDS):
+            _, count = self._pull(source_id, "catchup", vnodes)
+            self.stats["keys_caught_up"] += count
+            if count < self.CATCHUP_THRESHOLD: break
+        _, count = self._pull(source_id, "freeze", vnodes)
+        self.stats["keys_caught_up"] += count
+        # Rentang ini sudah lengkap di partisi baru: aktifkan vnode-nya (epoch naik agar menyebar lewat heartbeat)
+        roles = dict(self.node.cluster_topology['partitions'][self.partition_id])
+        roles['active_vnodes'] = sorted(set(roles.get('active_vnodes') or []) | set(vnodes))
+        roles['epoch'] = roles.get('epoch', 0) + 1
+        self.node.membership.update_partition(self.partition_id, roles)
+        self._pull(source_id, "done", vnodes, target_roles=roles)
+        print(f"Node-{self.node.node_id}: Moved {len(vnodes)} vnode ranges ({copied} keys) from Partition-{source_id} "
+              f"to Partition-{self.partition_id} in {time.perf_counter() - started:.2f}s")
+
+def serve_pull(node, source_partition_id, request: dict) -> bytes:
+    """Sisi leader partisi sumber untuk satu MIGRATE_PULL. Mengembalikan body balasan."""
+    partition = node.replicas[source_partition_id]
+    target_id, phase = request['target'], request['phase']
+    if phase not in PHASES: raise ValueError(f"Unknown migration phase '{phase}'")
+    if target_id not in node.cluster_topology['partitions']:
+        # Partisi baru belum sampai ke node ini lewat heartbeat; Migrator akan mencoba lagi
+        raise RuntimeError(f"Partition-{target_id} is not known on this node yet.")
+    key_id = (source_partition_id, target_id)
+    if phase == "done":
+        # Vnode yang baru aktif diterapkan (dan disimpan) di node ini tanpa menunggu heartbeat: mulai sekarang write
+        # ke rentang itu ditolak menurut ring, juga setelah restart, sehingga status migrasinya bisa dibuang
+        if request.get('target_roles'): node.membership.merge({"nodes": {}, "partitions": {target_id: request['target_roles']}})
+        migration = node.migrations_out.pop(key_id, None)
+        if migration: migration.done.set()
+        # Salinan kunci yang sudah pindah dihapus per halaman (tombstone ikut direplikasi ke follower sumber);
+        # kunci sisa penghapusan yang terputus sebelumnya ikut terhapus karena pilihannya mengikuti ring
+        moved = [key for key in partition.all_keys() if node.ring.partition_for(key) != source_partition_id]
+        for start in range(0, len(moved), request['limit']):
+            partition.drop_moved_keys(moved[start:start + request['limit']])
+        return protocol.MIGRATION_CURSOR.pack(0)
+
+    restart = phase == "copy" and request['cursor'] == 0
+    with partition.lock:
+        migration = node.migrations_out.get(key_id)
+        if restart:
+            # Penyalinan (ulang) dimulai: pelacakan dirty aktif di bawah lock sebelum snapshot diambil, jadi write yang
+            # tidak terlihat di snapshot tetap tercatat dirty dan disusulkan
+            ring_after = ring_with_partition(node.cluster_topology['partitions'], target_id,
+                                             sorted(set(node.cluster_topology['partitions'][target_id].get('active_vnodes') or [])
+                                                    | set(request['vnodes'])))
+            migration = node.migrations_out[key_id] = MigrationSource(source_partition_id, target_id, ring_after)
+        if migration is None: raise RuntimeError("No migration in progress for this range.")
+        if phase != "copy":
+            if phase == "freeze": migration.frozen = True
+            keys, migration.dirty = sorted(migration.dirty), set()
+            next_cursor = 0
+    if phase == "copy":
+        # Kunci cold storage dibaca dari disk di luar lock partisi, agar write tidak tertahan selama snapshot diambil
+        if restart: migration.snapshot = sorted(key for key in partition.all_keys() if migration.moves(key))
+        keys = migration.snapshot[request['cursor']:request['cursor'] + request['limit']]
+        next_cursor = request['cursor'] + len(keys)
+        if next_cursor >= len(migration.snapshot): next_cursor = 0
+    values = partition.get_raw_many(keys)
+    if phase == "copy":
+        batch = protocol.encode_batch((target_id, key, value) for key, value in zip(keys, values) if value is not None)
+    else:
+        # Kunci dirty yang sudah tidak ada (DELETE, TTL) dikirim sebagai tombstone agar salinannya di target ikut hilang
+        batch = protocol.encode_batch((target_id, key, value if value is not None else TOMBSTONE_BYTES)
+                                      for key, value in zip(keys, values))
+    return protocol.MIGRATION_CURSOR.pack(next_cursor) + batch
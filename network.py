@@ -1,15 +1,393 @@
 # network.py
+import os
 import socket
+import struct
+import select
+import threading
+import time
+import itertools
+from collections import deque
+from concurrent.futures import Future
+import protocol
+from config import CONNECT_TIMEOUT
 
-def send_request(host, port, message):
-    """Fungsi klien untuk mengirim permintaan ke server."""
+# Setiap pesan dibungkus frame: [panjang payload (4b)] [payload]
+FRAME_HEADER = struct.Struct('!I')
+
+def recv_exact(sock, n):
+    """Membaca tepat n byte dari socket. Mengembalikan None jika koneksi ditutup."""
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk: return None
+        buf += chunk
+    return bytes(buf)
+
+def send_frame(sock, payload: bytes):
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+def recv_frame(sock):
+    header = recv_exact(sock, FRAME_HEADER.size)
+    if header is None: return None
+    length, = FRAME_HEADER.unpack(header)
+    return recv_exact(sock, length) if length else b''
+
+def send_file_frame(sock, region):
+    """Mengirim satu frame [region.head] [isi region]; isinya dikirim dengan sendfile (os.sendfile) lalu file-nya ditutup."""
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((host, port))
-            s.sendall(message.encode('utf-8'))
-            response = s.recv(1024)
-            return response.decode('utf-8')
-    except ConnectionRefusedError:
-        return f"Error: Connection refused from {host}:{port}. Node might be down."
-    except Exception as e:
-        return f"Error: {e}"
\ No newline at end of file
+        sock.sendall(FRAME_HEADER.pack(len(region.head) + region.length) + region.head)
+        sock.sendfile(region.file, region.offset, region.length)
+    finally:
+        region.close()
+
+class ConnectionPool:
+    """
+    Pool koneksi TCP persisten ke satu node (host, port).
+    Koneksi dipakai ulang antar request, dibatasi jumlahnya, dan yang terlalu lama idle dibuang.
+    """
+    MAX_SIZE = 8
+    IDLE_TIMEOUT = 30.0
+    CONNECT_TIMEOUT = CONNECT_TIMEOUT
+
+    def __init__(self, host, port, max_size=None, idle_timeout=None):
+        self.host = host
+        self.port = port
+        self.max_size = max_size or self.MAX_SIZE
+        self.idle_timeout = idle_timeout or self.IDLE_TIMEOUT
+        self.idle = deque() # (socket, waktu terakhir dipakai), yang paling baru di kanan
+        self.in_use = 0
+        self.cond = threading.Condition()
+
+    def _is_healthy(self, sock):
+        # Socket idle yang "readable" berarti server sudah menutup koneksi (EOF) atau ada data nyasar
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def _evict_idle(self, now):
+        while self.idle and now - self.idle[0][1] > self.idle_timeout:
+            sock, _ = self.idle.popleft()
+            sock.close()
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                self._evict_idle(time.monotonic())
+                while self.idle:
+                    sock, _ = self.idle.pop()
+                    if self._is_healthy(sock):
+                        self.in_use += 1
+                        return sock
+                    sock.close()
+                if self.in_use < self.max_size:
+                    self.in_use += 1
+                    break
+                self.cond.wait()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.CONNECT_TIMEOUT)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        except Exception:
+            self._release_slot()
+            raise
+
+    def release(self, sock, reusable=True):
+        if reusable:
+            with self.cond:
+                self.idle.append((sock, time.monotonic()))
+        else:
+            sock.close()
+        self._release_slot()
+
+    def _release_slot(self):
+        with self.cond:
+            self.in_use -= 1
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            while self.idle:
+                sock, _ = self.idle.pop()
+                sock.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host, port):
+    """Mengambil (atau membuat) pool koneksi untuk node (host, port)."""
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = _pools[(host, port)] = ConnectionPool(host, port)
+        return pool
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values(): pool.close()
+        _pools.clear()
+    with _pipelines_lock:
+        for conn in _pipelines.values(): conn.close()
+        _pipelines.clear()
+
+class PipelinedConnection:
+    """
+    Satu koneksi TCP untuk protokol biner yang bisa membawa banyak request sekaligus (pipelining).
+    Request dikirim tanpa menunggu balasan sebelumnya; balasan dicocokkan lewat request_id oleh thread pembaca.
+    """
+    def __init__(self, host, port, connect_timeout=None):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout or ConnectionPool.CONNECT_TIMEOUT)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = threading.Lock()
+        self.pending = {} # request_id -> Future
+        self.pending_lock = threading.Lock()
+        self.request_ids = itertools.count(1)
+        self.closed = False
+        reader = threading.Thread(target=self._read_loop)
+        reader.daemon = True; reader.start()
+
+    def submit(self, opcode, partition_id, key, value=b'') -> Future:
+        """Mengirim satu request biner. Future berisi (status, body) begitu balasannya tiba."""
+        future = Future()
+        with self.pending_lock:
+            if self.closed: raise ConnectionError(f"Connection to {self.host}:{self.port} is closed")
+            request_id = future.request_id = next(self.request_ids) & 0xFFFFFFFF
+            self.pending[request_id] = future
+        frame = protocol.encode_request(opcode, request_id, partition_id, key, value)
+        try:
+            with self.write_lock:
+                send_frame(self.sock, frame)
+        except OSError as e:
+            self._fail_pending(e)
+        return future
+
+    def _read_loop(self):
+        try:
+            while True:
+                payload = recv_frame(self.sock)
+                if payload is None: raise ConnectionError(f"Connection closed by {self.host}:{self.port}")
+                status, request_id, body = protocol.decode_response(payload)
+                with self.pending_lock:
+                    future = self.pending.pop(request_id, None)
+                if future: future.set_result((status, body))
+        except Exception as e:
+            self._fail_pending(e)
+
+    def abandon(self, future, error):
+        """
+        Melepas request yang balasannya tidak ditunggu lagi (timeout). Node yang berhenti membalas tidak dipakai
+        ulang: koneksinya ditutup, dan request lain yang masih menunggu di koneksi ini ikut gagal.
+        """
+        with self.pending_lock:
+            self.pending.pop(future.request_id, None)
+        self._fail_pending(error)
+        drop_pipeline(self)
+
+    def _fail_pending(self, error):
+        with self.pending_lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done(): future.set_exception(error)
+        self.close()
+
+    def close(self):
+        try: self.sock.close()
+        except OSError: pass
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def get_pipeline(host, port, connect_timeout=None):
+    """Mengambil koneksi pipelined untuk node (host, port), membuat koneksi baru jika yang lama sudah putus."""
+    with _pipelines_lock:
+        conn = _pipelines.get((host, port))
+        if conn is not None and not conn.closed: return conn
+    # Koneksi dibuka di luar lock global, agar node yang lambat atau mati tidak menahan request ke node lain
+    new_conn = PipelinedConnection(host, port, connect_timeout)
+    with _pipelines_lock:
+        conn = _pipelines.get((host, port))
+        if conn is not None and not conn.closed:
+            # Thread lain lebih dulu membuka koneksi ke node yang sama
+            new_conn.close()
+            return conn
+        _pipelines[(host, port)] = new_conn
+        return new_conn
+
+def drop_pipeline(conn):
+    """Membuang koneksi pipelined dari cache, agar request berikutnya ke node tersebut membuka koneksi baru."""
+    with _pipelines_lock:
+        if _pipelines.get((conn.host, conn.port)) is conn: del _pipelines[(conn.host, conn.port)]
+
+def _reset_pools_after_fork():
+    # Proses anak (multiprocessing) tidak boleh berbagi socket milik proses induk
+    global _pools_lock, _pipelines_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+    _pipelines.clear()
+    _pipelines_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+def send_request(host, port, message):
+    """Fungsi klien untuk mengirim permintaan ke server melalui pool koneksi."""
+    pool = get_pool(host, port)
+    payload = message.encode('utf-8')
+    # Koneksi dari pool bisa saja sudah ditutup server; coba sekali lagi dengan koneksi lain
+    for attempt in range(2):
+        try:
+            sock = pool.acquire()
+        except ConnectionRefusedError:
+            return f"Error: Connection refused from {host}:{port}. Node might be down."
+        except Exception as e:
+            return f"Error: {e}"
+        try:
+            send_frame(sock, payload)
+            response = recv_frame(sock)
+        except OSError as e:
+            pool.release(sock, reusable=False)
+            error = e
+            continue
+        if response is None:
+            pool.release(sock, reusable=False)
+            error = ConnectionError(f"Connection closed by {host}:{port}")
+            continue
+        pool.release(sock)
+        return response.decode('utf-8')
+    return f"Error: {error}"
+
+def send_binary_request(host, port, opcode, partition_id, key, value=b'', timeout=None):
+    """
+    Fungsi klien untuk protokol biner. Mengembalikan (status, body).
+    Kegagalan jaringan (dan balasan yang tidak tiba dalam `timeout` detik) dikembalikan sebagai
+    STATUS_ERROR dengan pesan 'Error: ...' seperti send_request.
+    """
+    for attempt in range(2):
+        try:
+            # Membuka koneksi juga tidak boleh melebihi `timeout`
+            connect_timeout = min(timeout, CONNECT_TIMEOUT) if timeout else None
+            conn = get_pipeline(host, port, connect_timeout)
+            future = conn.submit(opcode, partition_id, key, value)
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                message = f"Error: No response from {host}:{port} within {timeout}s."
+                conn.abandon(future, ConnectionError(message))
+                return protocol.STATUS_ERROR, message.encode('utf-8')
+        except ConnectionRefusedError:
+            return protocol.STATUS_ERROR, f"Error: Connection refused from {host}:{port}. Node might be down.".encode('utf-8')
+        except TimeoutError:
+            # Batas waktu saat membuka koneksi
+            return protocol.STATUS_ERROR, f"Error: No response from {host}:{port} within {timeout}s.".encode('utf-8')
+        except Exception as e:
+            # Koneksi lama mungkin sudah ditutup server; coba sekali lagi dengan koneksi baru
+            error = e
+    return protocol.STATUS_ERROR, f"Error: {error}".encode('utf-8')
+
+def send_binary_requests(requests):
+    """
+    Mengirim beberapa request biner [(host, port, opcode, partition_id, key, value), ...] secara paralel
+    lewat koneksi pipelined masing-masing node, lalu menunggu semuanya. Urutan hasil sama dengan urutan request.
+    """
+    futures = []
+    for host, port, opcode, partition_id, key, value in requests:
+        try:
+            futures.append(get_pipeline(host, port).submit(opcode, partition_id, key, value))
+        except Exception:
+            futures.append(None)
+    results = []
+    for request, future in zip(requests, futures):
+        try:
+            if future is not None:
+                results.append(future.result())
+                continue
+        except Exception:
+            pass
+        # Gagal di koneksi pipelined (mis. koneksi lama sudah putus): ulangi lewat jalur biasa
+        results.append(send_binary_request(*request))
+    return results
+
+class ResponseStream:
+    """
+    Body balasan biner yang dibaca dari socket sedikit demi sedikit (lihat open_binary_stream), agar value besar
+    tidak perlu utuh di memori. Koneksinya kembali ke pool begitu body habis dibaca, atau ditutup jika pembacaan
+    dihentikan di tengah jalan (sisa body masih ada di socket).
+    """
+    def __init__(self, pool, sock, length: int):
+        self.pool = pool
+        self.sock = sock
+        self.length = length
+        self.remaining = length
+        if not length: self.close()
+
+    def read(self, size: int) -> bytes:
+        """Paling banyak size byte berikutnya (sebanyak yang sudah tiba), atau b'' jika body sudah habis."""
+        if self.sock is None: return b''
+        try:
+            chunk = self.sock.recv(min(size, self.remaining))
+        except OSError:
+            self.close()
+            raise
+        if not chunk:
+            self.close()
+            raise ConnectionError(f"Connection closed by {self.pool.host}:{self.pool.port} with {self.remaining} bytes left")
+        self.remaining -= len(chunk)
+        if not self.remaining: self.close()
+        return chunk
+
+    def read_all(self) -> bytes:
+        chunks = []
+        while self.sock is not None: chunks.append(self.read(self.remaining))
+        return b''.join(chunks)
+
+    def iter_chunks(self, chunk_size: int = 64 * 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk: return
+            yield chunk
+
+    def close(self):
+        if self.sock is not None:
+            self.pool.release(self.sock, reusable=not self.remaining)
+            self.sock = None
+
+def open_binary_stream(host, port, opcode, partition_id, key, value=b''):
+    """
+    Seperti send_binary_request, tetapi lewat koneksi dari pool (koneksi pipelined tidak bisa dipakai request lain
+    selama body dibaca) dan body balasan STATUS_OK tidak dibaca sekaligus: mengembalikan (status, ResponseStream).
+    Balasan lain tetap dibaca utuh: (status, body bytes).
+    """
+    pool = get_pool(host, port)
+    frame = protocol.encode_request(opcode, 0, partition_id, key, value)
+    for attempt in range(2):
+        try:
+            sock = pool.acquire()
+        except ConnectionRefusedError:
+            return protocol.STATUS_ERROR, f"Error: Connection refused from {host}:{port}. Node might be down.".encode('utf-8')
+        except Exception as e:
+            return protocol.STATUS_ERROR, f"Error: {e}".encode('utf-8')
+        try:
+            send_frame(sock, frame)
+            header = recv_exact(sock, FRAME_HEADER.size + protocol.RESPONSE_HEADER.size)
+        except OSError as e:
+            pool.release(sock, reusable=False)
+            error = e
+            continue
+        if header is None:
+            pool.release(sock, reusable=False)
+            error = ConnectionError(f"Connection closed by {host}:{port}")
+            continue
+        length, = FRAME_HEADER.unpack_from(header)
+        status, _ = protocol.RESPONSE_HEADER.unpack_from(header, FRAME_HEADER.size)
+        stream = ResponseStream(pool, sock, length - protocol.RESPONSE_HEADER.size)
+        if status == protocol.STATUS_OK: return status, stream
+        try:
+            return status, stream.read_all()
+        except OSError as e:
+            return protocol.STATUS_ERROR, f"Error: {e}".encode('utf-8')
+    return protocol.STATUS_ERROR, f"Error: {error}".encode('utf-8')
@@ -1,80 +1,496 @@
 # node.py
-import sys, os, shutil, time, socketserver, threading, json
-from partition import Partition
-from network import send_request
-from config import CLUSTER_TOPOLOGY
+import sys, os, shutil, time, socketserver, threading, json, asyncio, copy
+from concurrent.futures import ThreadPoolExecutor
+import protocol
+from partition import open_partition
+from replication import ReplicationStream, ReplicationGapError
+from membership import Membership, load_topology, merge_topology
+from migration import KeyRangeMovedError, Migrator, serve_pull
+from serializer import Serializer
+from keyindex import prefix_range
+from hashring import HashRing, check_ring_layout
+from segment import FileRegion
+from streaming import ChunkedUploads
+from metrics import MetricsRegistry, format_prometheus
+from frontend import NodeFrontend, worker_for_partition
+from network import send_frame, send_file_frame, recv_frame, FRAME_HEADER
+from config import (CLUSTER_TOPOLOGY, NODE_SERVER_MODE, NODE_WORKERS, VNODES_PER_PARTITION, MIGRATION_FREEZE_TIMEOUT,
+                    SCAN_PAGE_ENTRIES)
 
 class NodeTCPHandler(socketserver.BaseRequestHandler):
     def handle(self):
-        try:
-            data = self.request.recv(1024).strip().decode('utf-8')
-            if not data: return
-            parts = data.split(' ', 3); command = parts[0].upper()
-            response = "ERROR: Invalid command"
-            if command == 'PUT' and len(parts) == 4:
-                p_id, key, val_str = int(parts[1]), parts[2], parts[3]
-                response = self.server.node.handle_put(p_id, key, json.loads(val_str))
-            elif command == 'GET' and len(parts) == 3:
-                p_id, key = int(parts[1]), parts[2]
-                response = self.server.node.handle_get(p_id, key)
-            elif command == 'REPLICATE' and len(parts) == 4:
-                p_id, key, val_str = int(parts[1]), parts[2], parts[3]
-                response = self.server.node.handle_replicate(p_id, key, json.loads(val_str))
-            elif command == 'STATUS' and len(parts) == 3:
-                p_id, key = int(parts[1]), parts[2]
-                response = self.server.node.handle_status(p_id, key)
-            elif command == 'INSPECT':
-                response = self.server.node.handle_inspect()
-            elif command == 'HEX' and len(parts) == 3:
-                p_id, key = int(parts[1]), parts[2]
-                response = self.server.node.handle_hex(p_id, key)
-            elif command == 'SHUTDOWN':
-                self.server.node.close()
-                self.request.sendall(b"SUCCESS: Shutting down.")
-                self.server.shutdown()
+        self.server.node.metrics.counter("connections").inc()
+        # Koneksi bersifat persisten: layani request satu per satu sampai klien menutup koneksi
+        while True:
+            try:
+                payload = recv_frame(self.request)
+            except OSError:
                 return
-            self.request.sendall(response.encode('utf-8'))
-        except Exception as e:
-            self.request.sendall(f"SERVER_ERROR: {e}".encode('utf-8'))
+            if payload is None: return
+            if protocol.is_binary(payload):
+                try:
+                    response = self.server.node.dispatch_binary(payload)
+                    # Value besar dari cold storage dikirim langsung dari file segmennya
+                    if isinstance(response, FileRegion): send_file_frame(self.request, response)
+                    else: send_frame(self.request, response)
+                except OSError:
+                    return
+                continue
+            try:
+                data = payload.decode('utf-8').strip()
+                if not data: continue
+                if data.upper() == 'SHUTDOWN':
+                    self.server.node.close()
+                    send_frame(self.request, b"SUCCESS: Shutting down.")
+                    self.server.shutdown()
+                    return
+                response = self.server.node.dispatch_text(data)
+            except Exception as e:
+                response = f"SERVER_ERROR: {e}"
+            try:
+                send_frame(self.request, response.encode('utf-8'))
+            except OSError:
+                return
+
+class NodeTCPServer(socketserver.ThreadingTCPServer):
+    # Koneksi persisten membuat socket bisa tertinggal di TIME_WAIT saat node di-restart
+    allow_reuse_address = True
+    daemon_threads = True
+
+class NodeUnixServer(socketserver.ThreadingUnixStreamServer):
+    """Server worker di mode multi-proses: frame yang sama seperti NodeTCPServer, dari front-end lewat Unix socket."""
+    daemon_threads = True
+
+class AsyncNodeServer:
+    """
+    Server node berbasis asyncio: semua koneksi dilayani oleh satu event loop, bukan satu thread per koneksi.
+    Pekerjaan yang menyentuh partisi (lock, baca disk, flush) dijalankan di executor dengan jumlah thread terbatas.
+    """
+    EXECUTOR_WORKERS = 8
+
+    def __init__(self, node, max_workers=None):
+        self.node = node
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or self.EXECUTOR_WORKERS)
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self._handle_connection, self.node.host, self.node.port, reuse_address=True)
+        print(f"Node-{self.node.node_id} asyncio server running at {self.node.host}:{self.node.port}")
+        async with server:
+            await self.stopped.wait()
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _write_frame(self, writer, payload):
+        writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+    async def _write_file_frame(self, writer, region):
+        try:
+            writer.write(FRAME_HEADER.pack(len(region.head) + region.length) + region.head)
+            await asyncio.get_running_loop().sendfile(writer.transport, region.file, region.offset, region.length)
+        finally:
+            region.close()
+
+    async def _handle_binary(self, payload, writer, write_lock):
+        # Request biner dari satu koneksi diproses bersamaan; klien mencocokkan balasan lewat request_id
+        response = await self._run(self.node.dispatch_binary, payload)
+        # Transport tidak bisa ditulisi selama sendfile berjalan, jadi balasan satu koneksi ditulis bergantian
+        async with write_lock:
+            if not isinstance(response, FileRegion): self._write_frame(writer, response)
+            else:
+                try:
+                    await self._write_file_frame(writer, response)
+                except ConnectionError:
+                    pass # Klien berhenti membaca di tengah value (mis. iterasi get_stream dihentikan)
+
+    async def _handle_connection(self, reader, writer):
+        self.node.metrics.counter("connections").inc()
+        tasks = set()
+        write_lock = asyncio.Lock()
+        try:
+            while True:
+                length, = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                payload = await reader.readexactly(length)
+                if protocol.is_binary(payload):
+                    task = asyncio.create_task(self._handle_binary(payload, writer, write_lock))
+                    tasks.add(task); task.add_done_callback(tasks.discard)
+                    continue
+                data = payload.decode('utf-8').strip()
+                if not data: continue
+                if data.upper() == 'SHUTDOWN':
+                    await self._run(self.node.close)
+                    async with write_lock: self._write_frame(writer, b"SUCCESS: Shutting down.")
+                    await writer.drain()
+                    self.stopped.set()
+                    return
+                try:
+                    response = await self._run(self.node.dispatch_text, data)
+                except Exception as e:
+                    response = f"SERVER_ERROR: {e}"
+                async with write_lock: self._write_frame(writer, response.encode('utf-8'))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Event loop sedang dimatikan (SHUTDOWN); tutup koneksi tanpa mencetak traceback
+            pass
+        finally:
+            if tasks: await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
 
 class Node:
-    def __init__(self, node_id, host, port, cluster_topology):
+    VNODES_PER_PARTITION = VNODES_PER_PARTITION
+    def __init__(self, node_id, host, port, cluster_topology, worker=None):
         self.node_id=node_id; self.host=host; self.port=port
-        self.cluster_topology=cluster_topology; self.replicas = {}
-        data_dir = f"data/node_{node_id}"
-        for p_id, roles in cluster_topology['partitions'].items():
-            if roles['leader'] == node_id: self.replicas[p_id] = Partition(p_id, data_dir, self, 'leader')
-            elif node_id in roles['followers']: self.replicas[p_id] = Partition(p_id, data_dir, self, 'follower')
+        # Salinan topologi milik node ini: leader partisi bisa berubah karena failover
+        self.cluster_topology=copy.deepcopy(cluster_topology); self.replicas = {}
+        # (index, jumlah worker) jika node ini salah satu proses worker (NODE_WORKERS > 1): hanya partisi miliknya yang dibuka
+        self.worker = worker
+        self.serializer = Serializer()
+        # PUT bertahap (value besar) yang potongannya belum lengkap
+        self.uploads = ChunkedUploads()
+        # Metrik per perintah (latensi dan jumlah error) untuk STATS; metrik partisi dan replikasi ada di masing-masing
+        self.metrics = MetricsRegistry(**({"worker": worker[0]} if worker else {}))
+        self.data_dir = data_dir = f"data/node_{node_id}"
+        check_ring_layout(data_dir)
+        # Topologi yang disimpan sebelum restart memuat partisi baru dan rentang yang sudah dipindahkan ke sana
+        saved = load_topology(data_dir)
+        if saved: merge_topology(self.cluster_topology, saved)
+        self._update_ring()
+        # Semua partisi dibuka sebagai follower; role dari topologi diterapkan Membership setelah topologi
+        # terbaru diambil dari node lain (leader di config.py mungkin sudah digantikan lewat failover)
+        p_ids = [p_id for p_id, roles in self.cluster_topology['partitions'].items()
+                 if self.owns(p_id) and (roles['leader'] == node_id or node_id in roles['followers'])]
+        # Partisi memulihkan index-nya (hint + ekor log) secara paralel
+        with ThreadPoolExecutor(max_workers=max(1, len(p_ids))) as executor:
+            futures = {p_id: executor.submit(open_partition, p_id, data_dir, self, 'follower') for p_id in p_ids}
+            for p_id, future in futures.items(): self.replicas[p_id] = future.result()
+        # Satu stream replikasi per (partisi, follower) untuk partisi yang dipimpin node ini.
+        # stream_id baru setiap start agar follower tahu nomor urut dimulai lagi dari awal.
+        self.replication_stream_id = int.from_bytes(os.urandom(8), 'big')
+        self.replication_streams = {}
+        self.replication_seqs = {}
+        self.roles_lock = threading.Lock()
+        # Migrasi rentang kunci: sisi sumber per (partisi sumber, partisi target) dan sisi penerima per partisi baru
+        self.migrations_out = {}
+        self.migrators = {}
+        self.membership = Membership(self)
+    def owns(self, p_id) -> bool:
+        """Partisi ini dilayani proses ini (selalu True jika node berjalan sebagai satu proses)."""
+        return self.worker is None or worker_for_partition(p_id, self.worker[1]) == self.worker[0]
+    def _update_ring(self):
+        """Ring menurut topologi node ini, untuk menolak write ke kunci yang rentangnya sudah pindah ke partisi lain."""
+        partitions = dict(self.cluster_topology['partitions'])
+        self.ring = HashRing(partitions)
+        # Selama belum ada partisi yang ditambahkan, kepemilikan kunci tidak pernah berubah dan tidak perlu diperiksa
+        self.ring_changed = any(roles.get('active_vnodes') is not None for roles in partitions.values())
     def start_server(self):
-        server = socketserver.ThreadingTCPServer((self.host, self.port), NodeTCPHandler)
-        server.daemon_threads = True
+        server = NodeTCPServer((self.host, self.port), NodeTCPHandler)
         server.node = self; self.server = server
         server_thread = threading.Thread(target=server.serve_forever)
         server_thread.daemon = True; server_thread.start()
         print(f"Node-{self.node_id} server running at {self.host}:{self.port}")
+    def serve_async(self):
+        """Menjalankan node dengan server asyncio (blocking sampai SHUTDOWN)."""
+        asyncio.run(AsyncNodeServer(self).serve())
+    def apply_partition_roles(self, p_ids):
+        """Menyesuaikan role partisi lokal dan stream replikasinya dengan topologi (dipanggil saat start dan setelah failover)."""
+        with self.roles_lock:
+            self._update_ring()
+            for p_id in p_ids:
+                # Di mode multi-proses, topologi semua partisi tetap diikuti, tetapi partisi milik worker lain dilewati
+                if not self.owns(p_id): continue
+                roles = self.cluster_topology['partitions'][p_id]
+                partition = self.replicas.get(p_id)
+                if partition is None:
+                    # Partisi yang ditambahkan setelah cluster berjalan: dibuat begitu node ini tercantum di topologi
+                    if roles['leader'] != self.node_id and self.node_id not in roles['followers']: continue
+                    partition = self.replicas[p_id] = open_partition(p_id, self.data_dir, self, 'follower')
+                old_streams = {stream.follower_id: stream for stream in self.replication_streams.get(p_id, [])}
+                if roles['leader'] != self.node_id:
+                    if partition.role == 'leader':
+                        print(f"Node-{self.node_id}: Partition-{p_id} is now led by Node-{roles['leader']}, stepping down")
+                    partition.role = 'follower'
+                    self.replication_streams.pop(p_id, None)
+                    for stream in old_streams.values(): stream.close(timeout=0)
+                    continue
+                # Stream ke follower yang tetap dipertahankan, agar urutan dan antreannya tidak hilang
+                streams = []
+                for f_id in roles['followers']:
+                    stream = old_streams.pop(f_id, None)
+                    if stream is None:
+                        info = self.cluster_topology['nodes'][f_id]
+                        stream = ReplicationStream(self.replication_stream_id, partition, f_id, info['host'], info['port'])
+                    streams.append(stream)
+                self.replication_seqs.setdefault(p_id, 0)
+                self.replication_streams[p_id] = streams
+                partition.role = 'leader'
+                for stream in old_streams.values(): stream.close(timeout=0)
+                # Leader partisi yang rentangnya belum aktif semua (baru ditambahkan, atau leader-nya berganti) melanjutkan migrasi
+                active = roles.get('active_vnodes')
+                migrator = self.migrators.get(p_id)
+                if active is not None and len(active) < self.VNODES_PER_PARTITION and not (migrator and migrator.thread.is_alive()):
+                    self.migrators[p_id] = Migrator(self, p_id)
     def close(self):
+        self.membership.stop()
+        for streams in self.replication_streams.values():
+            for stream in streams: stream.close()
         for partition in self.replicas.values(): partition.close()
-    def handle_put(self, p_id, key, value):
+    def _observe_command(self, command, started, failed):
+        self.metrics.histogram("command_ms", command=command).observe((time.perf_counter() - started) * 1000)
+        if failed: self.metrics.counter("command_errors", command=command).inc()
+    def dispatch_text(self, data):
+        """Menjalankan satu perintah teks (fallback CLI) dan mengembalikan balasannya."""
+        started = time.perf_counter()
+        parts = data.split(' ', 3); command = parts[0].upper()
+        response = "ERROR: Invalid command"
+        if command == 'PUT' and len(parts) == 4:
+            p_id, key, val_str = int(parts[1]), parts[2], parts[3]
+            response = self.handle_put(p_id, key, json.loads(val_str))
+        elif command == 'GET' and len(parts) == 3:
+            p_id, key = int(parts[1]), parts[2]
+            response = self.handle_get(p_id, key)
+        elif command == 'REPLICATE' and len(parts) == 4:
+            p_id, key, val_str = int(parts[1]), parts[2], parts[3]
+            response = self.handle_replicate(p_id, key, json.loads(val_str))
+        elif command == 'DELETE' and len(parts) == 3:
+            p_id, key = int(parts[1]), parts[2]
+            response = self.handle_delete(p_id, key)
+        elif command == 'STATUS' and len(parts) == 3:
+            p_id, key = int(parts[1]), parts[2]
+            response = self.handle_status(p_id, key)
+        elif command == 'INSPECT':
+            response = self.handle_inspect()
+        elif command == 'HEX' and len(parts) == 3:
+            p_id, key = int(parts[1]), parts[2]
+            response = self.handle_hex(p_id, key)
+        elif command == 'SCAN' and len(parts) >= 3:
+            # SCAN <p_id> <request JSON>, field-nya sama dengan SCAN biner
+            response = self.handle_scan_text(int(parts[1]), json.loads(data.split(' ', 2)[2]))
+        elif command == 'PREFIX' and len(parts) in (3, 4):
+            # PREFIX <p_id> <prefix> [cursor]
+            request = {"prefix": parts[2], "cursor": parts[3] if len(parts) == 4 else None}
+            response = self.handle_scan_text(int(parts[1]), request)
+        elif command == 'STATS' and len(parts) <= 2:
+            # STATS [prometheus]
+            response = self.handle_stats(parts[1].lower() if len(parts) == 2 else 'json')
+        # Perintah yang tidak dikenal tidak dijadikan label, agar jumlah metrik tetap terbatas
+        self._observe_command(command if response != "ERROR: Invalid command" else "INVALID", started, response.startswith("ERROR"))
+        return response
+
+    def dispatch_binary(self, payload):
+        """Menjalankan satu request biner dan mengembalikan frame balasannya."""
+        started = time.perf_counter()
+        request_id = protocol.REQUEST_HEADER.unpack_from(payload)[1]
+        try:
+            opcode, request_id, p_id, key, value_bytes = protocol.decode_request(payload)
+            if opcode == protocol.OP_PUT:
+                message = self.handle_put(p_id, key, *self.serializer.decode_with_expiry(value_bytes))
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode == protocol.OP_REPLICATE:
+                message = self.handle_replicate(p_id, key, *self.serializer.decode_with_expiry(value_bytes))
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode == protocol.OP_PUT_CHUNK:
+                message = self.handle_put_chunk(p_id, key, value_bytes)
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode == protocol.OP_DELETE:
+                message = self.handle_delete(p_id, key)
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode in (protocol.OP_GET, protocol.OP_HEX):
+                status, body = self.handle_get_raw(p_id, key)
+            elif opcode == protocol.OP_STATUS:
+                message = self.handle_status(p_id, key)
+                status = protocol.STATUS_ERROR if message.startswith("ERROR") else protocol.STATUS_OK
+                body = message.encode('utf-8')
+            elif opcode == protocol.OP_REPLICATE_STREAM:
+                message = self.handle_replicate_stream(p_id, value_bytes)
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode == protocol.OP_REPLICATE_RESYNC:
+                message = self.handle_replicate_resync(p_id, value_bytes)
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode == protocol.OP_HEARTBEAT:
+                # Pada heartbeat, field partition_id berisi id node pengirim
+                status, body = protocol.STATUS_OK, self.membership.handle_heartbeat(p_id, value_bytes)
+            elif opcode == protocol.OP_TOPOLOGY:
+                status, body = protocol.STATUS_OK, self.membership.topology_bytes()
+            elif opcode == protocol.OP_MIGRATE_PULL:
+                status, body = protocol.STATUS_OK, serve_pull(self, p_id, json.loads(value_bytes))
+            elif opcode == protocol.OP_ADD_PARTITION:
+                message = self.handle_add_partition(p_id, json.loads(value_bytes))
+                status, body = protocol.status_for_message(message), message.encode('utf-8')
+            elif opcode == protocol.OP_SCAN:
+                status, body = self.handle_scan(p_id, json.loads(value_bytes))
+            elif opcode == protocol.OP_REPLICATION_LAG:
+                status, body = protocol.STATUS_OK, self.handle_replication_lag().encode('utf-8')
+            elif opcode in (protocol.OP_MGET, protocol.OP_MPUT, protocol.OP_MREPLICATE, protocol.OP_MDELETE):
+                handler = {protocol.OP_MGET: self.handle_mget, protocol.OP_MPUT: self.handle_mput,
+                           protocol.OP_MREPLICATE: self.handle_mreplicate, protocol.OP_MDELETE: self.handle_mdelete}[opcode]
+                status, body = protocol.STATUS_OK, protocol.encode_batch_results(self._dispatch_batch(value_bytes, handler))
+        except Exception as e:
+            status, body = protocol.STATUS_ERROR, f"SERVER_ERROR: {e}".encode('utf-8')
+        self._observe_command(protocol.OPCODE_NAMES[payload[0]], started, status == protocol.STATUS_ERROR)
+        if isinstance(body, FileRegion):
+            # Server yang mengirim frame-nya: header balasan lalu isi file dengan sendfile
+            body.head = protocol.encode_response(status, request_id)
+            return body
+        return protocol.encode_response(status, request_id, body)
+    def _dispatch_batch(self, batch_bytes, handler):
+        """
+        Memecah entri batch per partisi, memanggil handler sekali per partisi,
+        lalu menyusun kembali hasilnya sesuai urutan entri di request.
+        """
+        by_partition = {}
+        for index, (p_id, key, value_bytes) in enumerate(protocol.decode_batch(batch_bytes)):
+            by_partition.setdefault(p_id, []).append((index, key, value_bytes))
+        results = [None] * sum(len(entries) for entries in by_partition.values())
+        for p_id, entries in by_partition.items():
+            partition_results = handler(p_id, [(key, value_bytes) for _, key, value_bytes in entries])
+            for (index, _, _), result in zip(entries, partition_results):
+                results[index] = result
+        return results
+
+    def handle_put(self, p_id, key, value, expires_at=None):
         partition = self.replicas.get(p_id)
         if partition and partition.role == 'leader':
-            partition.put(key, value); return "SUCCESS: Put data to leader."
+            try:
+                partition.put(key, value, expires_at); return "SUCCESS: Put data to leader."
+            except KeyRangeMovedError as e:
+                return self._wait_for_handoff(p_id, e)
         return "ERROR: Not a leader for this partition."
+    def handle_put_chunk(self, p_id, key, body):
+        """Satu potongan PUT bertahap; potongan yang melengkapi value menjalankan PUT-nya seperti OP_PUT."""
+        partition = self.replicas.get(p_id)
+        if not partition or partition.role != 'leader': return "ERROR: Not a leader for this partition."
+        upload_id, offset, total = protocol.PUT_CHUNK_HEADER.unpack_from(body)
+        value_bytes = self.uploads.add((p_id, key, upload_id), offset, total, memoryview(body)[protocol.PUT_CHUNK_HEADER.size:])
+        if value_bytes is None: return "SUCCESS: Chunk received."
+        return self.handle_put(p_id, key, *self.serializer.decode_with_expiry(value_bytes))
     def handle_get(self, p_id, key):
         partition = self.replicas.get(p_id)
         return json.dumps(partition.get(key)) if partition else "ERROR: Partition not found."
-    def handle_replicate(self, p_id, key, value):
+    def handle_replicate(self, p_id, key, value, expires_at=None):
+        partition = self.replicas.get(p_id)
+        if partition and partition.role == 'follower':
+            partition.put(key, value, expires_at); return "SUCCESS: Replicated data."
+        return "ERROR: Not a follower."
+    def handle_mget(self, p_id, entries):
+        partition = self.replicas.get(p_id)
+        if not partition:
+            return [(protocol.STATUS_ERROR, b"ERROR: Partition not found on this node.")] * len(entries)
+        raw_values = partition.get_raw_many([key for key, _ in entries])
+        return [(protocol.STATUS_NOT_FOUND, b'') if raw is None else (protocol.STATUS_OK, raw) for raw in raw_values]
+    def handle_mput(self, p_id, entries):
+        partition = self.replicas.get(p_id)
+        if partition and partition.role == 'leader':
+            try:
+                partition.put_encoded_many(entries)
+            except KeyRangeMovedError as e:
+                return [(protocol.STATUS_ERROR, self._wait_for_handoff(p_id, e).encode('utf-8'))] * len(entries)
+            return [(protocol.STATUS_OK, b"SUCCESS: Put data to leader.")] * len(entries)
+        return [(protocol.STATUS_ERROR, b"ERROR: Not a leader for this partition.")] * len(entries)
+    def handle_mreplicate(self, p_id, entries):
+        partition = self.replicas.get(p_id)
+        if partition and partition.role == 'follower':
+            partition.put_encoded_many(entries)
+            return [(protocol.STATUS_OK, b"SUCCESS: Replicated data.")] * len(entries)
+        return [(protocol.STATUS_ERROR, b"ERROR: Not a follower.")] * len(entries)
+    def handle_delete(self, p_id, key):
+        partition = self.replicas.get(p_id)
+        if partition and partition.role == 'leader':
+            try:
+                partition.delete(key); return "SUCCESS: Deleted key from leader."
+            except KeyRangeMovedError as e:
+                return self._wait_for_handoff(p_id, e)
+        return "ERROR: Not a leader for this partition."
+    def handle_mdelete(self, p_id, entries):
+        partition = self.replicas.get(p_id)
+        if partition and partition.role == 'leader':
+            try:
+                partition.delete_many([key for key, _ in entries])
+            except KeyRangeMovedError as e:
+                return [(protocol.STATUS_ERROR, self._wait_for_handoff(p_id, e).encode('utf-8'))] * len(entries)
+            return [(protocol.STATUS_OK, b"SUCCESS: Deleted key from leader.")] * len(entries)
+        return [(protocol.STATUS_ERROR, b"ERROR: Not a leader for this partition.")] * len(entries)
+    def _wait_for_handoff(self, p_id, error):
+        """
+        Menahan write yang ditolak karena rentangnya sedang dibekukan sampai migrasi rentang itu selesai,
+        lalu meminta klien mengulang ke partisi barunya (koordinator memperbarui routing saat menerima ERROR).
+        """
+        migration = self.migrations_out.get((p_id, error.target_partition_id))
+        if migration: migration.done.wait(MIGRATION_FREEZE_TIMEOUT)
+        return f"ERROR: {error}"
+    def check_migration_writes(self, p_id, keys):
+        """
+        Dipanggil Partition leader di bawah lock-nya sebelum write diterapkan; bisa melempar KeyRangeMovedError.
+        Kunci yang menurut ring sudah milik partisi lain ditolak, mis. dari koordinator yang routing-nya masih lama
+        setelah migrasi selesai. Partisi yang masih menerima migrasi tidak diperiksa, karena Migrator menulis kunci
+        yang rentangnya belum diaktifkan.
+        """
+        active = self.cluster_topology['partitions'][p_id].get('active_vnodes')
+        if self.ring_changed and (active is None or len(active) >= self.VNODES_PER_PARTITION):
+            ring = self.ring
+            for key in keys:
+                owner = ring.partition_for(key)
+                if owner != p_id: raise KeyRangeMovedError(owner)
+        for migration in list(self.migrations_out.values()):
+            if migration.source_partition_id == p_id: migration.check_writes(keys)
+    def handle_add_partition(self, p_id, roles):
+        """Mendaftarkan partisi baru yang dipimpin node ini; rentang kuncinya lalu dimigrasikan secara online."""
+        if p_id in self.cluster_topology['partitions']: return f"ERROR: Partition-{p_id} already exists."
+        if roles['leader'] != self.node_id: return "ERROR: New partitions must be added through their leader."
+        missing = [n for n in [roles['leader']] + roles['followers'] if n not in self.cluster_topology['nodes']]
+        if missing: return f"ERROR: Unknown nodes {missing}."
+        # Belum ada vnode aktif, sehingga routing belum berubah sampai rentang pertama selesai disalin
+        self.membership.update_partition(p_id, {"leader": roles['leader'], "followers": roles['followers'],
+                                                "epoch": 0, "active_vnodes": []})
+        return f"SUCCESS: Partition-{p_id} added, migrating key ranges."
+    def handle_replicate_stream(self, p_id, body):
         partition = self.replicas.get(p_id)
         if partition and partition.role == 'follower':
-            partition.put(key, value); return "SUCCESS: Replicated data."
+            stream_id, entries = protocol.decode_replication_batch(body)
+            try:
+                applied = partition.apply_replication(stream_id, entries)
+            except ReplicationGapError as e:
+                # Leader membalas dengan resync (lihat ReplicationStream)
+                print(f"Node-{self.node_id}: Partition-{p_id} missed replication entries ({e})")
+                return f"ERROR: {e}"
+            return f"SUCCESS: Replicated {applied} entries."
         return "ERROR: Not a follower."
-    def replicate_to_followers(self, p_id, key, value):
-        roles = self.cluster_topology['partitions'].get(p_id)
-        if not roles: return
-        msg = f"REPLICATE {p_id} {key} {json.dumps(value)}"
-        for f_id in roles['followers']:
-            info = self.cluster_topology['nodes'][f_id]
-            t = threading.Thread(target=send_request, args=(info['host'], info['port'], msg))
-            t.daemon = True; t.start()
+    def handle_replicate_resync(self, p_id, body):
+        partition = self.replicas.get(p_id)
+        if partition and partition.role == 'follower':
+            stream_id, resync_seq, flags, entries = protocol.decode_resync_page(body)
+            try:
+                applied = partition.apply_resync(stream_id, resync_seq, entries, bool(flags & protocol.RESYNC_FIRST),
+                                                 bool(flags & protocol.RESYNC_LAST))
+            except ReplicationGapError as e:
+                return f"ERROR: {e}"
+            return f"SUCCESS: Resynced {applied} entries."
+        return "ERROR: Not a follower."
+    def wait_for_replication_capacity(self, p_id):
+        for stream in self.replication_streams.get(p_id, ()): stream.wait_for_capacity()
+    def replicate_to_followers(self, p_id, items):
+        """
+        Memasukkan write [(key, value_bytes), ...] ke stream replikasi setiap follower partisi.
+        Dipanggil Partition di bawah lock-nya, sehingga nomor urut mengikuti urutan write di leader.
+        """
+        streams = self.replication_streams.get(p_id)
+        if not streams or not items: return
+        first_seq = self.replication_seqs[p_id] + 1
+        self.replication_seqs[p_id] += len(items)
+        entries = [(first_seq + i, key, value_bytes) for i, (key, value_bytes) in enumerate(items)]
+        for stream in streams: stream.enqueue(entries)
+    def handle_replication_lag(self):
+        """Lag setiap follower untuk partisi yang dipimpin node ini (JSON), dipakai koordinator untuk follower read."""
+        lag = {}
+        for p_id, streams in self.replication_streams.items():
+            lag[p_id] = {}
+            for stream in streams:
+                stats = stream.stats()
+                lag[p_id][stream.follower_id] = {key: stats[key] for key in ("lag_entries", "lag_ms", "healthy")}
+        return json.dumps(lag)
     def handle_status(self, p_id, key):
         """Menangani permintaan status dan mendelegasikannya ke partisi."""
         partition = self.replicas.get(p_id)
@@ -84,12 +500,78 @@ class Node:
     def handle_inspect(self):
         """Mengumpulkan dan mengembalikan isi dari semua hot storage di node ini."""
         hot_storage_summary = {}
+        read_cache_summary = {}
+        segment_summary = {}
+        replication_summary = {}
         for p_id, partition in self.replicas.items():
-            # Mengambil salinan hot_storage dengan aman menggunakan lock
-            with partition.lock:
-                hot_storage_summary[f"partition_{p_id}"] = list(partition.hot_storage.keys())
+            hot_storage_summary[f"partition_{p_id}"] = partition.memtable_keys()
+            read_cache_summary[f"partition_{p_id}"] = partition.read_cache.stats()
+            segment_summary[f"partition_{p_id}"] = partition.segment_stats()
+            if partition.role == 'leader':
+                replication_summary[f"partition_{p_id}"] = {
+                    f"follower_{stream.follower_id}": stream.stats() for stream in self.replication_streams.get(p_id, [])}
+            else:
+                replication_summary[f"partition_{p_id}"] = {"applied_seq": partition.replicated_seq}
+        hot_storage_summary["read_cache"] = read_cache_summary
+        hot_storage_summary["segments"] = segment_summary
+        hot_storage_summary["replication"] = replication_summary
+        hot_storage_summary["topology"] = self.cluster_topology['partitions']
+        hot_storage_summary["migrations"] = {f"partition_{p_id}": migrator.stats for p_id, migrator in self.migrators.items()}
+        hot_storage_summary["ttl"] = {f"partition_{p_id}": partition.ttl_stats() for p_id, partition in self.replicas.items()}
         return json.dumps(hot_storage_summary, indent=2)
     
+    def handle_stats(self, fmt='json'):
+        """
+        Metrik node: latensi dan error per perintah, metrik setiap partisi (write/read, lock wait, flush, compaction,
+        ukuran storage dan index), dan metrik stream replikasi. fmt 'prometheus' untuk format teks Prometheus.
+        """
+        if fmt not in ('json', 'prometheus'): return "ERROR: Unknown STATS format, expected 'json' or 'prometheus'."
+        partitions = {f"partition_{p_id}": partition.stats() for p_id, partition in list(self.replicas.items())}
+        streams = [stream for p_streams in list(self.replication_streams.values()) for stream in p_streams]
+        replication = {}
+        for stream in streams:
+            replication.setdefault(f"partition_{stream.partition_id}", {})[f"follower_{stream.follower_id}"] = stream.metrics_snapshot()
+        if fmt == 'prometheus':
+            registries = [self.metrics] + [partition.metrics for partition in self.replicas.values()] + [s.metrics for s in streams]
+            return format_prometheus(registries)
+        return json.dumps({"node_id": self.node_id, "commands": self.metrics.snapshot(), "partitions": partitions,
+                           "replication": replication}, indent=2)
+    def handle_get_raw(self, p_id, key):
+        """
+        Mengambil value dalam bentuk bytes Serializer untuk protokol biner (GET dan HEX). Value cold storage yang
+        besar dikembalikan sebagai FileRegion, dikirim server dengan sendfile.
+        """
+        partition = self.replicas.get(p_id)
+        if not partition:
+            return protocol.STATUS_ERROR, b"ERROR: Partition not found on this node."
+        raw_bytes = partition.get_value_region(key)
+        if raw_bytes is None:
+            return protocol.STATUS_NOT_FOUND, b''
+        return protocol.STATUS_OK, raw_bytes
+
+    def _scan_page(self, partition, request):
+        """Satu halaman SCAN/PREFIX dari partisi lokal: ([(key, value_bytes), ...], cursor)."""
+        if request.get('prefix') is not None: start, end = prefix_range(request['prefix'])
+        else: start, end = request.get('start') or '', request.get('end')
+        # Kunci terkecil setelah cursor adalah cursor + '\0'
+        if request.get('cursor') is not None: start = max(start, request['cursor'] + '\0')
+        return partition.scan(start, end, request.get('limit') or SCAN_PAGE_ENTRIES)
+
+    def handle_scan(self, p_id, request):
+        """SCAN biner: kunci urut di partisi ini beserta value bytes-nya, satu halaman per request."""
+        partition = self.replicas.get(p_id)
+        if not partition:
+            return protocol.STATUS_ERROR, b"ERROR: Partition not found on this node."
+        entries, cursor = self._scan_page(partition, request)
+        return protocol.STATUS_OK, protocol.encode_scan_page(p_id, entries, cursor)
+
+    def handle_scan_text(self, p_id, request):
+        partition = self.replicas.get(p_id)
+        if not partition: return "ERROR: Partition not found on this node."
+        entries, cursor = self._scan_page(partition, request)
+        return json.dumps({"entries": [[key, self.serializer.decode_to_value(value)] for key, value in entries],
+                           "cursor": cursor})
+
     def handle_hex(self, p_id, key):
         """Menangani permintaan hex dan mendelegasikannya ke partisi."""
         partition = self.replicas.get(p_id)
@@ -98,14 +580,40 @@ class Node:
             return raw_bytes.hex() if raw_bytes else "NOT_FOUND"
         return "ERROR: Partition not found on this node."
 
-def start_node_process(node_id, host, port, topology):
-    node = Node(node_id, host, port, topology); node.start_server()
-    try: node.server.serve_forever()
+def start_node_process(node_id, host, port, topology, server_mode=None, workers=None):
+    # server_mode: 'thread' (ThreadingTCPServer, satu thread per koneksi) atau 'asyncio' (event loop)
+    # workers: jumlah proses worker (default NODE_WORKERS); lebih dari 1 = front-end + worker per kelompok partisi
+    workers = workers or NODE_WORKERS
+    node = Node(node_id, host, port, topology) if workers == 1 else NodeFrontend(node_id, host, port, topology, workers, start_node_worker)
+    try:
+        if (server_mode or NODE_SERVER_MODE) == 'asyncio':
+            asyncio.run(AsyncNodeServer(node).serve())
+        else:
+            server = NodeTCPServer((host, port), NodeTCPHandler)
+            server.node = node; node.server = server
+            print(f"Node-{node_id} server running at {host}:{port}")
+            server.serve_forever()
     finally: print(f"\nNode-{node_id} process finished.")
 
+def start_node_worker(node_id, host, port, topology, worker_index, num_workers, socket_path):
+    """Proses worker di mode multi-proses: Node yang hanya memiliki sebagian partisi, dilayani lewat Unix socket."""
+    parent = os.getppid()
+    def watch_parent():
+        # Worker ikut berhenti jika front-end mati (mis. dibunuh), agar heartbeat-nya tidak membuat node terlihat hidup
+        while os.getppid() == parent: time.sleep(0.2)
+        os._exit(1)
+    threading.Thread(target=watch_parent, daemon=True).start()
+    node = Node(node_id, host, port, topology, worker=(worker_index, num_workers))
+    server = NodeUnixServer(socket_path, NodeTCPHandler)
+    server.node = node; node.server = server
+    print(f"Node-{node_id} worker {worker_index} serving Partitions {sorted(node.replicas)}")
+    server.serve_forever()
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2: sys.exit(f"Usage: python {sys.argv[0]} <node_id>")
+    if len(sys.argv) not in (2, 3, 4): sys.exit(f"Usage: python {sys.argv[0]} <node_id> [thread|asyncio] [workers]")
     node_id = int(sys.argv[1])
+    server_mode = sys.argv[2] if len(sys.argv) >= 3 else None
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else None
     info = CLUSTER_TOPOLOGY['nodes'].get(node_id)
     if not info: sys.exit(f"Error: Node ID {node_id} not found.")
-    start_node_process(node_id, info['host'], info['port'], CLUSTER_TOPOLOGY)
\ No newline at end of file
+    start_node_process(node_id, info['host'], info['port'], CLUSTER_TOPOLOGY, server_mode, workers)
\ No newline at end of file
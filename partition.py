@@ -1,126 +1,1123 @@
 # partition.py
 import os
-import struct
+import sys
+import mmap
 import json
 import threading
-from serializer import Serializer
+import time
+import heapq
+from collections import deque, namedtuple
+from serializer import Serializer, TOMBSTONE_BYTES
+from cache import LRUCache
+from wal import (WriteAheadLog, DURABILITY_NONE, list_wal_generations, read_wal_file, wal_file_name,
+                 remove_wal_files)
+from segment import (Segment, FileRegion, RECORD_HEADER, ACTIVE_SEGMENT_NAME, COMPACT_SUFFIX, COMPACTED_SUFFIX, make_location,
+                     split_location, closed_segment_name, encode_record, iter_records, list_closed_segments, hint_path_for,
+                     encode_hint_block, read_hint_file, finish_compaction, pending_compactions)
+from sstable import SSTable, write_table, list_tables, table_name, bloom_hash, TMP_SUFFIX
+from keyindex import CompactKeyIndex, SortedKeys, SNAPSHOT_NAME
+from ttl import TimerWheel, now_ms
+from metrics import MetricsRegistry, TimedLock
+from replication import ReplicationGapError
+from config import (MEMTABLE_MAX_ENTRIES, MEMTABLE_MAX_BYTES, MAX_PENDING_FLUSHES, SEGMENT_MAX_BYTES,
+                    COMPACTION_MIN_SEGMENTS, COMPACTION_INTERVAL, COMPACTION_MAX_BYTES_PER_SEC,
+                    DURABILITY_MODE, GROUP_COMMIT_WINDOW, STORAGE_ENGINE, SSTABLE_BLOCK_BYTES, SSTABLE_BLOOM_BITS_PER_KEY,
+                    SCAN_MAX_PAGE_ENTRIES, SCAN_MAX_PAGE_BYTES, TTL_TICK_SECONDS, TTL_WHEEL_SLOTS, TTL_SWEEP_BATCH,
+                    STREAM_MIN_BYTES)
+
+_MISSING = object()
+# Penanda kunci yang dihapus di memtable; di disk, WAL, dan replikasi ditulis sebagai TOMBSTONE_BYTES
+_TOMBSTONE = object()
+STORAGE_ENGINES = ("log", "sstable")
+
+# Value ber-TTL di memtable dibungkus bersama waktu kedaluwarsanya (ms sejak epoch); value tanpa TTL disimpan apa adanya.
+_Expiring = namedtuple('_Expiring', ['value', 'expires_at'])
+
+def _stored(value, expires_at):
+    return value if expires_at is None else _Expiring(value, expires_at)
+
+def _unwrap(value):
+    """Value asli dari isi memtable, atau None jika sudah dihapus atau kedaluwarsa."""
+    if value is _TOMBSTONE: return None
+    if not isinstance(value, _Expiring): return value
+    return value.value if value.expires_at > now_ms() else None
+
+class _CompactionCancelled(Exception):
+    pass
+
+def _approx_size(value) -> int:
+    """Perkiraan murah ukuran value (byte) untuk batas memtable, tanpa perlu meng-encode."""
+    if isinstance(value, str): return len(value)
+    if isinstance(value, _Expiring): return 8 + _approx_size(value.value)
+    if isinstance(value, dict): return sum(len(str(k)) + _approx_size(v) for k, v in value.items())
+    if isinstance(value, list): return sum(_approx_size(v) for v in value)
+    return 8
+
+def open_partition(partition_id: int, data_dir: str, node, role: str, durability_mode: str = None,
+                   storage_engine: str = None):
+    """Membuat Partition dengan storage engine dari config (atau argumen): 'log' atau 'sstable'."""
+    storage_engine = storage_engine or STORAGE_ENGINE
+    if storage_engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine '{storage_engine}', expected one of {STORAGE_ENGINES}")
+    cls = SSTablePartition if storage_engine == "sstable" else Partition
+    return cls(partition_id, data_dir, node, role, durability_mode)
 
 class Partition:
-    HOT_STORAGE_LIMIT = 5
+    """Partisi dengan storage engine 'log': segmen append-only dan index semua kunci di memori."""
+    STORAGE_ENGINE = "log"
+    HOT_STORAGE_LIMIT = MEMTABLE_MAX_ENTRIES
+    HOT_STORAGE_MAX_BYTES = MEMTABLE_MAX_BYTES
+    MAX_PENDING_MEMTABLES = MAX_PENDING_FLUSHES
+    READ_CACHE_MAX_ENTRIES = 1024
+    READ_CACHE_MAX_BYTES = 4 * 1024 * 1024
+    SEGMENT_MAX_BYTES = SEGMENT_MAX_BYTES
+    COMPACTION_MIN_SEGMENTS = COMPACTION_MIN_SEGMENTS
+    COMPACTION_INTERVAL = COMPACTION_INTERVAL
+    COMPACTION_MAX_BYTES_PER_SEC = COMPACTION_MAX_BYTES_PER_SEC
+    GROUP_COMMIT_WINDOW = GROUP_COMMIT_WINDOW
+    SCAN_MAX_PAGE_ENTRIES = SCAN_MAX_PAGE_ENTRIES
+    SCAN_MAX_PAGE_BYTES = SCAN_MAX_PAGE_BYTES
+    TTL_TICK_SECONDS = TTL_TICK_SECONDS
+    TTL_SWEEP_BATCH = TTL_SWEEP_BATCH
+    STREAM_MIN_BYTES = STREAM_MIN_BYTES
 
-    def __init__(self, partition_id: int, data_dir: str, node, role: str):
+    def __init__(self, partition_id: int, data_dir: str, node, role: str, durability_mode: str = None):
         self.partition_id = partition_id
         self.data_dir = os.path.join(data_dir, f"partition_{partition_id}")
-        self.log_file_path = os.path.join(self.data_dir, "segment.log")
         self.node = node
         self.role = role
         self.serializer = Serializer()
         self.hot_storage = {}
-        self.cold_storage_index = {}
-        self.lock = threading.Lock()
+        self.hot_storage_bytes = 0
+        # Memtable penuh yang menunggu ditulis oleh flusher; tetap dibaca sampai selesai di-flush
+        self.flush_queue = deque()
+        # Generation file WAL milik tiap memtable di flush_queue (urutannya sama), dihapus setelah memtable di-flush
+        self.flush_wal_generations = deque()
+        # Snapshot memtable untuk pembaca tanpa lock: (memtable aktif, memtable di flush_queue dari yang terbaru).
+        # Tuple-nya tidak pernah diubah, hanya diganti (di bawah lock) setiap kali memtable berganti atau selesai di-flush.
+        self.memtables = (self.hot_storage,)
+        # Index kunci -> lokasi record; hanya hash, fingerprint, dan lokasi yang disimpan, kuncinya dibaca dari record jika perlu
+        self.cold_storage_index = CompactKeyIndex()
+        # Kunci cold storage terurut untuk SCAN, baru dibangun saat SCAN pertama (lihat _cold_keys_range)
+        self.sorted_keys = None
+        # Read cache untuk value cold storage yang sering dibaca, di-invalidate setiap PUT/REPLICATE
+        self.read_cache = LRUCache(self.READ_CACHE_MAX_ENTRIES, self.READ_CACHE_MAX_BYTES)
+        # Metrik untuk STATS; histogram yang dipakai di jalur request disimpan sebagai atribut agar tidak dicari ulang
+        self.metrics = MetricsRegistry(partition=partition_id)
+        self.write_latency = self.metrics.histogram("write_ms")
+        self.read_latency = self.metrics.histogram("read_ms")
+        self.keys_written = self.metrics.counter("keys_written")
+        # Lock untuk penulis (memtable, WAL, antrean replikasi, index). GET/HEX/STATUS tidak memakainya sama sekali.
+        # Lama menunggu lock (hanya acquire yang benar-benar harus menunggu) masuk ke histogram lock_wait_ms
+        self.lock = TimedLock(self.metrics.histogram("lock_wait_ms"))
+        self.flush_cond = threading.Condition(self.lock)
+        self.closing = False
+        # Posisi stream replikasi yang sudah diterapkan (hanya dipakai di follower)
+        self.replication_lock = threading.Lock()
+        self.replication_stream_id = None
+        self.replicated_seq = 0
+        # Kunci yang sudah diterima selama resync berjalan (None jika tidak sedang resync)
+        self.resync_keys = None
+        # Segmen di disk: file_no -> Segment. Nilai di cold_storage_index adalah lokasi (file_no, offset) yang dipadatkan.
+        # segments_lock melindungi daftar segmen, path file, dan pembuatan mmap-nya.
+        self.segments = {}
+        self.active_segment = None
+        self.next_file_no = 0
+        self.segments_lock = threading.Lock()
+        self.compaction_stats = {"runs": 0, "last_reclaimed_bytes": 0, "total_reclaimed_bytes": 0, "last_duration_ms": 0.0}
+        self.closed_event = threading.Event()
+        # TTL: waktu kedaluwarsa versi terbaru setiap kunci ber-TTL yang ditulis sejak start, dan timer wheel-nya.
+        # Kunci ber-TTL dari sebelum restart tetap terbaca NOT_FOUND (expires_at ada di record) dan dibuang compaction.
+        self.key_expiry = {}
+        self.expiry_wheel = TimerWheel(int(self.TTL_TICK_SECONDS * 1000), TTL_WHEEL_SLOTS)
+        self.expiry_stats = {"expired": 0, "last_sweep_ms": 0.0}
         os.makedirs(self.data_dir, exist_ok=True)
+        self._open_cold_storage()
+        self.durability_mode = durability_mode or DURABILITY_MODE
+        replayed = self._replay_wal()
+        self.wal = None
+        if self.durability_mode != DURABILITY_NONE:
+            self.wal = WriteAheadLog(self.data_dir, self.durability_mode, self.GROUP_COMMIT_WINDOW)
+        if replayed:
+            # Memtable hasil replay langsung diserahkan ke flusher; file WAL-nya dihapus setelah flush selesai
+            with self.lock:
+                self._rotate_memtable(replayed)
+        self.flusher = threading.Thread(target=self._flusher_loop)
+        self.flusher.daemon = True; self.flusher.start()
+        self.compactor = threading.Thread(target=self._compactor_loop)
+        self.compactor.daemon = True; self.compactor.start()
+        self.expirer = threading.Thread(target=self._expiry_loop)
+        self.expirer.daemon = True; self.expirer.start()
+
+    def _new_segment(self, seq, path) -> Segment:
+        segment = Segment(self.next_file_no, seq, path)
+        self.next_file_no += 1
+        self.segments[segment.file_no] = segment
+        return segment
+
+    def _open_cold_storage(self):
+        if list_tables(self.data_dir):
+            raise ValueError(f"Partition-{self.partition_id} data in {self.data_dir} was written by the 'sstable' storage engine")
         self._load_index_from_log()
 
     def _load_index_from_log(self):
         with self.lock:
-            if not os.path.exists(self.log_file_path): return
-            with open(self.log_file_path, 'rb') as f:
-                offset = 0
-                while True:
-                    len_bytes = f.read(4)
-                    if not len_bytes: break
-                    record_len, = struct.unpack('!I', len_bytes)
-                    record_bytes = f.read(record_len)
-                    if len(record_bytes) < record_len: break
-                    key_len, = struct.unpack('!I', record_bytes[:4])
-                    key = record_bytes[4:4+key_len].decode('utf-8')
-                    self.cold_storage_index[key] = offset
-                    offset += (4 + record_len)
-
-    def put(self, key: str, value: any):
-        with self.lock:
-            self.hot_storage[key] = value
-            should_flush = len(self.hot_storage) >= self.HOT_STORAGE_LIMIT
-        
-        if should_flush:
-            self._flush_hot_to_cold()
-
-        if self.role == 'leader':
-            self.node.replicate_to_followers(self.partition_id, key, value)
+            # Compaction yang sudah di-commit saat node mati diselesaikan dulu: segmen inputnya tidak boleh ikut dimuat
+            for output_path, inputs in pending_compactions(self.data_dir, list_closed_segments(self.data_dir)):
+                finish_compaction(output_path, [hint_path_for(path) for path in inputs] + inputs)
+            closed = list_closed_segments(self.data_dir)
+            closed_hints = {os.path.basename(hint_path_for(path)) for _, path in closed}
+            for name in os.listdir(self.data_dir):
+                # Sisa compaction yang terhenti di tengah jalan dan hint tanpa segmen tidak pernah dipakai
+                stale_hint = name.endswith(".hint") and name != "segment.hint" and name not in closed_hints
+                if name.endswith(COMPACT_SUFFIX) or stale_hint: os.remove(os.path.join(self.data_dir, name))
+            snapshot_path = os.path.join(self.data_dir, SNAPSHOT_NAME)
+            loaded = self._load_index_snapshot(snapshot_path, closed)
+            # Snapshot hanya berlaku sampai write pertama; dihapus agar crash berikutnya tidak memakai index basi
+            for path in (snapshot_path, snapshot_path + ".tmp"):
+                if os.path.exists(path): os.remove(path)
+            if loaded: return
+            for seq, path in closed:
+                self._load_segment(self._new_segment(seq, path))
+            active_seq = closed[-1][0] + 1 if closed else 1
+            self.active_segment = self._new_segment(active_seq, os.path.join(self.data_dir, ACTIVE_SEGMENT_NAME))
+            valid_end = self._load_segment(self.active_segment)
+            if valid_end < self.active_segment.size:
+                # Record terakhir terpotong (node mati saat menulis): buang agar append berikutnya tetap sejajar
+                with open(self.active_segment.path, 'r+b') as f: f.truncate(valid_end)
+                self.active_segment.size = valid_end
+
+    def _load_record(self, key, file_no, offset, record_len):
+        # Tombstone menghapus versi kunci dari segmen yang lebih lama; tombstone sendiri tidak pernah masuk index.
+        # Value lain selalu lebih dari satu byte (lihat Serializer), jadi panjang record cukup untuk mengenalinya.
+        if record_len - 4 - len(key.encode('utf-8')) == len(TOMBSTONE_BYTES): self.cold_storage_index.pop(key)
+        else: self.cold_storage_index[key] = make_location(file_no, offset)
+
+    def _replay_wal(self) -> list:
+        """
+        Membangun ulang memtable dari file WAL yang tersisa (node mati sebelum memtable-nya di-flush).
+        Mengembalikan generation file yang di-replay; file tanpa record langsung dihapus.
+        """
+        generations = list_wal_generations(self.data_dir)
+        replayed = []
+        for generation in generations:
+            path = os.path.join(self.data_dir, wal_file_name(generation))
+            records = read_wal_file(path)
+            if not records:
+                os.remove(path)
+                continue
+            for key, value_bytes in records:
+                value = self._decode_stored(value_bytes)
+                self.hot_storage[key] = value
+                self.hot_storage_bytes += len(key) + _approx_size(value)
+                self._track_expiry(key, value)
+            replayed.append(generation)
+        if replayed:
+            print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Replayed {len(self.hot_storage)} keys from WAL")
+        return replayed
+
+    def _segment_layout(self) -> list:
+        """Daftar segmen [file_no, seq, nama file, ukuran] yang dicatat di snapshot index."""
+        return [[s.file_no, s.seq, os.path.basename(s.path), s.size] for s in sorted(self.segments.values(), key=lambda s: s.seq)]
+
+    def _load_index_snapshot(self, snapshot_path, closed) -> bool:
+        """
+        Memuat index dari snapshot yang ditulis saat partisi ditutup, tanpa membaca hint satu per satu.
+        Hanya dipakai jika segmen di disk persis sama (nama dan ukuran) dengan saat snapshot ditulis.
+        """
+        header = CompactKeyIndex.read_snapshot_header(snapshot_path)
+        if header is None or header.get('byteorder') != sys.byteorder: return False
+        active_path = os.path.join(self.data_dir, ACTIVE_SEGMENT_NAME)
+        on_disk = [(seq, os.path.basename(path), os.path.getsize(path)) for seq, path in closed]
+        on_disk.append((closed[-1][0] + 1 if closed else 1, ACTIVE_SEGMENT_NAME,
+                        os.path.getsize(active_path) if os.path.exists(active_path) else 0))
+        if [(seq, name, size) for _, seq, name, size in header.get('segments', [])] != on_disk: return False
+        try:
+            index = CompactKeyIndex.load(snapshot_path)
+        except (OSError, ValueError, EOFError, KeyError):
+            return False
+        # Nomor file harus sama dengan saat snapshot ditulis, karena nomor itulah yang tersimpan di lokasi index
+        for file_no, seq, name, _ in header['segments']:
+            self.segments[file_no] = Segment(file_no, seq, os.path.join(self.data_dir, name))
+        self.next_file_no = max(self.segments) + 1
+        self.active_segment = self.segments[header['segments'][-1][0]]
+        self.cold_storage_index = index
+        print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Loaded index of {len(index)} keys from snapshot")
+        return True
+
+    def _load_segment(self, segment) -> int:
+        """
+        Mengisi index dari satu segmen (record yang lebih baru menimpa yang lama). Index dibaca dari file hint,
+        lalu hanya ekor log yang belum tercatat di hint yang di-scan. Hint yang hilang atau rusak berarti
+        scan penuh. Mengembalikan akhir record valid terakhir di segmen.
+        """
+        entries, intact = read_hint_file(segment.hint_path)
+        covered_end = entries[-1][1] + 4 + entries[-1][2] if entries else 0
+        if covered_end > segment.size:
+            # Hint menunjuk melewati akhir log (mis. log terpotong): tidak bisa dipercaya
+            entries, intact, covered_end = [], False, 0
+        for key, offset, record_len in entries:
+            self._load_record(key, segment.file_no, offset, record_len)
+
+        tail = []
+        valid_end = covered_end
+        if segment.size > covered_end:
+            with open(segment.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment_map:
+                    for offset, key, record_end in iter_records(segment_map, covered_end):
+                        self._load_record(key, segment.file_no, offset, record_end - offset - 4)
+                        tail.append((key.encode('utf-8'), offset, record_end - offset - 4))
+                        valid_end = record_end
+
+        # Lengkapi hint agar startup berikutnya tidak perlu scan lagi
+        if not intact:
+            hint_entries = [(key.encode('utf-8'), offset, record_len) for key, offset, record_len in entries] + tail
+            tmp_path = segment.hint_path + COMPACT_SUFFIX
+            with open(tmp_path, 'wb') as f: f.write(encode_hint_block(hint_entries))
+            os.replace(tmp_path, segment.hint_path)
+        elif tail:
+            with open(segment.hint_path, 'ab') as f: f.write(encode_hint_block(tail))
+        return valid_end
+
+    def put(self, key: str, value: any, expires_at: int = None):
+        """expires_at: waktu kedaluwarsa absolut (ms sejak epoch, lihat ttl.py), None = tanpa TTL."""
+        self._write_to_memtable([(key, _stored(value, expires_at))])
             
-    def _flush_hot_to_cold(self):
+    def put_many(self, items):
+        """Menyimpan banyak pasangan (key, value) sekaligus dengan satu kali pengambilan lock."""
+        self._write_to_memtable(items)
+
+    def put_encoded_many(self, entries):
+        """
+        Seperti put_many untuk [(key, value_bytes), ...] hasil Serializer; TTL di value_bytes ikut disimpan,
+        dan TOMBSTONE_BYTES menghapus kuncinya.
+        """
+        self._write_to_memtable([(key, self._decode_stored(value_bytes)) for key, value_bytes in entries])
+
+    def delete(self, key: str):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        """
+        Menghapus kunci dengan menulis tombstone. Tombstone dicatat di WAL dan direplikasi seperti PUT, lalu
+        menutupi versi lama kunci di disk sampai compaction membuang keduanya. Kunci yang tidak ada tetap dianggap berhasil.
+        """
+        self._write_to_memtable([(key, _TOMBSTONE) for key in dict.fromkeys(keys)])
+
+    def drop_moved_keys(self, keys):
+        """
+        Seperti delete_many untuk salinan kunci yang rentangnya sudah dipindahkan ke partisi lain (migrasi selesai).
+        Kunci tersebut bukan milik partisi ini lagi, jadi pemeriksaan migrasi yang menolak write-nya dilewati.
+        """
+        self._write_to_memtable([(key, _TOMBSTONE) for key in dict.fromkeys(keys)], check_migration=False)
+
+    def apply_replication(self, stream_id: int, entries) -> int:
+        """
+        Menerapkan batch dari stream replikasi leader [(seq, key, value_bytes), ...] di follower.
+        Entri yang nomor urutnya sudah pernah diterapkan (batch yang dikirim ulang) dilewati. Batch yang tidak
+        menyambung dengan entri terakhir yang diterapkan ditolak dengan ReplicationGapError, agar leader mengirim
+        ulang seluruh isi partisi (apply_resync). Mengembalikan jumlah entri yang diterapkan.
+        """
+        with self.replication_lock:
+            if stream_id != self.replication_stream_id:
+                # Leader baru start: nomor urutnya dimulai lagi dari awal. Follower yang baru start belum tahu posisinya,
+                # jadi batch pertama diterima apa adanya: leader menyimpan semua entri yang belum di-ack, dan menandai
+                # stream untuk resync jika ada yang terpaksa dibuang.
+                fresh = self.replication_stream_id is None
+                self.replication_stream_id, self.replicated_seq = stream_id, 0
+                if fresh and entries: self.replicated_seq = entries[0][0] - 1
+            if entries and entries[0][0] > self.replicated_seq + 1:
+                raise ReplicationGapError(self.replicated_seq, entries[0][0])
+            items = [(key, self._decode_stored(value_bytes)) for seq, key, value_bytes in entries if seq > self.replicated_seq]
+            if items: self._write_to_memtable(items)
+            if entries: self.replicated_seq = max(self.replicated_seq, entries[-1][0])
+            return len(items)
+
+    def apply_resync(self, stream_id: int, resync_seq: int, entries, first: bool, last: bool) -> int:
+        """
+        Menerapkan satu halaman resync dari leader [(key, value_bytes), ...] (TOMBSTONE_BYTES untuk kunci yang sudah
+        dihapus). Setelah halaman terakhir, kunci lokal yang tidak dikirim leader dihapus, dan stream replikasi
+        dilanjutkan dari entri resync_seq + 1. Mengembalikan jumlah entri yang diterapkan.
+        """
+        with self.replication_lock:
+            if first: self.resync_keys = set()
+            elif self.resync_keys is None: raise ReplicationGapError(self.replicated_seq, resync_seq)
+            if entries: self.put_encoded_many(entries)
+            self.resync_keys.update(key for key, _ in entries)
+            if last:
+                stale = [key for key in self.all_keys() if key not in self.resync_keys]
+                if stale: self.delete_many(stale)
+                self.resync_keys = None
+                self.replication_stream_id, self.replicated_seq = stream_id, resync_seq
+            return len(entries)
+
+    def _write_to_memtable(self, items, check_migration=True):
+        started = time.perf_counter()
+        replicate = self.role == 'leader'
+        encoded = None
+        if self.wal or replicate:
+            # Encode di luar lock; hasilnya dipakai bersama oleh WAL dan replikasi
+            encoded = [self._encode_stored(value) for _, value in items]
+        if replicate: self.node.wait_for_replication_capacity(self.partition_id)
+        seq = 0
         with self.lock:
-            if not self.hot_storage:
-                return
-            items_to_flush = dict(self.hot_storage)
-            self.hot_storage.clear()
+            # Tolak write ke rentang kunci yang sedang dibekukan untuk migrasi (dan catat yang perlu disusulkan)
+            if replicate and check_migration: self.node.check_migration_writes(self.partition_id, [key for key, _ in items])
+            for index, (key, value) in enumerate(items):
+                # Dicatat di WAL di bawah lock yang sama, agar urutan record WAL sama dengan urutan di memtable
+                if self.wal: seq = self.wal.append(key, encoded[index])
+                self.hot_storage[key] = value
+                self.hot_storage_bytes += len(key) + _approx_size(value)
+                self.read_cache.invalidate(key)
+                self._track_expiry(key, value)
+                # Tombstone yang tidak menutupi versi apa pun tidak perlu disimpan (WAL-nya tetap mencatat DELETE)
+                if value is _TOMBSTONE: self._drop_unshadowing_locked(key)
+            if replicate:
+                # Masuk antrean replikasi di bawah lock yang sama, sehingga follower menerima write dalam urutan memtable
+                self.node.replicate_to_followers(self.partition_id, [(key, value_bytes) for (key, _), value_bytes in zip(items, encoded)])
+            if len(self.hot_storage) >= self.HOT_STORAGE_LIMIT or self.hot_storage_bytes >= self.HOT_STORAGE_MAX_BYTES:
+                # Backpressure: tahan penulis selama terlalu banyak memtable yang masih menunggu di-flush
+                while len(self.flush_queue) >= self.MAX_PENDING_MEMTABLES:
+                    self.flush_cond.wait()
+                self._rotate_memtable()
+        # fsync ditunggu di luar lock; di mode batched, PUT lain bisa ikut dalam fsync yang sama (group commit)
+        if seq: self.wal.wait_durable(seq)
+        self.write_latency.observe((time.perf_counter() - started) * 1000)
+        self.keys_written.inc(len(items))
 
-        if not items_to_flush:
-            return
+    def _encode_stored(self, value) -> bytes:
+        if value is _TOMBSTONE: return TOMBSTONE_BYTES
+        if isinstance(value, _Expiring): return self.serializer.encode_value(value.value, value.expires_at)
+        return self.serializer.encode_value(value)
 
-        with open(self.log_file_path, 'ab') as f:
-            for key, value in items_to_flush.items():
-                offset = f.tell()
-                with self.lock:
-                    self.cold_storage_index[key] = offset
-                
+    def _decode_stored(self, value_bytes):
+        """Kebalikan _encode_stored: isi memtable untuk value bytes dari WAL, replikasi, atau MPUT."""
+        if Serializer.is_tombstone(value_bytes): return _TOMBSTONE
+        return _stored(*self.serializer.decode_with_expiry(value_bytes))
+
+    def _track_expiry(self, key, value):
+        """Mencatat waktu kedaluwarsa versi terbaru kunci (atau menghapusnya jika ditimpa tanpa TTL). Lock harus sudah dipegang."""
+        if isinstance(value, _Expiring):
+            self.key_expiry[key] = value.expires_at
+            self.expiry_wheel.add(key, value.expires_at)
+        elif self.key_expiry:
+            self.key_expiry.pop(key, None)
+
+    def _expiry_loop(self):
+        while not self.closed_event.wait(self.TTL_TICK_SECONDS):
+            try:
+                self.expire_due()
+            except Exception as e:
+                print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Expiry sweep failed ({e})")
+
+    def expire_due(self) -> int:
+        """
+        Membuang kunci yang sudah kedaluwarsa menurut timer wheel (hanya slot yang dilewati jarum yang diperiksa).
+        Lock dipegang per batch TTL_SWEEP_BATCH kunci, bukan selama seluruh sweep. Mengembalikan jumlah kunci yang dibuang.
+        """
+        started = time.perf_counter()
+        now = now_ms()
+        with self.lock:
+            due = self.expiry_wheel.advance(now)
+        expired = 0
+        for start in range(0, len(due), self.TTL_SWEEP_BATCH):
+            with self.lock:
+                for key, expires_at in due[start:start + self.TTL_SWEEP_BATCH]:
+                    # Entri basi: kunci sudah ditimpa (dengan atau tanpa TTL) setelah entri ini dibuat
+                    if self.key_expiry.get(key) != expires_at: continue
+                    del self.key_expiry[key]
+                    self._drop_expired_locked(key)
+                    expired += 1
+        self.expiry_stats["expired"] += expired
+        if expired: self.metrics.counter("keys_expired").inc(expired)
+        self.expiry_stats["last_sweep_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return expired
+
+    def _drop_expired_locked(self, key):
+        """
+        Membuang kunci kedaluwarsa dari memori. Versi di memtable hanya dibuang jika tidak menutupi versi lama
+        (di memtable lain atau di disk); jika menutupi, versi itu tetap di-flush dan baru dibuang oleh compaction.
+        """
+        self.read_cache.invalidate(key)
+        if key in self.hot_storage: self._drop_unshadowing_locked(key)
+        elif not any(key in memtable for memtable in self.flush_queue): self._drop_cold_locked(key)
+
+    def _drop_unshadowing_locked(self, key):
+        """Membuang kunci dari memtable aktif jika versinya di sana tidak menutupi versi lama (di memtable lain atau di disk)."""
+        if any(key in memtable for memtable in self.flush_queue) or self._cold_locate(key) is not None: return
+        self.hot_storage_bytes -= len(key) + _approx_size(self.hot_storage.pop(key))
+
+    def _drop_cold_locked(self, key):
+        # Record di segmen menyimpan expires_at-nya, jadi kunci ini tetap NOT_FOUND jika index dibangun ulang dari hint
+        self.cold_storage_index.pop(key)
+        if self.sorted_keys is not None: self.sorted_keys.discard([key])
+
+    def stats(self) -> dict:
+        """Metrik partisi untuk STATS: counter dan histogram, ditambah gauge ukuran memtable, storage, dan index saat ini."""
+        with self.lock:
+            gauges = {"memtable_keys": len(self.hot_storage) + sum(len(memtable) for memtable in self.flush_queue),
+                      "memtable_bytes": self.hot_storage_bytes, "pending_flushes": len(self.flush_queue)}
+            gauges.update(self._index_gauges())
+        gauges["storage_bytes"] = self.segment_stats()["total_bytes"]
+        for name, value in gauges.items(): self.metrics.gauge(name).set(value)
+        return self.metrics.snapshot()
+
+    def _index_gauges(self) -> dict:
+        return {"index_keys": len(self.cold_storage_index), "index_bytes": self.cold_storage_index.memory_bytes()}
+
+    def ttl_stats(self) -> dict:
+        with self.lock:
+            return dict(self.expiry_stats, tracked_keys=len(self.key_expiry), wheel_entries=len(self.expiry_wheel))
+
+    def _rotate_memtable(self, wal_generations=None):
+        """Menukar memtable yang penuh dengan yang kosong dan menyerahkannya ke flusher. Lock harus sudah dipegang."""
+        if not self.hot_storage: return
+        if wal_generations is None:
+            wal_generations = [self.wal.rotate()] if self.wal else []
+        self.flush_queue.append(self.hot_storage)
+        self.flush_wal_generations.append(wal_generations)
+        self.hot_storage = {}
+        self.hot_storage_bytes = 0
+        self._publish_memtables()
+        self.flush_cond.notify_all()
+
+    def _publish_memtables(self):
+        """Mengganti snapshot memtable untuk pembaca. Lock harus sudah dipegang."""
+        self.memtables = (self.hot_storage,) + tuple(reversed(self.flush_queue))
+
+    def _flusher_loop(self):
+        """Thread latar belakang yang menulis memtable dari flush_queue ke segment.log, yang paling lama lebih dulu."""
+        while True:
+            with self.lock:
+                while not self.flush_queue and not self.closing:
+                    self.flush_cond.wait()
+                if not self.flush_queue: return
+                memtable = self.flush_queue[0]
+                wal_generations = self.flush_wal_generations[0]
+            try:
+                with self.metrics.histogram("flush_ms").time():
+                    new_offsets = self._flush_memtable(memtable, wal_generations)
+            except Exception as e:
+                print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Flush failed ({e}), retrying...")
+                time.sleep(1)
+                continue
+            # Offset baru dipublikasikan setelah record benar-benar ada di file, agar pembaca mmap tidak
+            # membaca record setengah jadi. Memtable baru dilepas dari snapshot pembaca sesudahnya, sehingga
+            # pembaca yang tidak lagi melihat memtable ini pasti sudah melihat index-nya.
+            with self.lock:
+                self._publish_flush(new_offsets)
+                self.flush_queue.popleft()
+                self.flush_wal_generations.popleft()
+                self._publish_memtables()
+                self.flush_cond.notify_all()
+            remove_wal_files(self.data_dir, wal_generations)
+            self.metrics.counter("flushed_keys").inc(len(memtable))
+            if self.active_segment and self.active_segment.size >= self.SEGMENT_MAX_BYTES:
+                self._roll_segment()
+
+    def _publish_flush(self, new_offsets):
+        """
+        Membuat hasil flush terlihat oleh pembaca. Lock harus sudah dipegang. Kunci yang di-flush sebagai
+        tombstone (lokasi None) dihapus dari index; record tombstone-nya tetap di segmen agar versi lama
+        tidak muncul lagi jika index dibangun ulang dari hint.
+        """
+        deleted = [key for key, location in new_offsets.items() if location is None]
+        for key in deleted:
+            del new_offsets[key]
+            self.cold_storage_index.pop(key)
+        self.cold_storage_index.update(new_offsets)
+        if self.sorted_keys is not None:
+            self.sorted_keys.add(new_offsets)
+            self.sorted_keys.discard(deleted)
+
+    def _flush_memtable(self, memtable, wal_generations) -> dict:
+        """
+        Menulis satu memtable ke segmen aktif dengan satu kali write buffer. Mengembalikan lokasi tiap kunci
+        (None untuk tombstone).
+        """
+        segment = self.active_segment
+        new_locations = {}
+        hint_entries = []
+        buffer = bytearray()
+        with open(segment.path, 'ab') as f:
+            base_offset = f.tell()
+            for key, value in memtable.items():
+                offset = base_offset + len(buffer)
                 key_bytes = key.encode('utf-8')
-                value_bytes = self.serializer.encode_value(value)
-                record_bytes = struct.pack(f'!I{len(key_bytes)}s', len(key_bytes), key_bytes) + value_bytes
-                f.write(struct.pack('!I', len(record_bytes)))
-                f.write(record_bytes)
+                record = encode_record(key_bytes, self._encode_stored(value))
+                new_locations[key] = make_location(segment.file_no, offset) if value is not _TOMBSTONE else None
+                hint_entries.append((key_bytes, offset, len(record) - 4))
+                buffer += record
+            f.write(buffer)
+            self.metrics.counter("flushed_bytes").inc(len(buffer))
+            if wal_generations:
+                # File WAL memtable ini akan dihapus, jadi segmennya harus sudah permanen di disk
+                f.flush()
+                os.fsync(f.fileno())
+        # Hint ditulis setelah log-nya; jika node mati di antaranya, ekor log di-scan ulang saat startup
+        with open(segment.hint_path, 'ab') as f:
+            f.write(encode_hint_block(hint_entries))
+        segment.size = base_offset + len(buffer)
+        return new_locations
 
-    def get(self, key: str) -> any:
+    def _roll_segment(self):
+        """Menutup segmen aktif (segment.log -> segment_<seq>.log) dan memulai segment.log baru. Dipanggil oleh flusher."""
+        with self.segments_lock:
+            segment = self.active_segment
+            closed_path = os.path.join(self.data_dir, closed_segment_name(segment.seq))
+            hint_path = segment.hint_path
+            os.rename(segment.path, closed_path)
+            if os.path.exists(hint_path): os.rename(hint_path, hint_path_for(closed_path))
+            segment.path = closed_path
+            # Map segmen lama mungkin belum mencakup record terakhirnya; akan di-map ulang saat dibaca
+            self.active_segment = self._new_segment(segment.seq + 1, os.path.join(self.data_dir, ACTIVE_SEGMENT_NAME))
+
+    def _compactor_loop(self):
+        while not self.closed_event.wait(self.COMPACTION_INTERVAL):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Compaction failed ({e})")
+
+    def compact(self):
+        """
+        Menggabungkan semua segmen tertutup menjadi satu segmen yang hanya berisi record terbaru tiap kunci,
+        tanpa tombstone dan record yang sudah kedaluwarsa (kuncinya sekalian dihapus dari index). Record yang
+        ditutupi tombstone sudah tidak ditunjuk index, jadi ikut terbuang. Segmen input baru dihapus setelah hasilnya
+        di-commit (COMPACTED_SUFFIX), sehingga setelah crash keduanya tidak pernah dimuat bersama.
+        Laju tulis dibatasi COMPACTION_MAX_BYTES_PER_SEC agar tidak mengganggu latensi request.
+        """
+        with self.segments_lock:
+            inputs = sorted((s for s in self.segments.values() if s is not self.active_segment), key=lambda s: s.seq)
+        if len(inputs) < self.COMPACTION_MIN_SEGMENTS: return None
+
+        started = time.perf_counter()
+        # Hasil compaction memakai seq segmen input terbaru, sehingga tetap lebih tua dari segmen yang ditulis sesudahnya
+        target = inputs[-1]
+        tmp_path = target.path + COMPACT_SUFFIX
+        with self.segments_lock:
+            output = Segment(self.next_file_no, target.seq, target.path)
+            self.next_file_no += 1
+        tmp_hint_path = hint_path_for(target.path) + COMPACT_SUFFIX
+        moved = {} # key -> (lokasi lama, lokasi baru)
+        dropped = {} # key -> lokasi tombstone atau record yang kedaluwarsa
+        now = now_ms()
+        hint_entries = []
+        input_bytes = written = 0
+        with open(tmp_path, 'wb') as f:
+            for segment in inputs:
+                view = self._segment_view(segment.file_no, segment.size)
+                records = list(iter_records(view[:segment.size]))
+                input_bytes += segment.size
+                # Record hidup = record yang masih ditunjuk index
+                with self.lock:
+                    live = [(offset, key, end) for offset, key, end in records
+                            if self.cold_storage_index.get(key) == make_location(segment.file_no, offset)]
+                for offset, key, record_end in live:
+                    _, key_len = RECORD_HEADER.unpack_from(view, offset)
+                    if self._raw_dead(view[offset + RECORD_HEADER.size + key_len:record_end], now):
+                        # Semua versi lama kunci ini ada di segmen input yang sama, jadi tidak ada yang "muncul lagi"
+                        dropped[key] = make_location(segment.file_no, offset)
+                        continue
+                    moved[key] = (make_location(segment.file_no, offset), make_location(output.file_no, written))
+                    hint_entries.append((key.encode('utf-8'), written, record_end - offset - 4))
+                    f.write(view[offset:record_end])
+                    written += record_end - offset
+                    if not self._throttle_compaction(written, started):
+                        f.close(); os.remove(tmp_path)
+                        return None
+            f.flush()
+            os.fsync(f.fileno())
+        with open(tmp_hint_path, 'wb') as f:
+            f.write(encode_hint_block(hint_entries))
+        output.size = written
+
+        with self.segments_lock:
+            # Setelah rename ke .compacted, crash di tengah penggantian diselesaikan saat startup. Hint hasil dipasang
+            # terakhir; jika hilang karena crash, segmennya di-scan penuh dan hint-nya ditulis ulang.
+            os.replace(tmp_path, target.path + COMPACTED_SUFFIX)
+            finish_compaction(target.path, [segment.hint_path for segment in inputs] + [segment.path for segment in inputs])
+            if written:
+                os.replace(tmp_hint_path, output.hint_path)
+                self.segments[output.file_no] = output
+            else:
+                os.remove(tmp_hint_path)
+            # Index diarahkan ke segmen baru sebelum segmen lama dilepas. Kunci yang ditimpa selama compaction
+            # tidak disentuh, karena index-nya sudah menunjuk record yang lebih baru.
+            with self.lock:
+                for key, (old_location, new_location) in moved.items():
+                    if self.cold_storage_index.get(key) == old_location:
+                        self.cold_storage_index[key] = new_location
+                removed = [key for key, old_location in dropped.items() if self.cold_storage_index.get(key) == old_location]
+                for key in removed: self.cold_storage_index.pop(key)
+                if self.sorted_keys is not None: self.sorted_keys.discard(removed)
+            for segment in inputs: del self.segments[segment.file_no]
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        reclaimed = input_bytes - written
+        stats = self.compaction_stats
+        stats["runs"] += 1
+        stats["last_reclaimed_bytes"] = reclaimed
+        stats["total_reclaimed_bytes"] += reclaimed
+        stats["last_duration_ms"] = round(duration_ms, 2)
+        self.metrics.histogram("compaction_ms").observe(duration_ms)
+        self.metrics.counter("compaction_reclaimed_bytes").inc(reclaimed)
+        print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Compacted {len(inputs)} segments, "
+              f"reclaimed {reclaimed} bytes in {duration_ms:.1f} ms")
+        return reclaimed
+
+    def _throttle_compaction(self, written, started) -> bool:
+        """Menahan compaction agar laju tulisnya tidak melebihi batas. False jika partisi sedang ditutup."""
+        ahead = written / self.COMPACTION_MAX_BYTES_PER_SEC - (time.perf_counter() - started)
+        if ahead > 0:
+            return not self.closed_event.wait(ahead)
+        return not self.closed_event.is_set()
+
+    def segment_stats(self) -> dict:
+        with self.segments_lock:
+            return {
+                "engine": self.STORAGE_ENGINE,
+                "segments": len(self.segments),
+                "total_bytes": sum(s.size for s in self.segments.values()),
+                "active_segment_bytes": self.active_segment.size,
+                "compaction": dict(self.compaction_stats),
+            }
+
+    def _memtable_lookup(self, key):
+        """
+        Mencari kunci di memtable aktif lalu di memtable yang sedang menunggu flush (terbaru dulu), tanpa lock:
+        snapshot self.memtables diambil sekali, dan dict.get atomik terhadap penulis yang mengisi memtable aktif.
+        """
+        for memtable in self.memtables:
+            value = memtable.get(key, _MISSING)
+            if value is not _MISSING: return value
+        return _MISSING
+
+    def memtable_keys(self) -> list:
+        """Semua kunci yang masih di memori (memtable aktif dan yang sedang menunggu flush)."""
         with self.lock:
-            if key in self.hot_storage: return self.hot_storage[key]
-            if key in self.cold_storage_index:
-                offset = self.cold_storage_index[key]
-                with open(self.log_file_path, 'rb') as f:
-                    f.seek(offset)
-                    len_bytes = f.read(4)
-                    if not len_bytes: return None
-                    record_len, = struct.unpack('!I', len_bytes)
-                    record_bytes = f.read(record_len)
-                    key_len, = struct.unpack('!I', record_bytes[:4])
-                    value_bytes = record_bytes[4 + key_len:]
-                    decoded = self.serializer.decode_value(value_bytes)
-                    if 'data' in decoded: return decoded
-                    else: return decoded.get('value')
-        return None
+            return list(self._memtable_keys_locked())
+
+    def _memtable_keys_locked(self) -> dict:
+        keys = dict.fromkeys(self.hot_storage)
+        for memtable in self.flush_queue: keys.update(dict.fromkeys(memtable))
+        return keys
+
+    def all_keys(self) -> list:
+        """
+        Semua kunci partisi, di memtable maupun cold storage. Lock hanya dipegang untuk mengambil snapshot (kunci
+        memtable dan lokasi di index); kunci cold storage dibaca dari disk sesudahnya, di luar lock.
+        Write yang terjadi selama pemanggilan mungkin tidak terlihat.
+        """
+        while True:
+            with self.lock:
+                keys = self._memtable_keys_locked()
+                snapshot = self._cold_snapshot_locked()
+            cold_keys = self._cold_snapshot_keys(snapshot)
+            # None: segmen yang dirujuk snapshot baru saja digabung compaction, jadi ambil snapshot baru
+            if cold_keys is not None: break
+        keys.update(dict.fromkeys(cold_keys))
+        return list(keys)
+
+    def _cold_snapshot_locked(self):
+        return list(self.cold_storage_index.values())
+
+    def _cold_snapshot_keys(self, locations):
+        try:
+            return self._keys_at_locations(locations)
+        except KeyError:
+            return None
+
+    def _cold_keys_locked(self):
+        return self._keys_at_locations(self.cold_storage_index.values())
+
+    def _keys_at_locations(self, locations) -> list:
+        # Index tidak menyimpan kunci: kunci dibaca dari record yang ditunjuknya
+        maps = {}
+        keys = []
+        for location in locations:
+            file_no, offset = split_location(location)
+            if file_no not in maps: maps[file_no] = self._key_map(file_no)
+            keys.append(self._record_key(maps[file_no], offset))
+        return keys
+
+    def _key_map(self, file_no):
+        """
+        mmap segmen untuk membaca kunci (di bawah self.lock, atau tanpa lock dari all_keys). Tidak memakai
+        _segment_view, karena compaction memegang segments_lock sambil menunggu self.lock; map baru dibuka sendiri jika map segmen belum mencakup ekornya.
+        Map itu langsung dipasang ke segmen: paling buruk dua thread sama-sama membuat map, dan keduanya valid.
+        """
+        segment = self.segments[file_no]
+        segment_map = segment.map
+        if segment_map is not None and len(segment_map) >= segment.size: return segment_map
+        while True:
+            path = segment.path
+            try:
+                with open(path, 'rb') as f:
+                    segment.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    return segment.map
+            except FileNotFoundError:
+                # segment.log sedang di-rename oleh _roll_segment; path barunya segera menyusul
+                if segment.path == path: time.sleep(0.001)
+
+    @staticmethod
+    def _record_key(segment_map, offset) -> str:
+        _, key_len = RECORD_HEADER.unpack_from(segment_map, offset)
+        return segment_map[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + key_len].decode('utf-8')
+
+    def _cold_keys_range(self, start, end, limit) -> list:
+        """Paling banyak limit kunci cold storage urut dengan start <= kunci < end. Lock harus sudah dipegang."""
+        if self.sorted_keys is None:
+            # Index hash tidak urut: daftar kunci terurut dibangun sekali, lalu diperbarui setiap flush
+            self.sorted_keys = SortedKeys(self._cold_keys_locked())
+        return self.sorted_keys.range(start, end, limit)
+
+    def scan(self, start: str, end=None, limit: int = SCAN_MAX_PAGE_ENTRIES):
+        """
+        Satu halaman SCAN: (entri [(key, value_bytes), ...] urut menurut kunci dengan start <= kunci < end,
+        cursor). cursor adalah kunci terakhir yang sudah diperiksa, atau None jika rentangnya sudah habis.
+        Halaman dibatasi SCAN_MAX_PAGE_ENTRIES entri dan kira-kira SCAN_MAX_PAGE_BYTES byte.
+        """
+        limit = max(1, min(limit, self.SCAN_MAX_PAGE_ENTRIES))
+        with self.lock:
+            in_memory = heapq.nsmallest(limit, (key for key in self._memtable_keys_locked()
+                                                if key >= start and (end is None or key < end)))
+            keys = []
+            for key in heapq.merge(in_memory, self._cold_keys_range(start, end, limit)):
+                if len(keys) == limit: break
+                if not keys or keys[-1] != key: keys.append(key)
+        entries, page_bytes = [], 0
+        # Value dibaca di luar lock; kunci yang hilang di antaranya dilewati
+        for key, value_bytes in zip(keys, self.get_raw_many(keys)):
+            if value_bytes is None: continue
+            entries.append((key, value_bytes))
+            page_bytes += len(key) + len(value_bytes)
+            if page_bytes >= self.SCAN_MAX_PAGE_BYTES and key != keys[-1]: return entries, key
+        return entries, (keys[-1] if len(keys) == limit else None)
+
+    def _cold_locate(self, key):
+        """Lokasi kunci di cold storage (None jika tidak ada); murah dan aman dipanggil tanpa lock."""
+        return self.cold_storage_index.get(key)
+
+    def _read_cold_bytes(self, key, location):
+        """Membaca bytes value dari disk di luar lock. Mengembalikan (raw_bytes, lokasi yang dibaca) atau (None, None)."""
+        while True:
+            try:
+                view = self._read_value_view(location, key)
+                # Index hanya mencocokkan hash: record milik kunci lain berarti kunci ini tidak ada
+                return (bytes(view), location) if view is not None else (None, None)
+            except KeyError:
+                # Segmennya baru saja digabung oleh compaction: ambil lokasi terbaru kunci ini
+                location = self.cold_storage_index.get(key)
+                if location is None: return None, None
+
+    def get(self, key: str) -> any:
+        # Tanpa lock: memtable lebih dulu, baru index. Flush mempublikasikan index sebelum melepas memtable-nya,
+        # jadi kunci yang sedang berpindah ke disk selalu ditemukan di salah satunya.
+        with self.read_latency.time():
+            value = self._memtable_lookup(key)
+            # Versi di memtable (juga yang sudah kedaluwarsa) selalu menutupi versi lama di disk
+            if value is not _MISSING: return _unwrap(value)
+            location = self._cold_locate(key)
+            if location is None: return None
+            return self._read_cold(key, location)[1]
+
+    def _raw_dead(self, raw_bytes, now=None) -> bool:
+        """True jika value bytes dari disk adalah tombstone atau sudah kedaluwarsa."""
+        if Serializer.is_tombstone(raw_bytes): return True
+        expires_at = self.serializer.expires_at_of(raw_bytes)
+        return expires_at is not None and expires_at <= (now or now_ms())
+
+    def _read_cold(self, key, location):
+        """Membaca value cold storage lewat read cache. Mengembalikan (raw_bytes, value hasil decode)."""
+        entry = self.read_cache.get(key)
+        if entry is not None:
+            # Entri cache bisa kedaluwarsa sebelum sweep TTL sempat meng-invalidate-nya
+            return (None, None) if self._raw_dead(entry[0]) else entry
+        raw_bytes, location = self._read_cold_bytes(key, location)
+        if raw_bytes is None or self._raw_dead(raw_bytes): return None, None
+        decoded = self.serializer.decode_value(raw_bytes)
+        entry = (raw_bytes, decoded if 'data' in decoded else decoded.get('value'))
+        # Jangan isi cache jika kunci sudah ditimpa selama pembacaan, karena value di disk sudah basi. Diperiksa di
+        # bawah lock cache: penulis mengisi memtable dulu baru meng-invalidate, jadi write tidak bisa terselip.
+        self.read_cache.put(key, entry, len(raw_bytes),
+                            lambda: self._memtable_lookup(key) is _MISSING and self._cold_locate(key) == location)
+        return entry
     
     def get_key_location(self, key: str) -> str:
         """Mengecek lokasi sebuah kunci."""
-        with self.lock:
-            if key in self.hot_storage:
-                return "HOT_STORAGE"
-            elif key in self.cold_storage_index:
-                return "COLD_STORAGE"
-            else:
-                return "NOT_FOUND"
+        value = self._memtable_lookup(key)
+        if value is not _MISSING:
+            return "HOT_STORAGE" if _unwrap(value) is not None else "NOT_FOUND"
+        in_read_cache = key in self.read_cache
+        location = self._cold_locate(key)
+        # Lokasi bisa saja hanya perkiraan (mis. bloom filter), jadi dipastikan dengan membaca record-nya
+        raw_bytes = self._read_cold_bytes(key, location)[0] if location is not None else None
+        if raw_bytes is None or self._raw_dead(raw_bytes): return "NOT_FOUND"
+        return "READ_CACHE" if in_read_cache else "COLD_STORAGE"
     
     def get_raw_value_bytes(self, key: str) -> bytes:
         """Mengambil value dalam bentuk bytes mentah dari storage."""
-        with self.lock:
+        with self.read_latency.time():
+            value = self._memtable_lookup(key)
+            location = self._cold_locate(key) if value is _MISSING else None
             # Di hot storage, data belum di-encode, jadi kita encode dulu
-            if key in self.hot_storage:
-                value = self.hot_storage.get(key)
-                if value == self.TOMBSTONE: # Jika ada fitur delete
-                    return self.TOMBSTONE
-                return self.serializer.encode_value(value)
-            
+            if value is not _MISSING:
+                return self._encode_stored(value) if _unwrap(value) is not None else None
+            if location is None: return None
             # Di cold storage, data sudah dalam bentuk bytes
-            elif key in self.cold_storage_index:
-                offset = self.cold_storage_index[key]
-                with open(self.log_file_path, 'rb') as f:
-                    f.seek(offset)
-                    record_len_bytes = f.read(4)
-                    if not record_len_bytes: return None
-                    record_len, = struct.unpack('!I', record_len_bytes)
-                    record_bytes = f.read(record_len)
-                    key_len, = struct.unpack('!I', record_bytes[:4])
-                    return record_bytes[4 + key_len:]
-        return None
+            return self._read_cold(key, location)[0]
+
+    def get_value_region(self, key: str):
+        """
+        Seperti get_raw_value_bytes, tetapi value cold storage minimal STREAM_MIN_BYTES dikembalikan sebagai
+        FileRegion atas file segmennya, agar node bisa mengirimnya dengan sendfile tanpa menyalinnya ke memori.
+        """
+        with self.read_latency.time():
+            value = self._memtable_lookup(key)
+            if value is not _MISSING:
+                return self._encode_stored(value) if _unwrap(value) is not None else None
+            location = self._cold_locate(key)
+            if location is None: return None
+            # Value yang sudah ada di read cache tidak perlu dibaca dari disk lagi
+            region = self._cold_region(key, location) if key not in self.read_cache else None
+            return region if region is not None else self._read_cold(key, location)[0]
+
+    def _cold_region(self, key, location):
+        """FileRegion value cold storage yang besar, atau None jika value-nya kecil atau sudah mati (dibaca biasa)."""
+        try:
+            view = self._read_value_view(location, key)
+        except KeyError:
+            return None # Segmennya baru saja digabung compaction; jalur baca biasa mengambil lokasi terbarunya
+        if view is None or len(view) < self.STREAM_MIN_BYTES or self._raw_dead(view): return None
+        file_no, offset = split_location(location)
+        with self.segments_lock:
+            segment = self.segments.get(file_no)
+            if segment is None: return None
+            # Rename (_roll_segment) dan penggantian file oleh compaction memegang segments_lock, jadi path ini
+            # pasti file segmen tersebut. File yang sudah dibuka tetap terbaca walau segmennya dihapus sesudahnya.
+            f = open(segment.path, 'rb')
+        return FileRegion(f, offset + RECORD_HEADER.size + len(key.encode('utf-8')), len(view))
+
+    def get_raw_many(self, keys) -> list:
+        """Versi batch dari get_raw_value_bytes: semua kunci dicari dulu di memori, baru kemudian dibaca dari disk."""
+        started = time.perf_counter()
+        lookups = []
+        for key in keys:
+            value = self._memtable_lookup(key)
+            if value is not _MISSING: lookups.append((key, 'hot', value))
+            else:
+                location = self._cold_locate(key)
+                lookups.append((key, 'cold', location) if location is not None else (key, None, None))
+        results = []
+        for key, location, item in lookups:
+            if location == 'hot': results.append(self._encode_stored(item) if _unwrap(item) is not None else None)
+            elif location == 'cold': results.append(self._read_cold(key, item)[0])
+            else: results.append(None)
+        self.metrics.histogram("batch_read_ms").observe((time.perf_counter() - started) * 1000)
+        return results
+
+    def _segment_view(self, file_no, end) -> memoryview:
+        """
+        memoryview atas mmap sebuah segmen yang mencakup byte [0, end), di-map ulang jika map saat ini lebih pendek.
+        KeyError berarti segmen tersebut sudah dihapus oleh compaction.
+        """
+        segment = self.segments[file_no]
+        segment_map = segment.map
+        if segment_map is None or end > len(segment_map):
+            with self.segments_lock:
+                segment = self.segments[file_no]
+                if segment.map is None or end > len(segment.map):
+                    # Map lama tidak di-close: pembaca lain mungkin masih memegang memoryview-nya,
+                    # dan map itu dilepas otomatis begitu tidak ada lagi yang mereferensikannya
+                    with open(segment.path, 'rb') as f:
+                        segment.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                segment_map = segment.map
+        return memoryview(segment_map)
+
+    def _read_value_view(self, location, key: str) -> memoryview:
+        """Value record di lokasi tersebut, atau None jika record itu bukan milik key."""
+        file_no, offset = split_location(location)
+        view = self._segment_view(file_no, offset + RECORD_HEADER.size)
+        record_len, key_len = RECORD_HEADER.unpack_from(view, offset)
+        # Header bisa masuk map lama sementara sisa record-nya belum: map ulang sampai akhir record
+        if offset + 4 + record_len > len(view): view = self._segment_view(file_no, offset + 4 + record_len)
+        start = offset + RECORD_HEADER.size
+        if view[start:start + key_len] != key.encode('utf-8'): return None
+        return view[start + key_len:offset + 4 + record_len]
             
     def close(self):
         print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Flushing remaining data before shutdown...")
-        self._flush_hot_to_cold()
\ No newline at end of file
+        with self.lock:
+            self._rotate_memtable()
+            self.closing = True
+            self.flush_cond.notify_all()
+        self.flusher.join()
+        if self.wal: self.wal.close()
+        self.closed_event.set()
+        self.compactor.join()
+        self.expirer.join()
+        self._close_cold_storage()
+
+    def _close_cold_storage(self):
+        """Menyimpan snapshot index (semua data sudah di segmen) agar startup berikutnya tidak perlu membaca hint."""
+        with self.segments_lock:
+            try:
+                self.cold_storage_index.save(os.path.join(self.data_dir, SNAPSHOT_NAME), {"segments": self._segment_layout()})
+            except OSError as e:
+                print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Could not save index snapshot ({e})")
+            for segment in self.segments.values(): segment.map = None
+
+def _aged_items(table, age):
+    """(key, umur tabel, value_bytes) urut menurut kunci; umur 0 = tabel terbaru, sehingga menang saat di-merge."""
+    for key, value in table.items(): yield key, age, value
+
+class SSTablePartition(Partition):
+    """
+    Partisi dengan storage engine 'sstable' untuk keyspace yang sangat besar. Setiap memtable di-flush menjadi
+    SSTable urut yang tidak pernah diubah (sstable.py), sehingga yang tinggal di memori hanya sparse index dan
+    bloom filter per tabel, bukan index setiap kunci. Pencarian: memtable, lalu tabel dari yang terbaru ke yang
+    terlama, melewati tabel yang menurut bloom filter-nya pasti tidak berisi kunci tersebut.
+    """
+    STORAGE_ENGINE = "sstable"
+    BLOCK_BYTES = SSTABLE_BLOCK_BYTES
+    BLOOM_BITS_PER_KEY = SSTABLE_BLOOM_BITS_PER_KEY
+
+    def _open_cold_storage(self):
+        with self.lock:
+            if list_closed_segments(self.data_dir) or os.path.exists(os.path.join(self.data_dir, ACTIVE_SEGMENT_NAME)):
+                raise ValueError(f"Partition-{self.partition_id} data in {self.data_dir} was written by the 'log' storage engine")
+            for name in os.listdir(self.data_dir):
+                # Tabel yang belum selesai ditulis (flush/compaction terhenti) tidak pernah dipakai
+                if name.endswith(TMP_SUFFIX): os.remove(os.path.join(self.data_dir, name))
+            # Compaction yang sudah di-commit saat node mati diselesaikan dulu: tabel inputnya tidak boleh ikut dimuat
+            for output_path, inputs in pending_compactions(self.data_dir, list_tables(self.data_dir)):
+                finish_compaction(output_path, inputs)
+            # Tuple tabel dari yang terbaru; selalu diganti utuh (di bawah lock), tidak pernah diubah di tempat
+            self.tables = tuple(SSTable(seq, path) for seq, path in reversed(list_tables(self.data_dir)))
+            self.next_table_seq = self.tables[0].seq + 1 if self.tables else 1
+
+    def _flush_memtable(self, memtable, wal_generations) -> SSTable:
+        """Menulis satu memtable sebagai SSTable baru. Mengembalikan tabelnya (belum terlihat oleh pembaca)."""
+        seq = self.next_table_seq
+        path = os.path.join(self.data_dir, table_name(seq))
+        items = ((key, self._encode_stored(memtable[key])) for key in sorted(memtable))
+        # Tabel harus sudah permanen di disk sebelum file WAL memtable ini dihapus
+        size = write_table(path, items, self.BLOCK_BYTES, self.BLOOM_BITS_PER_KEY, len(memtable), sync=bool(wal_generations))
+        self.metrics.counter("flushed_bytes").inc(size)
+        self.next_table_seq += 1
+        return SSTable(seq, path)
+
+    def _publish_flush(self, table):
+        self.tables = (table,) + self.tables
+
+    def _cold_keys_locked(self):
+        return self._cold_snapshot_keys(self.tables)
+
+    def _cold_snapshot_locked(self):
+        return self.tables
+
+    def _cold_snapshot_keys(self, tables):
+        # Tabel yang dihapus compaction tetap terbaca: mmap-nya masih hidup selama direferensikan di sini
+        keys = {}
+        for table in reversed(tables): keys.update(dict.fromkeys(table.keys()))
+        return keys
+
+    def _index_gauges(self) -> dict:
+        # Jumlah record di semua tabel (kunci yang ditimpa di tabel lebih baru terhitung lebih dari sekali)
+        return {"index_keys": sum(table.num_keys for table in self.tables),
+                "index_bytes": sum(table.resident_bytes() for table in self.tables)}
+
+    def _drop_cold_locked(self, key):
+        # SSTable tidak pernah diubah: kunci kedaluwarsa terbaca NOT_FOUND dari expires_at di record, dan dibuang compaction
+        pass
+
+    def _cold_keys_range(self, start, end, limit) -> list:
+        # Tabel sudah urut: merge kunci dari setiap tabel mulai dari blok yang berisi start
+        keys = []
+        for key in heapq.merge(*(table.keys_from(start) for table in self.tables)):
+            if end is not None and key >= end or len(keys) == limit: break
+            if not keys or keys[-1] != key: keys.append(key)
+        return keys
+
+    def _cold_locate(self, key):
+        # Tabel yang mungkin berisi kunci (terbaru dulu) menurut bloom filter, tanpa membaca disk
+        key_hash = bloom_hash(key)
+        candidates = tuple(table for table in self.tables if table.might_contain(key, key_hash))
+        return candidates or None
+
+    def _cold_region(self, key, candidates):
+        # Compaction menimpa file SSTable lewat os.replace, jadi value besar tetap dibaca lewat mmap tabelnya
+        return None
+
+    def _read_cold_bytes(self, key, candidates):
+        # Tabel yang dihapus compaction tetap terbaca: mmap-nya masih hidup selama direferensikan di sini
+        for table in candidates:
+            raw_bytes = table.get(key)
+            if raw_bytes is not None: return raw_bytes, candidates
+        return None, None
+
+    def compact(self):
+        """
+        Menggabungkan semua SSTable menjadi satu dengan merge urut (record terbaru tiap kunci yang dipakai,
+        dan dibuang jika berupa tombstone atau sudah kedaluwarsa). Tabel input baru dihapus setelah hasilnya
+        di-commit (COMPACTED_SUFFIX). Laju tulis dibatasi COMPACTION_MAX_BYTES_PER_SEC.
+        """
+        with self.lock:
+            inputs = self.tables
+        if len(inputs) < self.COMPACTION_MIN_SEGMENTS: return None
+
+        started = time.perf_counter()
+        # Hasil compaction memakai seq tabel input terbaru, sehingga tetap lebih tua dari tabel yang ditulis sesudahnya
+        target = inputs[0]
+        progress = {"bytes": 0}
+        now = now_ms()
+        def merged():
+            last_key = None
+            for key, _, value in heapq.merge(*(_aged_items(table, age) for age, table in enumerate(inputs))):
+                if key == last_key: continue # Versi yang lebih lama dari tabel yang lebih tua
+                last_key = key
+                # Semua tabel ikut di-merge, jadi versi lama kunci yang dihapus atau kedaluwarsa juga ikut hilang
+                if self._raw_dead(value, now): continue
+                progress["bytes"] += len(key) + len(value)
+                if not self._throttle_compaction(progress["bytes"], started): raise _CompactionCancelled()
+                yield key, value
+        try:
+            # write_table me-rename hasil yang sudah lengkap ke .compacted: titik commit compaction ini
+            size = write_table(target.path + COMPACTED_SUFFIX, merged(), self.BLOCK_BYTES, self.BLOOM_BITS_PER_KEY,
+                               sum(table.num_keys for table in inputs), sync=True)
+        except _CompactionCancelled:
+            os.remove(target.path + COMPACTED_SUFFIX + TMP_SUFFIX)
+            return None
+        # Tabel input yang dihapus tetap terbaca oleh pembaca yang masih memegangnya (lewat mmap)
+        finish_compaction(target.path, [table.path for table in inputs])
+        output = SSTable(target.seq, target.path)
+        with self.lock:
+            # Tabel yang di-flush selama compaction tetap di depan (lebih baru)
+            self.tables = tuple(table for table in self.tables if table not in inputs) + (output,)
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        reclaimed = sum(table.size for table in inputs) - size
+        stats = self.compaction_stats
+        stats["runs"] += 1
+        stats["last_reclaimed_bytes"] = reclaimed
+        stats["total_reclaimed_bytes"] += reclaimed
+        stats["last_duration_ms"] = round(duration_ms, 2)
+        self.metrics.histogram("compaction_ms").observe(duration_ms)
+        self.metrics.counter("compaction_reclaimed_bytes").inc(reclaimed)
+        print(f"Partition-{self.partition_id} on Node-{self.node.node_id}: Compacted {len(inputs)} SSTables, "
+              f"reclaimed {reclaimed} bytes in {duration_ms:.1f} ms")
+        return reclaimed
+
+    def segment_stats(self) -> dict:
+        tables = self.tables
+        return {
+            "engine": self.STORAGE_ENGINE,
+            "tables": len(tables),
+            "total_bytes": sum(table.size for table in tables),
+            "resident_index_bytes": sum(table.resident_bytes() for table in tables),
+            "compaction": dict(self.compaction_stats),
+        }
+
+    def _close_cold_storage(self):
+        self.tables = ()
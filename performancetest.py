@@ -1,42 +1,81 @@
 # performancetest.py
 
 import os
+import json
+import math
 import shutil
+import argparse
 import time
 import multiprocessing
 import string
 import random
 import statistics
 import hashlib
-import matplotlib.pyplot as plt
+import tempfile
+import threading
+import io
+import contextlib
+import tracemalloc
+from types import SimpleNamespace
 from coordinator import Coordinator
-from config import CLUSTER_TOPOLOGY
+from hashring import HashRing, key_hash
+from config import CLUSTER_TOPOLOGY, FAILURE_TIMEOUT
 from node import start_node_process
+from partition import Partition, open_partition, STORAGE_ENGINES
+from sstable import SSTable, write_table
+from keyindex import CompactKeyIndex, SNAPSHOT_NAME
+from segment import make_location
+from config import SSTABLE_BLOCK_BYTES, SSTABLE_BLOOM_BITS_PER_KEY
+from serializer import Serializer
+from wal import DURABILITY_MODES, DURABILITY_NONE
+
+# Workload benchmark beban ala YCSB: proporsi GET (sisanya PUT) dan distribusi kunci yang diakses.
+# 'zipfian' memusatkan akses ke sedikit kunci panas (theta 0.99, sama seperti YCSB).
+LOAD_WORKLOADS = {
+    "read-heavy": {"read_ratio": 0.95, "distribution": "uniform"},
+    "write-heavy": {"read_ratio": 0.05, "distribution": "uniform"},
+    "balanced": {"read_ratio": 0.5, "distribution": "uniform"},
+    "zipfian": {"read_ratio": 0.95, "distribution": "zipfian"},
+}
+ZIPFIAN_THETA = 0.99
+LOAD_PERCENTILES = (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99), ("p999_ms", 0.999))
 
 # --- Helper Functions ---
+def _pyplot():
+    """matplotlib.pyplot dengan backend tanpa layar (grafik hanya disimpan ke file), atau None jika tidak terpasang."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("-> matplotlib tidak terpasang, grafik dilewati.")
+        return None
+    return plt
+
 def generate_random_data(key_len=10, val_len=50):
     """Menghasilkan pasangan key-value acak."""
     key = ''.join(random.choices(string.ascii_lowercase + string.digits, k=key_len))
     value = ''.join(random.choices(string.ascii_letters + string.digits + ' ', k=val_len))
     return key, value
 
-def setup_cluster():
-    """Menghidupkan semua node cluster di proses terpisah."""
+def setup_cluster(server_mode=None, topology=None):
+    """Menghidupkan semua node cluster di proses terpisah ('thread' atau 'asyncio', default dari config.py)."""
+    topology = topology or CLUSTER_TOPOLOGY
     # Bersihkan data lama
-    for node_id in CLUSTER_TOPOLOGY['nodes']:
+    for node_id in topology['nodes']:
         dir_path = f"data/node_{node_id}"
         if os.path.exists(dir_path): shutil.rmtree(dir_path)
 
     processes = []
-    for node_id, info in CLUSTER_TOPOLOGY['nodes'].items():
+    for node_id, info in topology['nodes'].items():
         process = multiprocessing.Process(
             target=start_node_process,
-            args=(node_id, info['host'], info['port'], CLUSTER_TOPOLOGY)
+            args=(node_id, info['host'], info['port'], topology, server_mode)
         )
         processes.append(process)
         process.start()
     
-    print("Starting all nodes...")
+    print(f"Starting all nodes (server mode: {server_mode or 'default'})...")
     time.sleep(3) # Beri waktu untuk semua node siap
     return processes
 
@@ -74,12 +113,12 @@ def benchmark_general_throughput(coordinator, num_operations=500):
         "num_operations": num_operations
     }
 
-def benchmark_hot_vs_cold(coordinator, num_partitions, num_ops=500):
+def benchmark_hot_vs_cold(coordinator, num_ops=500, charts=False):
     """Membandingkan latensi DAN throughput get dari hot vs cold storage."""
     print(f"Running: Hot vs Cold Storage benchmark ({num_ops} operasi)...")
 
     # 1. Setup: Buat 5 kunci 'dingin' (cold) dan 1 kunci 'panas' (hot)
-    keys_for_p0 = find_keys_for_partition(0, 6, num_partitions)
+    keys_for_p0 = find_keys_for_partition(0, 6)
     for i in range(5): coordinator.put(keys_for_p0[i], f"cold_value_{i}")
     time.sleep(1)
     coordinator.put(keys_for_p0[5], "hot_value")
@@ -105,51 +144,429 @@ def benchmark_hot_vs_cold(coordinator, num_partitions, num_ops=500):
     hot_duration = time.perf_counter() - start_time
     hot_throughput = num_ops / hot_duration
 
-    # 4. Buat dan tampilkan 2 grafik
-    # Grafik Latensi
-    plt.figure(1)
-    labels_lat = ['Hot Storage (Memori)', 'Cold Storage (Disk)']; latencies = [hot_latency, cold_latency]
-    bars_lat = plt.bar(labels_lat, latencies, color=['#3498db', '#e67e22'])
-    plt.ylabel('Latency (ms)'); plt.title('Perbandingan Latensi Hot vs Cold Storage')
-    plt.bar_label(bars_lat, fmt='%.4f ms')
-    plt.savefig('latency_hot_vs_cold.png')
-    print("-> Grafik perbandingan latensi akan muncul. Tutup untuk melanjutkan...")
-    plt.show()
-
-    # Grafik Throughput
-    plt.figure(2)
-    labels_tp = ['Hot Storage (Memori)', 'Cold Storage (Disk)']; throughputs = [hot_throughput, cold_throughput]
-    bars_tp = plt.bar(labels_tp, throughputs, color=['#2ecc71', '#e74c3c'])
-    plt.ylabel('Operasi / Detik'); plt.title('Perbandingan Throughput Hot vs Cold Storage')
-    plt.bar_label(bars_tp, fmt='%.2f ops/s')
-    plt.savefig('throughput_hot_vs_cold.png')
-    print("-> Grafik perbandingan throughput akan muncul. Tutup untuk melanjutkan...")
-    plt.show()
+    # 4. Simpan 2 grafik (opsional)
+    plt = _pyplot() if charts else None
+    if plt:
+        # Grafik Latensi
+        plt.figure(1)
+        labels_lat = ['Hot Storage (Memori)', 'Cold Storage (Disk)']; latencies = [hot_latency, cold_latency]
+        bars_lat = plt.bar(labels_lat, latencies, color=['#3498db', '#e67e22'])
+        plt.ylabel('Latency (ms)'); plt.title('Perbandingan Latensi Hot vs Cold Storage')
+        plt.bar_label(bars_lat, fmt='%.4f ms')
+        plt.savefig('latency_hot_vs_cold.png')
+
+        # Grafik Throughput
+        plt.figure(2)
+        labels_tp = ['Hot Storage (Memori)', 'Cold Storage (Disk)']; throughputs = [hot_throughput, cold_throughput]
+        bars_tp = plt.bar(labels_tp, throughputs, color=['#2ecc71', '#e74c3c'])
+        plt.ylabel('Operasi / Detik'); plt.title('Perbandingan Throughput Hot vs Cold Storage')
+        plt.bar_label(bars_tp, fmt='%.2f ops/s')
+        plt.savefig('throughput_hot_vs_cold.png')
+        print("-> Grafik disimpan di latency_hot_vs_cold.png dan throughput_hot_vs_cold.png")
 
     return {
         "hot_latency": hot_latency, "cold_latency": cold_latency,
-        "hot_throughput": hot_throughput, "cold_throughput": cold_throughput
+        "hot_throughput": hot_throughput, "cold_throughput": cold_throughput, "charts": bool(plt)
     }
 
-def test_fault_tolerance(coordinator, num_partitions, processes):
+def test_fault_tolerance(coordinator, processes):
+    """Mematikan leader Partisi 1 lalu mengukur waktu sampai GET dan PUT ke partisi itu berhasil lagi (failover)."""
     print("Running: Fault Tolerance simulation...")
-    key_to_test = find_keys_for_partition(1, 1, num_partitions)[0]
+    key_to_test, probe_key = find_keys_for_partition(1, 2)
     leader_id = CLUSTER_TOPOLOGY['partitions'][1]['leader']
     coordinator.put(key_to_test, "data_aman")
     time.sleep(2)
     leader_process = processes[leader_id]
     if leader_process.is_alive():
         leader_process.terminate(); leader_process.join()
-    response = coordinator.get(key_to_test)
-    return {"leader_killed": leader_id, "response_after_failure": response}
+
+    killed_at = time.perf_counter()
+    errors = 0; recovery_time = None; response = None
+    # Log routing setiap percobaan tidak ditampilkan
+    with contextlib.redirect_stdout(io.StringIO()):
+        while time.perf_counter() - killed_at < FAILURE_TIMEOUT * 5:
+            response = coordinator.get(key_to_test)
+            put_result = coordinator.put(probe_key, "probe")
+            if response == "data_aman" and put_result.startswith("SUCCESS"):
+                recovery_time = time.perf_counter() - killed_at
+                break
+            errors += 1
+            time.sleep(0.05)
+    return {"leader_killed": leader_id, "response_after_failure": response, "time_to_recovery": recovery_time,
+            "errors_during_failover": errors, "new_leader": coordinator.cluster_topology['partitions'][1]['leader']}
+
+def benchmark_durability_modes(num_writers=8, puts_per_writer=200):
+    """Membandingkan throughput PUT untuk tiap mode durabilitas WAL, langsung pada satu Partition (tanpa jaringan)."""
+    print(f"Running: Durability mode benchmark ({num_writers} penulis x {puts_per_writer} PUT)...")
+    results = {}
+    stand_in_node = SimpleNamespace(node_id="bench")
+    for mode in DURABILITY_MODES:
+        with tempfile.TemporaryDirectory() as data_dir:
+            # Role follower agar PUT tidak mencoba mereplikasi ke node lain
+            partition = Partition(0, data_dir, stand_in_node, 'follower', durability_mode=mode)
+            # Memtable diperbesar agar yang terukur adalah biaya WAL, bukan flush memtable kecil yang terus-menerus
+            partition.HOT_STORAGE_LIMIT = num_writers * puts_per_writer
+            def writer(writer_id):
+                for i in range(puts_per_writer):
+                    partition.put(f"w{writer_id}:{i}", generate_random_data()[1])
+            threads = [threading.Thread(target=writer, args=(w,)) for w in range(num_writers)]
+            start_time = time.perf_counter()
+            for t in threads: t.start()
+            for t in threads: t.join()
+            duration = time.perf_counter() - start_time
+            partition.close()
+        results[mode] = num_writers * puts_per_writer / duration
+    return results
+
+def benchmark_partition_contention(num_readers=8, duration=3, num_keys=5000):
+    """
+    GET dari banyak thread pembaca sementara satu thread penulis terus melakukan PUT ke partisi yang sama, langsung
+    pada satu Partition per storage engine (tanpa jaringan). Menunjukkan seberapa jauh pembaca tertahan oleh penulis.
+    """
+    print(f"Running: Partition contention benchmark ({num_readers} pembaca + 1 penulis, {duration} detik per engine)...")
+    results = {}
+    stand_in_node = SimpleNamespace(node_id="bench")
+    keys = [f"contention:{i}" for i in range(num_keys)]
+    for engine in STORAGE_ENGINES:
+        with tempfile.TemporaryDirectory() as data_dir, contextlib.redirect_stdout(io.StringIO()):
+            # Tanpa WAL, agar penulis tidak menunggu fsync dan memegang lock partisi sesering mungkin
+            partition = open_partition(0, data_dir, stand_in_node, 'follower', durability_mode=DURABILITY_NONE, storage_engine=engine)
+            # Memtable diperbesar agar yang terukur adalah contention, bukan ribuan flush (dan tabel) kecil
+            partition.HOT_STORAGE_LIMIT = 1000
+            for start in range(0, num_keys, 500):
+                partition.put_many([(key, generate_random_data()[1]) for key in keys[start:start + 500]])
+            while partition.flush_queue: time.sleep(0.01)
+            stop = threading.Event()
+            read_latencies = [[] for _ in range(num_readers)]
+            writes = [0]
+            def reader(latencies):
+                rng = random.Random()
+                while not stop.is_set():
+                    key = keys[rng.randrange(num_keys)]
+                    start_time = time.perf_counter()
+                    partition.get(key)
+                    latencies.append((time.perf_counter() - start_time) * 1000)
+            def writer():
+                rng = random.Random()
+                while not stop.is_set():
+                    partition.put(keys[rng.randrange(num_keys)], generate_random_data()[1])
+                    writes[0] += 1
+            threads = [threading.Thread(target=reader, args=(latencies,)) for latencies in read_latencies]
+            threads.append(threading.Thread(target=writer))
+            for t in threads: t.start()
+            time.sleep(duration)
+            stop.set()
+            for t in threads: t.join()
+            lock_wait = partition.metrics.histogram("lock_wait_ms").snapshot()
+            partition.close()
+        all_reads = [ms for latencies in read_latencies for ms in latencies]
+        results[engine] = {"read_ops": len(all_reads) / duration, "write_ops": writes[0] / duration,
+                           "read_latency": latency_summary(all_reads), "lock_waits": lock_wait["count"],
+                           "lock_wait_p99_ms": lock_wait["p99_ms"]}
+    return results
+
+def benchmark_serializer(num_values=2000):
+    """Microbenchmark Serializer per skema: kecepatan encode/decode dan rata-rata byte per value (tanpa jaringan/disk)."""
+    print(f"Running: Serializer benchmark ({num_values} value per skema)...")
+    def record(i):
+        return {"id": i, "name": generate_random_data()[1], "active": i % 2 == 0, "score": i * 1.5,
+                "tags": ["alpha", "beta", str(i)], "address": {"city": "Jakarta", "zip": 10000 + i}}
+    cases = {
+        "v1 (string)": (Serializer(), [generate_random_data()[1] for _ in range(num_values)]),
+        "v2 (data+timestamp)": (Serializer(), [{"data": generate_random_data()[1], "timestamp": i} for i in range(num_values)]),
+        "v3 (dict JSON)": (Serializer(dict_schema_version=3, compress_min_bytes=None), [record(i) for i in range(num_values)]),
+        "v4 (dict biner)": (Serializer(dict_schema_version=4, compress_min_bytes=None), [record(i) for i in range(num_values)]),
+        # Value besar yang berulang, tempat kompresi zlib paling terasa
+        "v3 besar": (Serializer(dict_schema_version=3, compress_min_bytes=None), [{"rows": [record(i)] * 20} for i in range(num_values // 10)]),
+        "v4 besar": (Serializer(dict_schema_version=4, compress_min_bytes=None), [{"rows": [record(i)] * 20} for i in range(num_values // 10)]),
+        "v4 besar + zlib": (Serializer(dict_schema_version=4, compress_min_bytes=1024), [{"rows": [record(i)] * 20} for i in range(num_values // 10)]),
+    }
+    results = {}
+    for name, (serializer, values) in cases.items():
+        start_time = time.perf_counter()
+        encoded = [serializer.encode_value(value) for value in values]
+        encode_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        for value_bytes in encoded: serializer.decode_to_value(value_bytes)
+        decode_time = time.perf_counter() - start_time
+        results[name] = {"encode_ops": len(values) / encode_time, "decode_ops": len(values) / decode_time,
+                         "avg_bytes": sum(map(len, encoded)) / len(encoded)}
+    return results
+
+def benchmark_index_memory(num_keys=200000):
+    """
+    Memori index cold storage per juta kunci: dict semua kunci, index hash ringkas (engine 'log') dan sparse index
+    + bloom (engine 'sstable'). Juga waktu startup partisi 'log' dari snapshot index vs dari file hint.
+    """
+    print(f"Running: Index memory benchmark ({num_keys} kunci)...")
+    keys = sorted(f"user:{i:010d}" for i in range(num_keys))
+    value_bytes = Serializer().encode_value(generate_random_data()[1])
+    tracemalloc.start()
+    # Kunci dibuat ulang di dalam pengukuran, karena di engine 'log' string kuncinya memang tinggal di memori
+    dict_index = {key.encode('utf-8').decode('utf-8'): make_location(0, i * 80) for i, key in enumerate(keys)}
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del dict_index
+    tracemalloc.start()
+    compact_index = CompactKeyIndex()
+    for i, key in enumerate(keys): compact_index[key] = i
+    compact_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del compact_index
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, "bench.sst")
+        write_table(path, ((key, value_bytes) for key in keys), SSTABLE_BLOCK_BYTES, SSTABLE_BLOOM_BITS_PER_KEY, num_keys, sync=False)
+        tracemalloc.start()
+        table = SSTable(1, path)
+        table_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        table.map.close()
+        startup = {}
+        stand_in_node = SimpleNamespace(node_id="bench")
+        with contextlib.redirect_stdout(io.StringIO()):
+            partition = Partition(0, data_dir, stand_in_node, 'follower')
+            for start in range(0, num_keys, 1000):
+                partition.put_many([(key, "x" * 32) for key in keys[start:start + 1000]])
+            partition.close()
+            for source in ("snapshot", "hints"):
+                if source == "hints": os.remove(os.path.join(partition.data_dir, SNAPSHOT_NAME))
+                start_time = time.perf_counter()
+                partition = Partition(0, data_dir, stand_in_node, 'follower')
+                startup[source] = (time.perf_counter() - start_time) * 1000
+                partition.close()
+    per_million = 1000000 / num_keys / (1024 * 1024)
+    return {"num_keys": num_keys, "dict_mb_per_million": dict_bytes * per_million,
+            "compact_mb_per_million": compact_bytes * per_million, "sstable_mb_per_million": table_bytes * per_million,
+            "startup_snapshot_ms": startup["snapshot"], "startup_hints_ms": startup["hints"]}
+
+def replica_topology(num_replicas):
+    """Topologi dengan num_replicas replika per partisi: leader sama seperti config.py, follower adalah node-node berikutnya."""
+    node_ids = sorted(CLUSTER_TOPOLOGY['nodes'])
+    partitions = {}
+    for p_id, roles in CLUSTER_TOPOLOGY['partitions'].items():
+        start = node_ids.index(roles['leader'])
+        followers = [node_ids[(start + i) % len(node_ids)] for i in range(1, num_replicas)]
+        partitions[p_id] = {"leader": roles['leader'], "followers": followers}
+    return {"nodes": CLUSTER_TOPOLOGY['nodes'], "partitions": partitions}
+
+def benchmark_follower_reads(num_keys=200, num_readers=8, reads_per_reader=250, charts=False):
+    """Mengukur throughput GET untuk tiap policy routing baca saat jumlah replika per partisi ditambah."""
+    print(f"Running: Follower read benchmark ({num_readers} pembaca x {reads_per_reader} GET)...")
+    results = {}
+    for num_replicas in range(1, len(CLUSTER_TOPOLOGY['nodes']) + 1):
+        topology = replica_topology(num_replicas)
+        processes = setup_cluster(topology=topology)
+        try:
+            data = dict(generate_random_data() for _ in range(num_keys))
+            Coordinator(topology).mput(data)
+            time.sleep(1) # Beri waktu replikasi ke follower
+            keys = list(data)
+            for policy in ("leader", "round-robin", "least-outstanding"):
+                coordinator = Coordinator(topology, read_policy=policy)
+                def reader():
+                    for _ in range(reads_per_reader): coordinator.get(random.choice(keys))
+                threads = [threading.Thread(target=reader) for _ in range(num_readers)]
+                # Log routing per GET tidak ikut diukur
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start_time = time.perf_counter()
+                    for t in threads: t.start()
+                    for t in threads: t.join()
+                    duration = time.perf_counter() - start_time
+                results.setdefault(policy, {})[num_replicas] = num_readers * reads_per_reader / duration
+        finally:
+            shutdown_cluster(processes)
+
+    plt = _pyplot() if charts else None
+    if plt:
+        plt.figure(3)
+        for policy, by_replicas in results.items():
+            plt.plot(list(by_replicas), list(by_replicas.values()), marker='o', label=policy)
+        plt.xlabel('Replika per Partisi'); plt.ylabel('GET / Detik'); plt.title('Throughput Baca vs Jumlah Replika')
+        plt.xticks(list(results['leader'])); plt.legend()
+        plt.savefig('follower_read_scaling.png')
+        print("-> Grafik disimpan di follower_read_scaling.png")
+    return results
+
+def benchmark_key_movement(num_keys=100000):
+    """Persentase kunci yang berpindah partisi saat satu partisi ditambahkan: modulo vs hash ring."""
+    print(f"Running: Key movement benchmark ({num_keys} kunci)...")
+    partitions = CLUSTER_TOPOLOGY['partitions']
+    grown = {**partitions, max(partitions) + 1: partitions[0]}
+    keys = [f"movekey:{i}" for i in range(num_keys)]
+    hashes = [int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) for key in keys]
+    moved_modulo = sum(h % len(partitions) != h % len(grown) for h in hashes)
+    before, after = HashRing(partitions), HashRing(grown)
+    moved_ring = sum(before.partition_for_hash(key_hash(key)) != after.partition_for_hash(key_hash(key)) for key in keys)
+    return {"partitions_before": len(partitions), "partitions_after": len(grown),
+            "modulo": moved_modulo / num_keys * 100, "ring": moved_ring / num_keys * 100}
+
+# --- Benchmark beban (banyak klien konkuren) ---
+class ZipfianGenerator:
+    """
+    Indeks 0..n-1 berdistribusi Zipfian (algoritma Gray et al., sama seperti YCSB): indeks kecil jauh lebih sering
+    muncul. Kunci tidak perlu diacak ulang karena partisinya sudah ditentukan oleh hash kunci.
+    """
+    def __init__(self, n: int, theta: float = ZIPFIAN_THETA):
+        self.n, self.theta = n, theta
+        self.zetan = sum(1.0 / (i ** theta) for i in range(1, n + 1))
+        self.alpha = 1.0 / (1.0 - theta)
+        zeta2 = 1.0 + 0.5 ** theta
+        self.eta = (1.0 - (2.0 / n) ** (1.0 - theta)) / (1.0 - zeta2 / self.zetan)
+
+    def next(self, rng) -> int:
+        u = rng.random()
+        uz = u * self.zetan
+        if uz < 1.0: return 0
+        if uz < 1.0 + 0.5 ** self.theta: return 1
+        return min(self.n - 1, int(self.n * (self.eta * u - self.eta + 1.0) ** self.alpha))
+
+def load_key(i: int, key_size: int) -> str:
+    """Kunci ke-i dengan panjang tetap key_size, mis. user0000000042."""
+    return f"user{i:0{max(1, key_size - 4)}d}"
+
+def _load_client(topology, read_ratio, zipfian, records, key_size, values, start_at, duration, seed, read_policy=None):
+    """
+    Satu klien benchmark beban dengan Coordinator sendiri. Menunggu sampai start_at (time.time() bersama) agar semua
+    klien mulai serentak, lalu mengirim GET/PUT selama duration detik. Latensi dicatat per operasi dalam ms.
+    """
+    rng = random.Random(seed)
+    coordinator = Coordinator(topology, read_policy=read_policy)
+    read_ms, update_ms, timeline, errors = [], [], [], 0
+    time.sleep(max(0.0, start_at - time.time()))
+    started = time.perf_counter()
+    deadline = started + duration
+    while True:
+        op_start = time.perf_counter()
+        if op_start >= deadline: break
+        key = load_key(zipfian.next(rng) if zipfian else rng.randrange(records), key_size)
+        if rng.random() < read_ratio:
+            result = coordinator.get(key); latencies = read_ms
+            failed = result is None or isinstance(result, str) and result.startswith(("Error", "ERROR", "SERVER_ERROR"))
+        else:
+            result = coordinator.put(key, rng.choice(values)); latencies = update_ms
+            failed = not result.startswith("SUCCESS")
+        op_end = time.perf_counter()
+        latencies.append((op_end - op_start) * 1000)
+        second = int(op_end - started)
+        while len(timeline) <= second: timeline.append(0)
+        timeline[second] += 1
+        errors += failed
+    return {"read_ms": read_ms, "update_ms": update_ms, "timeline": timeline, "errors": errors}
+
+def _load_client_process(*args):
+    # Log routing Coordinator per operasi dibuang di dalam proses klien
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return _load_client(*args)
+
+def latency_summary(latencies) -> dict:
+    """Persentil nearest-rank (tepat, dari semua sampel), rata-rata dan maksimum dalam ms."""
+    if not latencies: return {"count": 0}
+    ordered = sorted(latencies)
+    summary = {"count": len(ordered), "mean_ms": statistics.fmean(ordered), "max_ms": ordered[-1]}
+    for name, q in LOAD_PERCENTILES:
+        summary[name] = ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+    return summary
+
+def preload_records(topology, records, key_size, values, batch_size=1000):
+    """Mengisi records kunci awal lewat MPUT agar GET pada benchmark beban tidak membaca kunci kosong."""
+    coordinator = Coordinator(topology)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for start in range(0, records, batch_size):
+            coordinator.mput({load_key(i, key_size): values[i % len(values)] for i in range(start, min(records, start + batch_size))})
+
+def benchmark_load(topology, workload_names, client_counts, client_mode="thread", duration=10, records=10000,
+                   key_size=16, value_size=100, distribution=None, read_policy=None):
+    """
+    Benchmark beban ala YCSB: untuk setiap workload dan setiap jumlah klien, menjalankan klien konkuren (thread atau
+    proses) selama duration detik terhadap cluster yang sudah berjalan. Kunci diisi dulu lewat preload_records.
+    distribution menimpa distribusi kunci bawaan workload ('uniform' atau 'zipfian').
+    """
+    values = [''.join(random.choices(string.ascii_letters + string.digits, k=value_size)) for _ in range(64)]
+    print(f"Running: Load benchmark (preload {records} kunci, key {key_size} byte, value {value_size} byte)...")
+    preload_records(topology, records, key_size, values)
+    zipfian = None
+    results = []
+    for name in workload_names:
+        workload = LOAD_WORKLOADS[name]
+        dist = distribution or workload['distribution']
+        if dist == "zipfian" and zipfian is None: zipfian = ZipfianGenerator(records)
+        for num_clients in client_counts:
+            print(f"  - {name} ({dist}), {num_clients} klien {client_mode}, {duration} detik...")
+            # Proses klien butuh waktu lebih lama untuk dibuat sebelum semuanya siap mulai serentak
+            start_at = time.time() + (2.0 if client_mode == "process" else 0.5)
+            args = [(topology, workload['read_ratio'], zipfian if dist == "zipfian" else None, records, key_size, values,
+                     start_at, duration, random.randrange(1 << 30), read_policy) for _ in range(num_clients)]
+            if client_mode == "process":
+                with multiprocessing.Pool(num_clients) as pool:
+                    outputs = pool.starmap(_load_client_process, args)
+            else:
+                outputs = [None] * num_clients
+                def run(i):
+                    outputs[i] = _load_client(*args[i])
+                threads = [threading.Thread(target=run, args=(i,)) for i in range(num_clients)]
+                # redirect_stdout berlaku untuk seluruh proses, jadi dipasang sekali di sini, bukan per thread
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    for t in threads: t.start()
+                    for t in threads: t.join()
+            read_ms = [ms for output in outputs for ms in output['read_ms']]
+            update_ms = [ms for output in outputs for ms in output['update_ms']]
+            timeline = [0] * max(len(output['timeline']) for output in outputs)
+            for output in outputs:
+                for second, count in enumerate(output['timeline']): timeline[second] += count
+            total_ops = len(read_ms) + len(update_ms)
+            results.append({
+                "workload": name, "distribution": dist, "clients": num_clients, "client_mode": client_mode,
+                "duration_s": duration, "ops": total_ops, "throughput": total_ops / duration,
+                "errors": sum(output['errors'] for output in outputs), "timeline": timeline,
+                "latency": {"read": latency_summary(read_ms), "update": latency_summary(update_ms),
+                            "all": latency_summary(read_ms + update_ms)},
+            })
+    return results
+
+def compare_load_results(baseline, results) -> list:
+    """Perubahan throughput dan p99 (%) terhadap hasil JSON sebelumnya, dicocokkan per (workload, klien, mode)."""
+    def run_key(run): return run['workload'], run['distribution'], run['clients'], run['client_mode']
+    previous = {run_key(run): run for run in baseline.get("load", [])}
+    comparison = []
+    for run in results:
+        old = previous.get(run_key(run))
+        if not old: continue
+        old_p99, new_p99 = old['latency']['all'].get('p99_ms'), run['latency']['all'].get('p99_ms')
+        comparison.append({
+            "workload": run['workload'], "clients": run['clients'], "client_mode": run['client_mode'],
+            "throughput_change_pct": (run['throughput'] - old['throughput']) / old['throughput'] * 100 if old['throughput'] else None,
+            "p99_change_pct": (new_p99 - old_p99) / old_p99 * 100 if old_p99 and new_p99 is not None else None,
+        })
+    return comparison
+
+def save_load_charts(results):
+    """Menyimpan throughput per detik (load_timeline.png) dan throughput/p99 per jumlah klien (load_scaling.png)."""
+    plt = _pyplot()
+    if not plt: return
+    plt.figure(4)
+    for run in results:
+        plt.plot(range(1, len(run['timeline']) + 1), run['timeline'], label=f"{run['workload']} x{run['clients']}")
+    plt.xlabel('Detik'); plt.ylabel('Operasi / Detik'); plt.title('Throughput per Detik'); plt.legend()
+    plt.savefig('load_timeline.png')
+    plt.figure(5, figsize=(12, 5))
+    names = list(dict.fromkeys(run['workload'] for run in results))
+    for position, (ylabel, metric) in enumerate((('Operasi / Detik', lambda run: run['throughput']),
+                                                  ('p99 (ms)', lambda run: run['latency']['all'].get('p99_ms', 0))), 1):
+        plt.subplot(1, 2, position)
+        for name in names:
+            runs = [run for run in results if run['workload'] == name]
+            plt.plot([run['clients'] for run in runs], [metric(run) for run in runs], marker='o', label=name)
+        plt.xlabel('Jumlah Klien'); plt.ylabel(ylabel); plt.legend()
+    plt.savefig('load_scaling.png')
+    print("-> Grafik disimpan di load_timeline.png dan load_scaling.png")
 
 # --- Helper dari test.py ---
-def find_keys_for_partition(target_partition_id, num_keys, num_partitions):
+def find_keys_for_partition(target_partition_id, num_keys):
+    ring = HashRing(CLUSTER_TOPOLOGY['partitions'])
     keys = []; i = 0
     while len(keys) < num_keys:
         key_candidate = f"testkey:{i}"
-        hash_val = int(hashlib.sha1(key_candidate.encode('utf-8')).hexdigest(), 16)
-        if (hash_val % num_partitions) == target_partition_id:
+        if ring.partition_for(key_candidate) == target_partition_id:
             keys.append(key_candidate)
         i += 1
     return keys
@@ -176,31 +593,156 @@ def print_summary_report(results):
         print("\n[ Perbandingan Hot vs Cold Storage ]")
         print(f"  - Latency GET (Hot): {hc_res['hot_latency']:.4f} ms | Throughput GET (Hot): {hc_res['hot_throughput']:.2f} ops/s")
         print(f"  - Latency GET (Cold): {hc_res['cold_latency']:.4f} ms | Throughput GET (Cold): {hc_res['cold_throughput']:.2f} ops/s")
-        print("  - Dua grafik perbandingan telah disimpan (latency & throughput).")
+        if hc_res['charts']: print("  - Dua grafik perbandingan telah disimpan (latency & throughput).")
     
+    # Laporan Mode Durabilitas
+    dur_res = results.get("durability")
+    if dur_res:
+        print("\n[ Throughput PUT per Mode Durabilitas (WAL) ]")
+        for mode, throughput in dur_res.items():
+            print(f"  - {mode}: {throughput:.2f} operasi/detik")
+
+    # Laporan Contention Partisi
+    con_res = results.get("contention")
+    if con_res:
+        print("\n[ Contention Partisi (banyak pembaca + 1 penulis) ]")
+        for engine, res in con_res.items():
+            lat = res['read_latency']
+            print(f"  - {engine}: GET {res['read_ops']:.0f} ops/s (p50 {lat.get('p50_ms', 0):.3f} | p99 {lat.get('p99_ms', 0):.3f} | "
+                  f"p999 {lat.get('p999_ms', 0):.3f} ms) | PUT {res['write_ops']:.0f} ops/s | "
+                  f"{res['lock_waits']} kali menunggu lock (p99 {res['lock_wait_p99_ms']:.3f} ms)")
+
+    # Laporan Perpindahan Kunci
+    km_res = results.get("key_movement")
+    if km_res:
+        print(f"\n[ Kunci yang Berpindah Saat Partisi Ditambah ({km_res['partitions_before']} -> {km_res['partitions_after']}) ]")
+        print(f"  - Modulo: {km_res['modulo']:.1f}% kunci")
+        print(f"  - Hash ring (virtual node): {km_res['ring']:.1f}% kunci")
+
+    # Laporan Serializer
+    ser_res = results.get("serializer")
+    if ser_res:
+        print("\n[ Serializer per Skema ]")
+        for name, res in ser_res.items():
+            print(f"  - {name}: encode {res['encode_ops']:.0f} ops/s | decode {res['decode_ops']:.0f} ops/s | "
+                  f"{res['avg_bytes']:.1f} byte/value")
+
+    # Laporan Memori Index
+    mem_res = results.get("index_memory")
+    if mem_res:
+        print(f"\n[ Memori Index Cold Storage per Juta Kunci (diukur dengan {mem_res['num_keys']} kunci) ]")
+        print(f"  - Dict semua kunci (index lama engine 'log'): {mem_res['dict_mb_per_million']:.1f} MB")
+        print(f"  - Engine 'log' (index hash ringkas): {mem_res['compact_mb_per_million']:.1f} MB")
+        print(f"  - Engine 'sstable' (sparse index + bloom filter): {mem_res['sstable_mb_per_million']:.1f} MB")
+        print(f"  - Startup partisi 'log': {mem_res['startup_snapshot_ms']:.1f} ms dari snapshot index, "
+              f"{mem_res['startup_hints_ms']:.1f} ms dari file hint")
+
+    # Laporan Follower Read
+    fr_res = results.get("follower_reads")
+    if fr_res:
+        print("\n[ Throughput GET per Policy Routing Baca ]")
+        for policy, by_replicas in fr_res.items():
+            scaling = " | ".join(f"{n} replika: {tp:.2f} ops/s" for n, tp in by_replicas.items())
+            print(f"  - {policy}: {scaling}")
+
+    # Laporan Benchmark Beban
+    load_res = results.get("load")
+    if load_res:
+        print("\n[ Benchmark Beban (Klien Konkuren) ]")
+        for run in load_res:
+            lat = run['latency']['all']
+            print(f"  - {run['workload']} ({run['distribution']}), {run['clients']} klien {run['client_mode']}: "
+                  f"{run['throughput']:.2f} ops/s, {run['errors']} error")
+            if lat['count']:
+                print(f"      latency p50 {lat['p50_ms']:.3f} | p95 {lat['p95_ms']:.3f} | p99 {lat['p99_ms']:.3f} | "
+                      f"p999 {lat['p999_ms']:.3f} | max {lat['max_ms']:.3f} ms")
+            for kind in ("read", "update"):
+                if run['latency'][kind]['count']:
+                    print(f"      {kind}: {run['latency'][kind]['count']} op, p99 {run['latency'][kind]['p99_ms']:.3f} ms")
+    for change in results.get("load_comparison", []):
+        throughput = "n/a" if change['throughput_change_pct'] is None else f"{change['throughput_change_pct']:+.1f}%"
+        p99 = "n/a" if change['p99_change_pct'] is None else f"{change['p99_change_pct']:+.1f}%"
+        print(f"  - vs baseline {change['workload']} x{change['clients']} {change['client_mode']}: throughput {throughput}, p99 {p99}")
+
     # Laporan Fault Tolerance
     ft_res = results.get("fault_tolerance")
     if ft_res:
         print("\n[ Uji Fault Tolerance ]")
         print(f"  - Simulasi: Node {ft_res['leader_killed']} (leader) dimatikan.")
         print(f"  - Hasil GET setelah kegagalan: {ft_res['response_after_failure']}")
-        print("  - Kesimpulan: GET gagal karena tidak ada failover otomatis, membuktikan data aman di replika.")
+        if ft_res['time_to_recovery'] is not None:
+            print(f"  - Failover ke Node {ft_res['new_leader']}: pulih dalam {ft_res['time_to_recovery']:.2f} detik, "
+                  f"{ft_res['errors_during_failover']} percobaan GET/PUT gagal selama failover.")
+        else:
+            print(f"  - Partisi belum pulih, {ft_res['errors_during_failover']} percobaan GET/PUT gagal.")
         
     print("\n==============================================")
     print("      BENCHMARK SELESAI")
     print("==============================================")
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark kv-store. Tanpa --load, seluruh rangkaian benchmark dijalankan.")
+    parser.add_argument("server_mode", nargs="?", choices=("thread", "asyncio"), help="mode server node (default dari config.py)")
+    parser.add_argument("--load", help=f"hanya benchmark beban untuk workload ini (dipisah koma): {', '.join(LOAD_WORKLOADS)}")
+    parser.add_argument("--clients", default="1,4,16", help="jumlah klien konkuren, dipisah koma untuk sweep (default 1,4,16)")
+    parser.add_argument("--client-mode", choices=("thread", "process"), default="thread", help="klien sebagai thread atau proses")
+    parser.add_argument("--duration", type=float, default=10, help="lama tiap run beban dalam detik")
+    parser.add_argument("--records", type=int, default=10000, help="jumlah kunci yang diisi sebelum benchmark beban")
+    parser.add_argument("--key-size", type=int, default=16, help="panjang kunci (byte)")
+    parser.add_argument("--value-size", type=int, default=100, help="panjang value (byte)")
+    parser.add_argument("--distribution", choices=("uniform", "zipfian"), help="menimpa distribusi kunci bawaan workload")
+    parser.add_argument("--replicas", type=int, default=1, help="replika per partisi untuk benchmark beban")
+    parser.add_argument("--read-policy", choices=("leader", "round-robin", "least-outstanding"), help="policy routing GET klien beban")
+    parser.add_argument("--json", help="menulis semua hasil ke file JSON ini")
+    parser.add_argument("--baseline", help="file JSON hasil run sebelumnya untuk dibandingkan (throughput dan p99)")
+    parser.add_argument("--charts", action="store_true", help="menyimpan grafik ke file PNG (butuh matplotlib)")
+    args = parser.parse_args(argv)
+    args.load = [name.strip() for name in args.load.split(",")] if args.load else None
+    unknown = [name for name in args.load or () if name not in LOAD_WORKLOADS]
+    if unknown: parser.error(f"workload tidak dikenal: {', '.join(unknown)}")
+    args.clients = [int(n) for n in args.clients.split(",")]
+    return args
+
 if __name__ == "__main__":
-    processes = setup_cluster()
-    coordinator = Coordinator(CLUSTER_TOPOLOGY)
-    num_partitions = len(CLUSTER_TOPOLOGY['partitions'])
+    # python performancetest.py [thread|asyncio] [--load read-heavy,zipfian --clients 1,8,32 --json hasil.json ...]
+    args = parse_args()
     all_results = {}
-    
-    # Ganti nama fungsi benchmark pertama
-    all_results["general_throughput"] = benchmark_general_throughput(coordinator)
-    all_results["hot_cold"] = benchmark_hot_vs_cold(coordinator, num_partitions)
-    all_results["fault_tolerance"] = test_fault_tolerance(coordinator, num_partitions, processes)
-    
-    shutdown_cluster(processes)
-    print_summary_report(all_results)
\ No newline at end of file
+    load_options = dict(client_mode=args.client_mode, duration=args.duration, records=args.records, key_size=args.key_size,
+                        value_size=args.value_size, distribution=args.distribution, read_policy=args.read_policy)
+    if args.load:
+        topology = replica_topology(args.replicas) if args.replicas > 1 else CLUSTER_TOPOLOGY
+        processes = setup_cluster(args.server_mode, topology)
+        try:
+            all_results["load"] = benchmark_load(topology, args.load, args.clients, **load_options)
+        finally:
+            shutdown_cluster(processes)
+    else:
+        processes = setup_cluster(args.server_mode)
+        coordinator = Coordinator(CLUSTER_TOPOLOGY)
+
+        # Ganti nama fungsi benchmark pertama
+        all_results["general_throughput"] = benchmark_general_throughput(coordinator)
+        all_results["hot_cold"] = benchmark_hot_vs_cold(coordinator, charts=args.charts)
+        all_results["durability"] = benchmark_durability_modes()
+        all_results["contention"] = benchmark_partition_contention()
+        all_results["key_movement"] = benchmark_key_movement()
+        all_results["serializer"] = benchmark_serializer()
+        all_results["index_memory"] = benchmark_index_memory()
+        # Run beban singkat sebelum uji fault tolerance mematikan salah satu leader
+        all_results["load"] = benchmark_load(CLUSTER_TOPOLOGY, list(LOAD_WORKLOADS), args.clients,
+                                             **dict(load_options, duration=min(args.duration, 5)))
+        all_results["fault_tolerance"] = test_fault_tolerance(coordinator, processes)
+
+        shutdown_cluster(processes)
+        # Benchmark follower read menjalankan cluster-nya sendiri (dengan jumlah replika berbeda)
+        all_results["follower_reads"] = benchmark_follower_reads(charts=args.charts)
+    if args.charts: save_load_charts(all_results["load"])
+    if args.baseline:
+        with open(args.baseline) as f:
+            all_results["load_comparison"] = compare_load_results(json.load(f), all_results["load"])
+    print_summary_report(all_results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2, default=str)
+        print(f"Hasil disimpan di {args.json}")
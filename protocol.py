@@ -0,0 +1,171 @@
+# protocol.py
+import struct
+
+# Protokol biner antara klien dan node. Setiap pesan tetap dibungkus frame [panjang (4b)] dari network.py,
+# lalu isi frame-nya:
+#   Request : [opcode (1b)] [request_id (4b)] [partition_id (2b)] [key_len (2b)] [value_len (4b)] [key] [value]
+#   Response: [status (1b)] [request_id (4b)] [body]
+# Value dikirim dalam bentuk bytes hasil Serializer apa adanya, sehingga tidak perlu json.loads/json.dumps.
+# Opcode sengaja dibuat < 0x20 agar tidak pernah bentrok dengan karakter pertama perintah teks (PUT, GET, ...).
+
+REQUEST_HEADER = struct.Struct('!BIHHI')
+RESPONSE_HEADER = struct.Struct('!BI')
+
+# Request batch (MGET/MPUT/MREPLICATE/MDELETE) membawa banyak entri di bagian value, key di header dikosongkan:
+#   Entri  : [partition_id (2b)] [key_len (2b)] [value_len (4b)] [key] [value]
+#   Balasan: [status (1b)] [body_len (4b)] [body] untuk setiap entri, urutannya sama dengan request
+BATCH_ENTRY_HEADER = struct.Struct('!HHI')
+BATCH_RESULT_HEADER = struct.Struct('!BI')
+
+# REPLICATE_STREAM dikirim oleh stream replikasi leader; partition_id ada di header request, key dikosongkan:
+#   Value: [stream_id (8b)] lalu entri [seq (8b)] [key_len (2b)] [value_len (4b)] [key] [value]
+# stream_id berubah setiap leader start, sehingga follower tahu kapan nomor urut dimulai lagi dari awal.
+REPLICATION_STREAM_HEADER = struct.Struct('!Q')
+REPLICATION_ENTRY_HEADER = struct.Struct('!QHI')
+
+# REPLICATE_RESYNC mengirim ulang seluruh isi partisi leader ke follower yang kehilangan entri stream, per halaman:
+#   Value: [stream_id (8b)] [resync_seq (8b)] [flag (1b)] lalu entri batch (value TOMBSTONE_BYTES = kunci sudah dihapus)
+# Setelah halaman terakhir, follower melanjutkan stream dari entri resync_seq + 1.
+RESYNC_PAGE_HEADER = struct.Struct('!QQB')
+RESYNC_FIRST = 0x01
+RESYNC_LAST = 0x02
+
+# Balasan MIGRATE_PULL: [cursor berikutnya (8b)] lalu entri batch (partition_id berisi partisi tujuan migrasi).
+MIGRATION_CURSOR = struct.Struct('!Q')
+
+# SCAN membawa JSON {"start", "end", "prefix", "cursor", "limit"} di bagian value request. Balasan:
+#   [ada halaman berikutnya (1b)] [cursor_len (2b)] [cursor] lalu entri batch urut menurut kunci
+# cursor adalah kunci terakhir yang sudah diperiksa node; halaman berikutnya dimulai tepat setelahnya.
+SCAN_PAGE_HEADER = struct.Struct('!BH')
+
+# PUT_CHUNK membawa satu potongan value besar (bytes Serializer) yang dikirim bertahap; key di header seperti PUT:
+#   Value: [upload_id (8b)] [offset potongan (8b)] [ukuran total value (8b)] [potongan]
+# Offset membuat potongan boleh diproses tidak berurutan; begitu semua byte diterima, value-nya di-PUT seperti OP_PUT.
+PUT_CHUNK_HEADER = struct.Struct('!QQQ')
+
+OP_PUT = 0x01
+OP_GET = 0x02
+OP_REPLICATE = 0x03
+OP_STATUS = 0x04
+OP_HEX = 0x05
+OP_MGET = 0x06
+OP_MPUT = 0x07
+OP_MREPLICATE = 0x08
+OP_REPLICATE_STREAM = 0x09
+OP_REPLICATION_LAG = 0x0A
+OP_HEARTBEAT = 0x0B
+OP_TOPOLOGY = 0x0C
+OP_MIGRATE_PULL = 0x0D
+OP_ADD_PARTITION = 0x0E
+OP_SCAN = 0x0F
+OP_DELETE = 0x10
+OP_MDELETE = 0x11
+OP_PUT_CHUNK = 0x12
+OP_REPLICATE_RESYNC = 0x13
+OPCODES = {OP_PUT, OP_GET, OP_REPLICATE, OP_STATUS, OP_HEX, OP_MGET, OP_MPUT, OP_MREPLICATE, OP_REPLICATE_STREAM,
+           OP_REPLICATION_LAG, OP_HEARTBEAT, OP_TOPOLOGY, OP_MIGRATE_PULL, OP_ADD_PARTITION, OP_SCAN, OP_DELETE, OP_MDELETE,
+           OP_PUT_CHUNK, OP_REPLICATE_RESYNC}
+# Nama setiap opcode, dipakai sebagai label metrik per perintah (STATS)
+OPCODE_NAMES = {opcode: name[3:] for name, opcode in globals().items() if name.startswith('OP_') and opcode in OPCODES}
+
+STATUS_OK = 0
+STATUS_NOT_FOUND = 1
+STATUS_ERROR = 2
+
+def is_binary(payload: bytes) -> bool:
+    return len(payload) >= REQUEST_HEADER.size and payload[0] in OPCODES
+
+def encode_request(opcode: int, request_id: int, partition_id: int, key: str, value: bytes = b'') -> bytes:
+    key_bytes = key.encode('utf-8')
+    return REQUEST_HEADER.pack(opcode, request_id, partition_id, len(key_bytes), len(value)) + key_bytes + value
+
+def decode_request(payload: bytes):
+    opcode, request_id, partition_id, key_len, value_len = REQUEST_HEADER.unpack_from(payload)
+    key_end = REQUEST_HEADER.size + key_len
+    if key_end + value_len != len(payload):
+        raise ValueError("Malformed request frame.")
+    key = payload[REQUEST_HEADER.size:key_end].decode('utf-8')
+    return opcode, request_id, partition_id, key, payload[key_end:]
+
+def encode_response(status: int, request_id: int, body: bytes = b'') -> bytes:
+    return RESPONSE_HEADER.pack(status, request_id) + body
+
+def decode_response(payload: bytes):
+    status, request_id = RESPONSE_HEADER.unpack_from(payload)
+    return status, request_id, payload[RESPONSE_HEADER.size:]
+
+def encode_batch(entries) -> bytes:
+    """entries: iterable (partition_id, key, value_bytes)."""
+    parts = []
+    for partition_id, key, value in entries:
+        key_bytes = key.encode('utf-8')
+        parts.append(BATCH_ENTRY_HEADER.pack(partition_id, len(key_bytes), len(value)))
+        parts.append(key_bytes); parts.append(value)
+    return b''.join(parts)
+
+def decode_batch(body: bytes):
+    entries = []; offset = 0
+    while offset < len(body):
+        partition_id, key_len, value_len = BATCH_ENTRY_HEADER.unpack_from(body, offset)
+        offset += BATCH_ENTRY_HEADER.size
+        key = body[offset:offset + key_len].decode('utf-8'); offset += key_len
+        entries.append((partition_id, key, body[offset:offset + value_len])); offset += value_len
+    return entries
+
+def encode_batch_results(results) -> bytes:
+    """results: iterable (status, body_bytes), satu untuk setiap entri request."""
+    return b''.join(BATCH_RESULT_HEADER.pack(status, len(body)) + body for status, body in results)
+
+def decode_batch_results(body: bytes):
+    results = []; offset = 0
+    while offset < len(body):
+        status, body_len = BATCH_RESULT_HEADER.unpack_from(body, offset)
+        offset += BATCH_RESULT_HEADER.size
+        results.append((status, body[offset:offset + body_len])); offset += body_len
+    return results
+
+def encode_replication_batch(stream_id: int, entries) -> bytes:
+    """entries: iterable (seq, key, value_bytes), urut berdasarkan seq."""
+    parts = [REPLICATION_STREAM_HEADER.pack(stream_id)]
+    for seq, key, value in entries:
+        key_bytes = key.encode('utf-8')
+        parts.append(REPLICATION_ENTRY_HEADER.pack(seq, len(key_bytes), len(value)))
+        parts.append(key_bytes); parts.append(value)
+    return b''.join(parts)
+
+def decode_replication_batch(body: bytes):
+    stream_id, = REPLICATION_STREAM_HEADER.unpack_from(body)
+    entries = []; offset = REPLICATION_STREAM_HEADER.size
+    while offset < len(body):
+        seq, key_len, value_len = REPLICATION_ENTRY_HEADER.unpack_from(body, offset)
+        offset += REPLICATION_ENTRY_HEADER.size
+        key = body[offset:offset + key_len].decode('utf-8'); offset += key_len
+        entries.append((seq, key, body[offset:offset + value_len])); offset += value_len
+    return stream_id, entries
+
+def encode_resync_page(stream_id: int, resync_seq: int, flags: int, partition_id: int, entries) -> bytes:
+    """entries: iterable (key, value_bytes)."""
+    return (RESYNC_PAGE_HEADER.pack(stream_id, resync_seq, flags)
+            + encode_batch((partition_id, key, value) for key, value in entries))
+
+def decode_resync_page(body: bytes):
+    """Kebalikan encode_resync_page: (stream_id, resync_seq, flags, [(key, value_bytes), ...])."""
+    stream_id, resync_seq, flags = RESYNC_PAGE_HEADER.unpack_from(body)
+    return stream_id, resync_seq, flags, [(key, value) for _, key, value in decode_batch(body[RESYNC_PAGE_HEADER.size:])]
+
+def encode_scan_page(partition_id: int, entries, cursor) -> bytes:
+    """entries: [(key, value_bytes), ...]; cursor None berarti rentangnya sudah habis."""
+    cursor_bytes = (cursor or '').encode('utf-8')
+    return (SCAN_PAGE_HEADER.pack(cursor is not None, len(cursor_bytes)) + cursor_bytes
+            + encode_batch((partition_id, key, value) for key, value in entries))
+
+def decode_scan_page(body: bytes):
+    """Kebalikan encode_scan_page: ([(key, value_bytes), ...], cursor atau None)."""
+    more, cursor_len = SCAN_PAGE_HEADER.unpack_from(body)
+    cursor_end = SCAN_PAGE_HEADER.size + cursor_len
+    cursor = body[SCAN_PAGE_HEADER.size:cursor_end].decode('utf-8') if more else None
+    return [(key, value) for _, key, value in decode_batch(body[cursor_end:])], cursor
+
+def status_for_message(message: str) -> int:
+    """Memetakan pesan balasan handler Node ('SUCCESS: ...', 'ERROR: ...') ke status biner."""
+    return STATUS_OK if message.startswith("SUCCESS") else STATUS_ERROR
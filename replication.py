@@ -0,0 +1,184 @@
+# replication.py
+import threading
+import time
+from collections import deque
+import protocol
+from network import send_binary_request
+from metrics import MetricsRegistry
+from serializer import TOMBSTONE_BYTES
+from config import (REPLICATION_QUEUE_MAX_ENTRIES, REPLICATION_BATCH_MAX_ENTRIES, REPLICATION_RETRY_INTERVAL,
+                    REPLICATION_DRAIN_TIMEOUT)
+
+# Penanda di pesan error follower yang menolak batch karena nomor urutnya tidak menyambung
+RESYNC_REQUIRED = "Resync required"
+
+class ReplicationGapError(Exception):
+    """Batch replikasi tidak menyambung dengan entri terakhir yang diterapkan follower (ada entri yang hilang)."""
+    def __init__(self, applied_seq, first_seq):
+        super().__init__(f"{RESYNC_REQUIRED}: applied up to seq {applied_seq}, received seq {first_seq}.")
+
+class ReplicationStream:
+    """
+    Pengirim replikasi yang hidup selama node berjalan untuk satu (partisi, follower).
+    Write leader masuk ke antrean terbatas bersama nomor urutnya, lalu satu thread mengirimkannya sebagai
+    frame REPLICATE_STREAM berisi banyak entri. Batch berikutnya baru dikirim setelah batch sebelumnya
+    di-ack, sehingga follower menerapkan write persis dalam urutan leader. Jika ada entri yang terpaksa dibuang
+    (atau follower melaporkan celah nomor urut), seluruh isi partisi dikirim ulang lewat resync.
+    """
+    MAX_QUEUE_ENTRIES = REPLICATION_QUEUE_MAX_ENTRIES
+    MAX_BATCH_ENTRIES = REPLICATION_BATCH_MAX_ENTRIES
+    RETRY_INTERVAL = REPLICATION_RETRY_INTERVAL
+    DRAIN_TIMEOUT = REPLICATION_DRAIN_TIMEOUT
+
+    def __init__(self, stream_id: int, partition, follower_id: int, host: str, port: int):
+        self.stream_id = stream_id
+        self.partition = partition
+        self.partition_id = partition_id = partition.partition_id
+        self.follower_id = follower_id
+        self.host = host
+        self.port = port
+        self.queue = deque() # (seq, key, value_bytes, waktu masuk antrean), termasuk batch yang sedang dikirim
+        self.last_seq = 0
+        self.acked_seq = 0
+        self.batches_sent = 0
+        self.dropped = 0
+        self.resyncs = 0
+        # True jika follower kehilangan entri: antrean tidak lagi dipakai sampai resync dimulai
+        self.resync_pending = False
+        self.failures = 0
+        self.last_error = None
+        # Metrik untuk STATS: lama pengiriman satu batch sampai di-ack follower, dan jumlah entri yang terkirim
+        self.metrics = MetricsRegistry(partition=partition_id, follower=follower_id)
+        self.batch_latency = self.metrics.histogram("replication_batch_ms")
+        self.entries_sent = self.metrics.counter("replication_entries")
+        # False setelah pengiriman gagal: penulis tidak lagi ditahan, write yang tidak muat dibuang
+        self.healthy = True
+        self.closing = False
+        self.cond = threading.Condition()
+        self.closed_event = threading.Event()
+        self.sender = threading.Thread(target=self._sender_loop)
+        self.sender.daemon = True; self.sender.start()
+
+    def wait_for_capacity(self):
+        """Backpressure: menahan penulis selama antrean penuh dan follower masih bisa dihubungi."""
+        with self.cond:
+            while len(self.queue) >= self.MAX_QUEUE_ENTRIES and self.healthy and not self.closing:
+                self.cond.wait()
+
+    def enqueue(self, entries):
+        """entries: [(seq, key, value_bytes), ...] urut berdasarkan seq. Dipanggil di bawah lock partisi."""
+        now = time.monotonic()
+        with self.cond:
+            self.last_seq = entries[-1][0]
+            if not self.resync_pending and not self.healthy and len(self.queue) >= self.MAX_QUEUE_ENTRIES:
+                # Follower tertinggal terlalu jauh: antrean dibuang, follower disusulkan lewat resync begitu terhubung lagi
+                self._mark_resync()
+            if self.resync_pending:
+                # Resync mengirim isi partisi terbaru, jadi entri sebelum titik resync tidak perlu diantrekan
+                self.dropped += len(entries)
+                return
+            for seq, key, value_bytes in entries:
+                self.queue.append((seq, key, value_bytes, now))
+            self.cond.notify_all()
+
+    def _mark_resync(self):
+        """Lock stream (cond) harus sudah dipegang."""
+        self.dropped += len(self.queue)
+        self.queue.clear()
+        self.resync_pending = True
+        self.cond.notify_all()
+
+    def _sender_loop(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.resync_pending and not self.closing:
+                    self.cond.wait()
+                # Setelah batas waktu close() lewat, sisa antrean tidak dikirim lagi; resync tidak dimulai saat close
+                if self.closed_event.is_set() or (self.closing if self.resync_pending else not self.queue): return
+                resync = self.resync_pending
+                # Entri tetap di antrean sampai di-ack; jika gagal, batch yang sama dikirim ulang
+                batch = [self.queue[i] for i in range(min(len(self.queue), self.MAX_BATCH_ENTRIES))]
+            if resync:
+                status, response = self._resync()
+            else:
+                body = protocol.encode_replication_batch(self.stream_id, ((seq, key, value) for seq, key, value, _ in batch))
+                started = time.perf_counter()
+                status, response = send_binary_request(self.host, self.port, protocol.OP_REPLICATE_STREAM,
+                                                       self.partition_id, '', body)
+                self.batch_latency.observe((time.perf_counter() - started) * 1000)
+            with self.cond:
+                if status == protocol.STATUS_OK:
+                    if not resync:
+                        # Antrean bisa dikosongkan selama pengiriman (resync), jadi yang dilepas dicocokkan lewat seq
+                        while self.queue and self.queue[0][0] <= batch[-1][0]: self.queue.popleft()
+                        self.acked_seq = batch[-1][0]
+                        self.batches_sent += 1
+                        self.entries_sent.inc(len(batch))
+                    self.healthy = True
+                    self.cond.notify_all()
+                    continue
+                self.failures += 1
+                self.metrics.counter("replication_failures").inc()
+                self.last_error = response.decode('utf-8', errors='replace')
+                if RESYNC_REQUIRED in self.last_error:
+                    # Follower bisa dihubungi tetapi kehilangan entri: kirim ulang seluruh isi partisi
+                    self._mark_resync()
+                    continue
+                self.healthy = False
+                self.cond.notify_all()
+                if self.closing: return
+            self.closed_event.wait(self.RETRY_INTERVAL)
+
+    def _resync(self):
+        """
+        Mengirim seluruh isi partisi ke follower per halaman REPLICATE_RESYNC (lihat Partition.apply_resync).
+        Titik resync diambil di bawah lock partisi, sama seperti enqueue, sehingga write sesudahnya masuk antrean
+        dan dikirim setelah resync selesai. Mengembalikan (status, body) halaman terakhir yang dikirim;
+        jika gagal, stream ditandai untuk resync lagi dari awal.
+        """
+        with self.partition.lock, self.cond:
+            resync_seq = self.last_seq
+            self.resync_pending = False
+        print(f"Replication to Node-{self.follower_id} for Partition-{self.partition_id}: resyncing up to seq {resync_seq}")
+        keys = sorted(self.partition.all_keys())
+        for start in range(0, max(len(keys), 1), self.MAX_BATCH_ENTRIES):
+            page = keys[start:start + self.MAX_BATCH_ENTRIES]
+            values = self.partition.get_raw_many(page)
+            flags = (protocol.RESYNC_FIRST if start == 0 else 0) | (protocol.RESYNC_LAST if start + len(page) >= len(keys) else 0)
+            # Kunci yang hilang sejak snapshot diambil (DELETE, TTL) dikirim sebagai tombstone
+            body = protocol.encode_resync_page(self.stream_id, resync_seq, flags, self.partition_id,
+                                               ((key, value if value is not None else TOMBSTONE_BYTES) for key, value in zip(page, values)))
+            status, response = send_binary_request(self.host, self.port, protocol.OP_REPLICATE_RESYNC, self.partition_id, '', body)
+            if status != protocol.STATUS_OK:
+                with self.cond: self._mark_resync()
+                return status, response
+        with self.cond:
+            self.acked_seq = resync_seq
+            self.resyncs += 1
+        return status, response
+
+    def stats(self) -> dict:
+        with self.cond:
+            lag_ms = (time.monotonic() - self.queue[0][3]) * 1000 if self.queue else 0.0
+            return {
+                "last_seq": self.last_seq, "acked_seq": self.acked_seq,
+                "lag_entries": len(self.queue), "lag_ms": round(lag_ms, 2),
+                "batches_sent": self.batches_sent, "dropped": self.dropped,
+                "resyncs": self.resyncs, "resync_pending": self.resync_pending,
+                "failures": self.failures, "healthy": self.healthy, "last_error": self.last_error,
+            }
+
+    def metrics_snapshot(self) -> dict:
+        """Metrik stream untuk STATS, dengan lag saat ini sebagai gauge."""
+        stats = self.stats()
+        self.metrics.gauge("replication_lag_entries").set(stats["lag_entries"])
+        self.metrics.gauge("replication_lag_ms").set(stats["lag_ms"])
+        return self.metrics.snapshot()
+
+    def close(self, timeout=None):
+        """Berhenti menerima write; sisa antrean masih dikirim paling lama `timeout` detik (default DRAIN_TIMEOUT)."""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.sender.join(self.DRAIN_TIMEOUT if timeout is None else timeout)
+        self.closed_event.set()
@@ -0,0 +1,160 @@
+# segment.py
+import os
+import re
+import struct
+import zlib
+
+# Record di file segmen: [record_len (4b)] [key_len (4b)] [key] [value], record_len tidak termasuk 4 byte pertama
+RECORD_HEADER = struct.Struct('!II')
+
+# Segmen aktif (yang sedang ditulis) selalu bernama segment.log. Begitu melewati batas ukuran,
+# segmen itu ditutup dengan nama segment_<seq>.log dan segment.log baru dibuat.
+ACTIVE_SEGMENT_NAME = "segment.log"
+_CLOSED_SEGMENT_RE = re.compile(r'^segment_(\d+)\.log$')
+COMPACT_SUFFIX = ".compact"
+# Hasil compaction yang sudah lengkap di disk di-rename menjadi <file hasil>.compacted sebelum file input dihapus.
+# Rename itu titik commit-nya: jika node mati sesudahnya, startup menyelesaikan penggantiannya (finish_compaction),
+# sehingga file input tidak pernah dimuat bersama hasil yang tombstone dan record kedaluwarsanya sudah dibuang.
+COMPACTED_SUFFIX = ".compacted"
+
+# File hint (segment.hint / segment_<seq>.hint) menyimpan index sebuah segmen tanpa value, agar startup
+# tidak perlu membaca seluruh log. Isinya blok-blok append-only, satu blok per flush:
+#   Blok : [panjang_isi (4b)] [crc32 isi (4b)] [entri...]
+#   Entri: [offset (8b)] [record_len (4b)] [key_len (4b)] [key]
+HINT_BLOCK_HEADER = struct.Struct('!II')
+HINT_ENTRY = struct.Struct('!QII')
+
+# Lokasi sebuah record di index disimpan sebagai satu int: [file_no] [offset (40 bit)]
+OFFSET_BITS = 40
+_OFFSET_MASK = (1 << OFFSET_BITS) - 1
+
+def make_location(file_no: int, offset: int) -> int:
+    return (file_no << OFFSET_BITS) | offset
+
+def split_location(location: int):
+    return location >> OFFSET_BITS, location & _OFFSET_MASK
+
+def closed_segment_name(seq: int) -> str:
+    return f"segment_{seq:06d}.log"
+
+def encode_record(key_bytes: bytes, value_bytes: bytes) -> bytes:
+    return RECORD_HEADER.pack(4 + len(key_bytes) + len(value_bytes), len(key_bytes)) + key_bytes + value_bytes
+
+def hint_path_for(segment_path: str) -> str:
+    return segment_path[:-len(".log")] + ".hint"
+
+def encode_hint_block(entries) -> bytes:
+    """entries: iterable (key_bytes, offset, record_len)."""
+    body = b''.join(HINT_ENTRY.pack(offset, record_len, len(key_bytes)) + key_bytes
+                    for key_bytes, offset, record_len in entries)
+    return HINT_BLOCK_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+def read_hint_file(path: str):
+    """
+    Membaca file hint: ([(key, offset, record_len), ...], utuh). Pembacaan berhenti di blok pertama yang
+    terpotong atau checksum-nya salah; entri sebelum blok itu tetap dikembalikan dan `utuh` bernilai False.
+    """
+    entries = []
+    if not os.path.exists(path): return entries, True
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        if offset + HINT_BLOCK_HEADER.size > len(data): return entries, False
+        body_len, checksum = HINT_BLOCK_HEADER.unpack_from(data, offset)
+        body = data[offset + HINT_BLOCK_HEADER.size:offset + HINT_BLOCK_HEADER.size + body_len]
+        if len(body) < body_len or zlib.crc32(body) != checksum: return entries, False
+        position = 0
+        while position < body_len:
+            record_offset, record_len, key_len = HINT_ENTRY.unpack_from(body, position)
+            position += HINT_ENTRY.size
+            entries.append((body[position:position + key_len].decode('utf-8'), record_offset, record_len))
+            position += key_len
+        offset += HINT_BLOCK_HEADER.size + body_len
+    return entries, True
+
+def iter_records(buf, start=0):
+    """Mengiterasi record lengkap di buffer: (offset, key, record_end). Berhenti di record terakhir yang terpotong."""
+    offset = start
+    end = len(buf)
+    while offset + RECORD_HEADER.size <= end:
+        record_len, key_len = RECORD_HEADER.unpack_from(buf, offset)
+        record_end = offset + 4 + record_len
+        if record_end > end: break
+        key = bytes(buf[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + key_len]).decode('utf-8')
+        yield offset, key, record_end
+        offset = record_end
+
+def list_closed_segments(data_dir: str):
+    """Segmen tertutup di direktori partisi, diurutkan dari yang paling lama: [(seq, path), ...]."""
+    segments = []
+    for name in os.listdir(data_dir):
+        match = _CLOSED_SEGMENT_RE.match(name)
+        if match: segments.append((int(match.group(1)), os.path.join(data_dir, name)))
+    return sorted(segments)
+
+def finish_compaction(output_path: str, replaced_paths):
+    """
+    Memasang hasil compaction yang sudah di-commit (output_path + COMPACTED_SUFFIX): file yang digantikannya dihapus
+    lebih dulu, baru hasilnya di-rename ke output_path (hasil kosong dibuang bersama output_path). Aman diulang.
+    """
+    pending = output_path + COMPACTED_SUFFIX
+    for path in replaced_paths:
+        if path != output_path and os.path.exists(path): os.remove(path)
+    if os.path.getsize(pending):
+        os.replace(pending, output_path)
+    else:
+        if os.path.exists(output_path): os.remove(output_path)
+        os.remove(pending)
+
+def pending_compactions(data_dir: str, listed):
+    """
+    Compaction yang sudah di-commit tetapi belum selesai dipasang saat node mati: [(path hasil, [path input]), ...].
+    Inputnya semua file di listed ([(seq, path)] dari yang paling lama) dengan seq <= seq hasil. Jika file hasilnya
+    sudah tidak ada (hasil kosong), semua inputnya juga sudah dihapus.
+    """
+    seqs = {path: seq for seq, path in listed}
+    pending = []
+    for name in os.listdir(data_dir):
+        if not name.endswith(COMPACTED_SUFFIX): continue
+        output_path = os.path.join(data_dir, name[:-len(COMPACTED_SUFFIX)])
+        output_seq = seqs.get(output_path)
+        pending.append((output_path, [] if output_seq is None else [path for seq, path in listed if seq <= output_seq]))
+    return pending
+
+class FileRegion:
+    """
+    Potongan sebuah file (value besar di segmen) yang dikirim ke socket dengan sendfile, tanpa disalin ke memori
+    Python. head adalah byte yang dikirim tepat sebelum isinya dalam frame yang sama (header balasan protokol).
+    File-nya milik objek ini: tetap bisa dibaca walau segmennya di-rename atau dihapus compaction, dan ditutup
+    oleh pengirimnya lewat close().
+    """
+    __slots__ = ('file', 'offset', 'length', 'head')
+    def __init__(self, file, offset: int, length: int, head: bytes = b''):
+        self.file = file
+        self.offset = offset
+        self.length = length
+        self.head = head
+
+    def read(self) -> bytes:
+        """Isi region sebagai bytes, untuk pemanggil yang tidak bisa memakai sendfile."""
+        return os.pread(self.file.fileno(), self.length, self.offset)
+
+    def close(self):
+        self.file.close()
+
+class Segment:
+    """
+    Satu file segmen di disk. `file_no` adalah nomor unik di memori (tidak pernah dipakai ulang) yang
+    disimpan di index, sedangkan `seq` menentukan urutan umur segmen saat index dibangun ulang.
+    """
+    def __init__(self, file_no: int, seq: int, path: str):
+        self.file_no = file_no
+        self.seq = seq
+        self.path = path
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.map = None # mmap read-only, dibuat saat pertama kali dibaca
+
+    @property
+    def hint_path(self) -> str:
+        return hint_path_for(self.path)
@@ -1,53 +1,260 @@
-# serializer.py
-
-import struct
-import json
-from typing import Any, Dict, Union
-
-class Serializer:
-    """
-    Mengatasi encoding dan decoding key-value pairs.
-    Evolusi skema dengan memanfaatkan byte versi.
-    """
-    def encode_value(self, value: Union[str, Dict[str, Any]]) -> bytes:
-        if isinstance(value, dict) and 'data' in value and 'timestamp' in value:
-            schema_version = 2
-            data_bytes = value['data'].encode('utf-8')
-            timestamp = value['timestamp']
-            # Format: [version (1b)] [data_len (4b)] [data] [timestamp (8b)]
-            return struct.pack(f'!B I {len(data_bytes)}s Q', schema_version, len(data_bytes), data_bytes, timestamp)
-        elif isinstance(value, str):
-            schema_version = 1
-            value_bytes = value.encode('utf-8')
-            # Format: [version (1b)] [value_len (4b)] [value]
-            return struct.pack(f'!B I {len(value_bytes)}s', schema_version, len(value_bytes), value_bytes)
-        elif isinstance(value, dict):
-            schema_version = 3
-            # Ubah dict menjadi string JSON, lalu encode ke bytes
-            value_json_str = json.dumps(value)
-            value_bytes = value_json_str.encode('utf-8')
-            # Format: [versi (1b)] [panjang_json (4b)] [json_string_bytes]
-            return struct.pack(f'!B I {len(value_bytes)}s', schema_version, len(value_bytes), value_bytes)
-        else:
-            raise TypeError("Value type not supported for encoding.")
-
-    def decode_value(self, value_bytes: bytes) -> Dict[str, Any]:
-        schema_version, = struct.unpack('!B', value_bytes[0:1])
-        if schema_version == 1:
-            value_len, = struct.unpack('!I', value_bytes[1:5])
-            value_str, = struct.unpack(f'!{value_len}s', value_bytes[5:5 + value_len])
-            return {'schema_version': 1, 'value': value_str.decode('utf-8')}
-        elif schema_version == 2:
-            data_len, = struct.unpack('!I', value_bytes[1:5])
-            data_end_offset = 5 + data_len
-            data_str, = struct.unpack(f'!{data_len}s', value_bytes[5:data_end_offset])
-            timestamp, = struct.unpack('!Q', value_bytes[data_end_offset:data_end_offset + 8])
-            return {'schema_version': 2, 'data': data_str.decode('utf-8'), 'timestamp': timestamp}
-        elif schema_version == 3:
-            value_len, = struct.unpack('!I', value_bytes[1:5])
-            value_json_str_bytes, = struct.unpack(f'!{value_len}s', value_bytes[5:5 + value_len])
-            # Decode bytes ke string JSON, lalu parse JSON ke dictionary
-            original_dict = json.loads(value_json_str_bytes.decode('utf-8'))
-            return {'schema_version': 3, 'value': original_dict}
-        else:
-            raise ValueError(f"Unknown schema version: {schema_version}")
\ No newline at end of file
+# serializer.py
+
+import struct
+import json
+import zlib
+from typing import Any, Dict, Union
+from config import SERIALIZER_DICT_SCHEMA_VERSION, SERIALIZER_COMPRESS_MIN_BYTES
+
+# Struct dikompilasi sekali di sini, bukan membangun string format baru di setiap pemanggilan.
+_VERSION = struct.Struct('!B')
+_LENGTH = struct.Struct('!I')
+_TIMESTAMP = struct.Struct('!Q')
+_EXPIRES_AT = struct.Struct('!Q')
+
+# Bit tertinggi byte versi menandai body (semua byte setelah byte versi) dikompresi dengan zlib.
+COMPRESSED_FLAG = 0x80
+# Bit berikutnya menandai value ber-TTL: [versi | EXPIRES_FLAG (1b)] [expires_at ms sejak epoch (8b)] [body].
+# Waktu kedaluwarsa ikut tersimpan di setiap salinan value (WAL, replikasi, segmen, SSTable).
+EXPIRES_FLAG = 0x40
+# Value khusus untuk kunci yang dihapus (tombstone): hanya byte versi 0 tanpa body. Disimpan, di-WAL, dan
+# direplikasi seperti value biasa, tetapi tidak pernah di-decode.
+TOMBSTONE_BYTES = _VERSION.pack(0)
+
+# Tag untuk encoding biner skema 4. Setiap value diawali satu byte tag. String, list dan dict pendek
+# (< 256 byte/elemen) memakai panjang 1 byte, sisanya 4 byte. Kunci dict ditulis [panjang (1b)] [utf-8],
+# atau [0xFF] [panjang (4b)] [utf-8] untuk kunci sepanjang 255 byte atau lebih.
+_TAG_NONE, _TAG_TRUE, _TAG_FALSE = 0x00, 0x01, 0x02
+_TAG_INT8, _TAG_INT64, _TAG_BIGINT, _TAG_FLOAT = 0x03, 0x04, 0x05, 0x06
+_TAG_STR8, _TAG_STR32, _TAG_LIST8, _TAG_LIST32, _TAG_DICT8, _TAG_DICT32 = 0x07, 0x08, 0x09, 0x0A, 0x0B, 0x0C
+_LONG_KEY = 0xFF
+_SHORT = struct.Struct('!BB') # [tag] [panjang]
+_LONG = struct.Struct('!BI')
+_TAGGED_INT8 = struct.Struct('!Bb')
+_TAGGED_INT64 = struct.Struct('!Bq')
+_TAGGED_FLOAT = struct.Struct('!Bd')
+_CONSTANTS = {None: bytes([_TAG_NONE]), True: bytes([_TAG_TRUE]), False: bytes([_TAG_FALSE])}
+
+def _encode_str(value, out):
+    data = value.encode('utf-8')
+    out += _SHORT.pack(_TAG_STR8, len(data)) if len(data) < 256 else _LONG.pack(_TAG_STR32, len(data))
+    out += data
+
+def _encode_int(value, out):
+    if -128 <= value < 128: out += _TAGGED_INT8.pack(_TAG_INT8, value)
+    elif -2**63 <= value < 2**63: out += _TAGGED_INT64.pack(_TAG_INT64, value)
+    else:
+        # Integer di luar 64 bit disimpan sebagai teks desimal, seperti di JSON
+        data = str(value).encode('ascii')
+        out += _LONG.pack(_TAG_BIGINT, len(data)); out += data
+
+def _encode_float(value, out):
+    out += _TAGGED_FLOAT.pack(_TAG_FLOAT, value)
+
+def _encode_list(value, out):
+    out += _SHORT.pack(_TAG_LIST8, len(value)) if len(value) < 256 else _LONG.pack(_TAG_LIST32, len(value))
+    for item in value: _ENCODERS.get(type(item), _encode_other)(item, out)
+
+def _encode_dict(value, out):
+    out += _SHORT.pack(_TAG_DICT8, len(value)) if len(value) < 256 else _LONG.pack(_TAG_DICT32, len(value))
+    for key, item in value.items():
+        if type(key) is not str: raise TypeError("Compact encoding only supports string dict keys.")
+        data = key.encode('utf-8')
+        if len(data) < _LONG_KEY: out.append(len(data))
+        else: out.append(_LONG_KEY); out += _LENGTH.pack(len(data))
+        out += data
+        _ENCODERS.get(type(item), _encode_other)(item, out)
+
+def _encode_other(value, out):
+    # Subclass (mis. bool, OrderedDict) dan tipe yang tidak didukung
+    if value is None or value is True or value is False: out += _CONSTANTS[value]
+    elif isinstance(value, str): _encode_str(value, out)
+    elif isinstance(value, int): _encode_int(value, out)
+    elif isinstance(value, float): _encode_float(value, out)
+    elif isinstance(value, (list, tuple)): _encode_list(value, out)
+    elif isinstance(value, dict): _encode_dict(value, out)
+    else: raise TypeError(f"Value type {type(value).__name__} not supported for compact encoding.")
+
+# Dispatch berdasarkan tipe persis; bool dan None ditangani _encode_other
+_ENCODERS = {str: _encode_str, int: _encode_int, float: _encode_float, list: _encode_list, tuple: _encode_list,
+             dict: _encode_dict}
+
+def _decode_compact(data, offset: int):
+    """Mengembalikan (value, offset setelah value)."""
+    tag = data[offset]
+    if tag == _TAG_STR8:
+        end = offset + 2 + data[offset + 1]
+        return str(data[offset + 2:end], 'utf-8'), end
+    if tag == _TAG_DICT8 or tag == _TAG_DICT32:
+        if tag == _TAG_DICT8: count = data[offset + 1]; offset += 2
+        else: count = _LENGTH.unpack_from(data, offset + 1)[0]; offset += 5
+        result = {}
+        for _ in range(count):
+            length = data[offset]; offset += 1
+            if length == _LONG_KEY: length, = _LENGTH.unpack_from(data, offset); offset += 4
+            key = str(data[offset:offset + length], 'utf-8')
+            result[key], offset = _decode_compact(data, offset + length)
+        return result, offset
+    if tag == _TAG_INT8: return _TAGGED_INT8.unpack_from(data, offset)[1], offset + 2
+    if tag == _TAG_INT64: return _TAGGED_INT64.unpack_from(data, offset)[1], offset + 9
+    if tag == _TAG_FLOAT: return _TAGGED_FLOAT.unpack_from(data, offset)[1], offset + 9
+    if tag == _TAG_LIST8 or tag == _TAG_LIST32:
+        if tag == _TAG_LIST8: count = data[offset + 1]; offset += 2
+        else: count = _LENGTH.unpack_from(data, offset + 1)[0]; offset += 5
+        result = []
+        for _ in range(count):
+            item, offset = _decode_compact(data, offset)
+            result.append(item)
+        return result, offset
+    if tag == _TAG_STR32 or tag == _TAG_BIGINT:
+        length, = _LENGTH.unpack_from(data, offset + 1)
+        end = offset + 5 + length
+        text = str(data[offset + 5:end], 'utf-8')
+        return (text if tag == _TAG_STR32 else int(text)), end
+    if tag == _TAG_NONE: return None, offset + 1
+    if tag == _TAG_TRUE: return True, offset + 1
+    if tag == _TAG_FALSE: return False, offset + 1
+    raise ValueError(f"Unknown compact value tag: {tag}")
+
+class Serializer:
+    """
+    Mengatasi encoding dan decoding key-value pairs.
+    Evolusi skema dengan memanfaatkan byte versi.
+
+    dict_schema_version menentukan format dict biasa: 4 (biner ringkas) atau 3 (teks JSON, untuk cluster yang
+    masih punya node versi lama). Value yang hasil encode-nya >= compress_min_bytes dikompresi dengan zlib
+    jika hasilnya lebih kecil (None = tanpa kompresi). Semua versi selalu bisa di-decode.
+    """
+    def __init__(self, dict_schema_version=None, compress_min_bytes=SERIALIZER_COMPRESS_MIN_BYTES):
+        self.dict_schema_version = dict_schema_version or SERIALIZER_DICT_SCHEMA_VERSION
+        if self.dict_schema_version not in (3, 4):
+            raise ValueError(f"Unsupported dict schema version: {self.dict_schema_version}")
+        self.compress_min_bytes = compress_min_bytes
+
+    def encode_value(self, value: Union[str, Dict[str, Any]], expires_at: int = None) -> bytes:
+        encoded = self._encode_uncompressed(value)
+        if self.compress_min_bytes is not None and len(encoded) >= self.compress_min_bytes:
+            # Format: [versi | COMPRESSED_FLAG (1b)] [zlib(body)]
+            compressed = zlib.compress(memoryview(encoded)[1:])
+            if len(compressed) + 1 < len(encoded):
+                encoded = _VERSION.pack(encoded[0] | COMPRESSED_FLAG) + compressed
+        if expires_at is not None:
+            return _VERSION.pack(encoded[0] | EXPIRES_FLAG) + _EXPIRES_AT.pack(expires_at) + encoded[1:]
+        return encoded
+
+    @staticmethod
+    def string_header(length: int, expires_at: int = None) -> bytes:
+        """
+        Awal hasil encode_value untuk string UTF-8 sepanjang length byte (tanpa kompresi), agar value besar bisa
+        dikirim bertahap: header ini lalu isi string-nya per potongan.
+        """
+        if expires_at is None: return _VERSION.pack(1) + _LENGTH.pack(length)
+        return _VERSION.pack(1 | EXPIRES_FLAG) + _EXPIRES_AT.pack(expires_at) + _LENGTH.pack(length)
+
+    @staticmethod
+    def expires_at_of(value_bytes) -> int:
+        """expires_at (ms sejak epoch) dari value hasil encode_value, atau None jika tanpa TTL. Tidak men-decode body."""
+        return _EXPIRES_AT.unpack_from(value_bytes, 1)[0] if value_bytes[0] & EXPIRES_FLAG else None
+
+    @staticmethod
+    def is_tombstone(value_bytes) -> bool:
+        return value_bytes[0] == TOMBSTONE_BYTES[0]
+
+    def _encode_uncompressed(self, value) -> bytes:
+        if isinstance(value, dict) and 'data' in value and 'timestamp' in value:
+            data_bytes = value['data'].encode('utf-8')
+            # Format: [version (1b)] [data_len (4b)] [data] [timestamp (8b)]
+            return b''.join((_VERSION.pack(2), _LENGTH.pack(len(data_bytes)), data_bytes, _TIMESTAMP.pack(value['timestamp'])))
+        elif isinstance(value, str):
+            value_bytes = value.encode('utf-8')
+            # Format: [version (1b)] [value_len (4b)] [value]
+            return b''.join((_VERSION.pack(1), _LENGTH.pack(len(value_bytes)), value_bytes))
+        elif isinstance(value, dict):
+            if self.dict_schema_version == 4:
+                # Format: [versi (1b)] [dict biner bertag, lihat _encode_dict]
+                out = bytearray(_VERSION.pack(4))
+                try:
+                    _encode_dict(value, out)
+                    return bytes(out)
+                except TypeError:
+                    pass # Mis. key dict bukan string: tetap disimpan sebagai JSON (skema 3)
+            # Ubah dict menjadi string JSON, lalu encode ke bytes
+            value_bytes = json.dumps(value).encode('utf-8')
+            # Format: [versi (1b)] [panjang_json (4b)] [json_string_bytes]
+            return b''.join((_VERSION.pack(3), _LENGTH.pack(len(value_bytes)), value_bytes))
+        else:
+            raise TypeError("Value type not supported for encoding.")
+
+    def decode_value(self, value_bytes: bytes) -> Dict[str, Any]:
+        schema_version = value_bytes[0]
+        if schema_version & EXPIRES_FLAG:
+            schema_version &= ~EXPIRES_FLAG
+            value_bytes = _VERSION.pack(schema_version) + value_bytes[1 + _EXPIRES_AT.size:]
+        if schema_version & COMPRESSED_FLAG:
+            schema_version &= ~COMPRESSED_FLAG
+            value_bytes = _VERSION.pack(schema_version) + zlib.decompress(memoryview(value_bytes)[1:])
+        if schema_version == 1:
+            value_len, = _LENGTH.unpack_from(value_bytes, 1)
+            return {'schema_version': 1, 'value': str(value_bytes[5:5 + value_len], 'utf-8')}
+        elif schema_version == 2:
+            data_len, = _LENGTH.unpack_from(value_bytes, 1)
+            data_end_offset = 5 + data_len
+            timestamp, = _TIMESTAMP.unpack_from(value_bytes, data_end_offset)
+            return {'schema_version': 2, 'data': str(value_bytes[5:data_end_offset], 'utf-8'), 'timestamp': timestamp}
+        elif schema_version == 3:
+            value_len, = _LENGTH.unpack_from(value_bytes, 1)
+            # Decode bytes ke string JSON, lalu parse JSON ke dictionary
+            original_dict = json.loads(str(value_bytes[5:5 + value_len], 'utf-8'))
+            return {'schema_version': 3, 'value': original_dict}
+        elif schema_version == 4:
+            original_dict, _ = _decode_compact(value_bytes, 1)
+            return {'schema_version': 4, 'value': original_dict}
+        else:
+            raise ValueError(f"Unknown schema version: {schema_version}")
+
+    def decode_to_value(self, value_bytes: bytes) -> Union[str, Dict[str, Any]]:
+        """Kebalikan dari encode_value: mengembalikan value dalam bentuk aslinya (tanpa metadata versi)."""
+        decoded = self.decode_value(value_bytes)
+        if decoded['schema_version'] == 2:
+            return {'data': decoded['data'], 'timestamp': decoded['timestamp']}
+        return decoded['value']
+
+    def decode_with_expiry(self, value_bytes: bytes):
+        """(value asli, expires_at atau None), untuk write yang TTL-nya harus ikut disimpan."""
+        return self.decode_to_value(value_bytes), self.expires_at_of(value_bytes)
+
+class StringStreamDecoder:
+    """
+    Kebalikan encode_value untuk value string (skema 1, juga yang ber-TTL atau dikompresi) yang tiba per potongan:
+    feed() mengembalikan isi string (bytes UTF-8) yang sudah bisa dikeluarkan tanpa menunggu seluruh value.
+    Value selain string menghasilkan TypeError, karena hanya bisa di-decode utuh.
+    """
+    def __init__(self):
+        self.head = bytearray() # byte versi (dan expires_at) yang belum lengkap
+        self.started = False
+        self.decompressor = None
+        self.skip = _LENGTH.size # panjang string di depan isinya, tidak ikut dikeluarkan
+
+    def feed(self, data) -> bytes:
+        if not self.started:
+            self.head += data
+            if not self.head: return b''
+            version = self.head[0]
+            prefix = 1 + (_EXPIRES_AT.size if version & EXPIRES_FLAG else 0)
+            if len(self.head) < prefix: return b''
+            if version & ~(EXPIRES_FLAG | COMPRESSED_FLAG) != 1:
+                raise TypeError("Only string values can be streamed, use get() for other values.")
+            if version & COMPRESSED_FLAG: self.decompressor = zlib.decompressobj()
+            data = bytes(self.head[prefix:]); self.head = None; self.started = True
+        if self.decompressor: data = self.decompressor.decompress(data)
+        return self._strip_length(data)
+
+    def finish(self) -> bytes:
+        """Sisa isi yang masih tertahan di decompressor setelah potongan terakhir."""
+        return self._strip_length(self.decompressor.flush()) if self.decompressor else b''
+
+    def _strip_length(self, data) -> bytes:
+        if self.skip:
+            skipped = min(self.skip, len(data))
+            data = data[skipped:]; self.skip -= skipped
+        return bytes(data)
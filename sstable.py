@@ -0,0 +1,169 @@
+# sstable.py
+import os
+import re
+import mmap
+import bisect
+import hashlib
+import struct
+from array import array
+from segment import RECORD_HEADER, encode_record, iter_records
+
+# File SSTable (sstable_<seq>.sst) ditulis sekali dari memtable yang sudah diurutkan, lalu tidak pernah diubah:
+#   [blok data...] [sparse index] [bloom filter] [footer]
+#   Blok data: record berurutan menurut kunci, formatnya sama dengan record segmen (segment.encode_record)
+#   Index    : satu entri per blok [block_offset (8b)] [block_len (4b)] [key_len (2b)] [kunci pertama blok]
+#   Bloom    : [jumlah hash (1b)] [bit array]
+#   Footer   : [index_offset (8b)] [index_len (4b)] [bloom_len (4b)] [jumlah kunci (8b)] [magic (4b)]
+# Yang tinggal di memori hanya sparse index (satu kunci per blok) dan bloom filter, bukan setiap kunci.
+INDEX_ENTRY = struct.Struct('!QIH')
+FOOTER = struct.Struct('!QIIQI')
+MAGIC = 0x53535431 # "SST1"
+_TABLE_RE = re.compile(r'^sstable_(\d+)\.sst$')
+TMP_SUFFIX = ".tmp"
+
+def table_name(seq: int) -> str:
+    return f"sstable_{seq:06d}.sst"
+
+def list_tables(data_dir: str):
+    """File SSTable di direktori partisi, dari yang paling lama: [(seq, path), ...]."""
+    tables = []
+    for name in os.listdir(data_dir):
+        match = _TABLE_RE.match(name)
+        if match: tables.append((int(match.group(1)), os.path.join(data_dir, name)))
+    return sorted(tables)
+
+def bloom_hash(key: str):
+    """Dua hash 64 bit untuk double hashing; dihitung sekali per kunci lalu dipakai untuk bloom filter semua tabel."""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+
+class BloomFilter:
+    """Bloom filter dengan double hashing atas BLAKE2b 128 bit; bits_per_key 10 memberi ~1% false positive."""
+    def __init__(self, num_bits: int, num_hashes: int, bits: bytearray = None):
+        # Dibulatkan ke byte penuh, karena di file hanya panjang bit array (dalam byte) yang disimpan
+        self.num_bits = max(64, (num_bits + 7) // 8 * 8)
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray(self.num_bits // 8)
+
+    @classmethod
+    def for_keys(cls, num_keys: int, bits_per_key: int):
+        # Jumlah hash optimal = bits_per_key * ln 2
+        return cls(num_keys * bits_per_key, max(1, min(30, round(bits_per_key * 0.69))))
+
+    def _positions(self, key_hash):
+        h1, h2 = key_hash
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key_hash):
+        for position in self._positions(key_hash):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, key_hash) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key_hash))
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.num_hashes]) + self.bits
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls((len(data) - 1) * 8, data[0], bytearray(data[1:]))
+
+def write_table(path: str, items, block_bytes: int, bloom_bits_per_key: int, num_keys: int, sync: bool) -> int:
+    """
+    Menulis SSTable dari items [(key, value_bytes), ...] yang sudah urut dan unik menurut kunci, lewat file
+    sementara yang baru di-rename setelah lengkap. num_keys dipakai untuk ukuran bloom filter. Mengembalikan ukuran file.
+    """
+    bloom = BloomFilter.for_keys(max(1, num_keys), bloom_bits_per_key)
+    index = bytearray()
+    tmp_path = path + TMP_SUFFIX
+    written = count = 0
+    with open(tmp_path, 'wb') as f:
+        block = bytearray(); first_key = None
+        for key, value_bytes in items:
+            key_bytes = key.encode('utf-8')
+            if first_key is None: first_key = key_bytes
+            block += encode_record(key_bytes, value_bytes)
+            bloom.add(bloom_hash(key))
+            count += 1
+            if len(block) >= block_bytes:
+                index += INDEX_ENTRY.pack(written, len(block), len(first_key)) + first_key
+                f.write(block); written += len(block)
+                block = bytearray(); first_key = None
+        if block:
+            index += INDEX_ENTRY.pack(written, len(block), len(first_key)) + first_key
+            f.write(block); written += len(block)
+        bloom_bytes = bloom.to_bytes()
+        f.write(index); f.write(bloom_bytes)
+        f.write(FOOTER.pack(written, len(index), len(bloom_bytes), count, MAGIC))
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+class SSTable:
+    """Satu SSTable yang sudah ditulis: sparse index dan bloom filter di memori, blok data dibaca lewat mmap."""
+    def __init__(self, seq: int, path: str):
+        self.seq = seq
+        self.path = path
+        self.size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.size < FOOTER.size: raise ValueError(f"Truncated SSTable {path}")
+        index_offset, index_len, bloom_len, self.num_keys, magic = FOOTER.unpack_from(self.map, self.size - FOOTER.size)
+        if magic != MAGIC: raise ValueError(f"Bad SSTable footer in {path}")
+        self.data_end = index_offset
+        self.first_keys = []
+        self.block_offsets = array('Q'); self.block_lens = array('I')
+        position, index_end = index_offset, index_offset + index_len
+        while position < index_end:
+            block_offset, block_len, key_len = INDEX_ENTRY.unpack_from(self.map, position)
+            position += INDEX_ENTRY.size
+            self.first_keys.append(self.map[position:position + key_len].decode('utf-8'))
+            position += key_len
+            self.block_offsets.append(block_offset); self.block_lens.append(block_len)
+        self.bloom = BloomFilter.from_bytes(self.map[index_end:index_end + bloom_len])
+
+    def might_contain(self, key: str, key_hash) -> bool:
+        """False berarti kunci pasti tidak ada di tabel ini; key_hash dari bloom_hash(key)."""
+        return bool(self.first_keys) and key >= self.first_keys[0] and self.bloom.might_contain(key_hash)
+
+    def get(self, key: str):
+        """Value bytes untuk kunci, atau None jika kunci tidak ada di tabel ini."""
+        block_no = bisect.bisect_right(self.first_keys, key) - 1
+        if block_no < 0: return None
+        start = self.block_offsets[block_no]
+        view = memoryview(self.map)[start:start + self.block_lens[block_no]]
+        for offset, record_key, record_end in iter_records(view):
+            if record_key == key:
+                _, key_len = RECORD_HEADER.unpack_from(view, offset)
+                return bytes(view[offset + RECORD_HEADER.size + key_len:record_end])
+            # Urutan str sama dengan urutan byte UTF-8-nya, jadi kunci ini pasti tidak ada di blok
+            if record_key > key: return None
+        return None
+
+    def items(self):
+        """Semua (key, value_bytes) di tabel, urut menurut kunci."""
+        view = memoryview(self.map)[:self.data_end]
+        for offset, key, record_end in iter_records(view):
+            _, key_len = RECORD_HEADER.unpack_from(view, offset)
+            yield key, bytes(view[offset + RECORD_HEADER.size + key_len:record_end])
+
+    def keys(self):
+        view = memoryview(self.map)[:self.data_end]
+        for _, key, _ in iter_records(view): yield key
+
+    def keys_from(self, start: str):
+        """Kunci >= start secara urut, mulai dari blok yang mungkin berisi start (untuk SCAN)."""
+        if not self.first_keys: return
+        block_no = max(0, bisect.bisect_right(self.first_keys, start) - 1)
+        view = memoryview(self.map)[:self.data_end]
+        for _, key, _ in iter_records(view, self.block_offsets[block_no]):
+            if key >= start: yield key
+
+    def resident_bytes(self) -> int:
+        """Perkiraan memori yang dipakai tabel ini (sparse index + bloom filter)."""
+        keys_bytes = sum(len(key) + 49 for key in self.first_keys) + 8 * len(self.first_keys)
+        return keys_bytes + len(self.block_offsets) * 12 + len(self.bloom.bits)
@@ -0,0 +1,61 @@
+# streaming.py
+import time
+import bisect
+import threading
+from config import STREAM_UPLOAD_TIMEOUT, STREAM_MAX_VALUE_BYTES
+
+# Value besar tidak dikirim dalam satu frame: klien memecahnya menjadi request PUT_CHUNK (lihat protocol.py), dan
+# node merakitnya kembali di sini sebelum di-PUT seperti biasa. Arah sebaliknya (GET) tidak perlu dirakit: value
+# cold storage yang besar dikirim node langsung dari file segmen dengan sendfile (segment.FileRegion).
+
+class ChunkedUploads:
+    """
+    Upload PUT bertahap yang sedang diterima sebuah node, per (partition_id, key, upload_id). Potongan boleh tiba
+    tidak berurutan (server asyncio memproses request satu koneksi secara bersamaan), jadi setiap potongan membawa
+    offset-nya dan ditulis langsung ke buffer seukuran value. Rentang byte setiap potongan dicatat: potongan yang
+    dikirim ulang persis sama diabaikan, dan potongan yang menimpa sebagian potongan lain ditolak, sehingga value
+    hanya dianggap lengkap jika setiap byte-nya benar-benar diterima. Upload yang tidak menerima potongan baru selama
+    `timeout` detik (mis. klien putus di tengah upload) dibuang saat upload lain berjalan.
+    """
+    def __init__(self, timeout: float = STREAM_UPLOAD_TIMEOUT, max_bytes: int = STREAM_MAX_VALUE_BYTES):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        # (partition_id, key, upload_id) -> [buffer, {offset: akhir potongan}, offset terurut, byte tersalin, terakhir diisi]
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.uploads)
+
+    def add(self, upload_key, offset: int, total: int, chunk) -> bytearray:
+        """Menyimpan satu potongan. Mengembalikan value bytes lengkap begitu semua byte diterima, selain itu None."""
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            upload = self.uploads.get(upload_key)
+            if upload is None:
+                if total > self.max_bytes: raise ValueError(f"Value of {total} bytes exceeds the limit of {self.max_bytes} bytes.")
+                upload = self.uploads[upload_key] = [bytearray(total), {}, [], 0, now]
+            end = offset + len(chunk)
+            if len(upload[0]) != total or end > total: raise ValueError("Chunk does not fit the upload.")
+            ends, starts = upload[1], upload[2]
+            upload[4] = now
+            # Potongan yang dikirim ulang (mis. klien mengulang request) sudah tercatat
+            if not chunk or ends.get(offset) == end: return None
+            i = bisect.bisect_right(starts, offset)
+            if (i and ends[starts[i - 1]] > offset) or (i < len(starts) and starts[i] < end):
+                raise ValueError("Chunk overlaps data already received for the upload.")
+            starts.insert(i, offset)
+            ends[offset] = end
+        # Potongan berbeda mengisi bagian buffer yang berbeda, jadi penyalinannya tidak perlu memegang lock
+        upload[0][offset:end] = chunk
+        with self.lock:
+            # Rentang potongan tidak saling tumpang tindih, jadi total byte tersalin == total berarti tidak ada lubang
+            upload[3] += len(chunk)
+            if upload[3] < total: return None
+            self.uploads.pop(upload_key, None)
+        return upload[0]
+
+    def _expire(self, now):
+        for upload_key in [k for k, upload in self.uploads.items() if now - upload[4] > self.timeout]:
+            del self.uploads[upload_key]
@@ -1,28 +1,818 @@
 # test.py
 
 import os
+import json
+import mmap
 import shutil
 import time
+import threading
 import multiprocessing
-import hashlib
+import random
+import socket
 from coordinator import Coordinator
-from network import send_request
-from config import CLUSTER_TOPOLOGY
-from node import start_node_process
+import protocol
+import network
+from network import send_request, send_binary_request, get_pool, get_pipeline
+import struct
+from serializer import Serializer, COMPRESSED_FLAG
+from hashring import HashRing, check_ring_layout
+from config import CLUSTER_TOPOLOGY, FAILURE_TIMEOUT, VNODES_PER_PARTITION
+from node import start_node_process, Node, NodeTCPServer, NodeTCPHandler
+from partition import open_partition
+from ttl import TimerWheel, now_ms
+import keyindex
+from keyindex import CompactKeyIndex
+from sstable import bloom_hash
+from cache import LRUCache
+from wal import DURABILITY_MODES, DURABILITY_NONE
+from metrics import MetricsRegistry, Histogram, format_prometheus
+from replication import ReplicationStream, ReplicationGapError
+from membership import decode_topology
+from streaming import ChunkedUploads
+import performancetest
 
-def find_keys_for_partition(target_partition_id, num_keys, num_partitions):
+def find_keys_for_partition(target_partition_id, num_keys):
     """Fungsi helper untuk mencari kunci yang cocok untuk partisi target."""
+    ring = HashRing(CLUSTER_TOPOLOGY['partitions'])
     keys = []
     i = 0
     while len(keys) < num_keys:
         key_candidate = f"testkey:{i}"
-        hash_val = int(hashlib.sha1(key_candidate.encode('utf-8')).hexdigest(), 16)
-        partition_id = hash_val % num_partitions
+        partition_id = ring.partition_for(key_candidate)
         if partition_id == target_partition_id:
             keys.append(key_candidate)
         i += 1
     return keys
 
+class NodeStub:
+    """Node palsu untuk menguji partisi secara langsung, tanpa cluster (replikasi dan migrasi tidak melakukan apa-apa)."""
+    node_id = "test"
+    def wait_for_replication_capacity(self, partition_id): pass
+    def replicate_to_followers(self, partition_id, items): pass
+    def check_migration_writes(self, partition_id, keys): pass
+
+class LeaderNodeStub(NodeStub):
+    """Node leader palsu: memberi nomor urut dan memasukkan write ke stream replikasi seperti Node."""
+    def __init__(self):
+        self.streams, self.seq = [], 0
+    def wait_for_replication_capacity(self, partition_id):
+        for stream in self.streams: stream.wait_for_capacity()
+    def replicate_to_followers(self, partition_id, items):
+        entries = [(self.seq + 1 + i, key, value_bytes) for i, (key, value_bytes) in enumerate(items)]
+        self.seq += len(items)
+        for stream in self.streams: stream.enqueue(entries)
+
+class FollowerNodeStub(NodeStub):
+    """Node follower palsu di balik NodeTCPServer, memakai handler replikasi Node; down=True menolak semua batch."""
+    dispatch_binary = Node.dispatch_binary
+    _observe_command = Node._observe_command
+    def __init__(self, partition):
+        self.replicas, self.metrics, self.down = {0: partition}, MetricsRegistry(), False
+    def handle_replicate_stream(self, p_id, body):
+        return "ERROR: Node is down." if self.down else Node.handle_replicate_stream(self, p_id, body)
+    def handle_replicate_resync(self, p_id, body):
+        return "ERROR: Node is down." if self.down else Node.handle_replicate_resync(self, p_id, body)
+
+def open_test_partition(name, fresh=True, node=None, **kwargs):
+    """Membuka partisi 0 di data/unit/<name>; fresh=False membuka ulang data yang sudah ada (simulasi restart)."""
+    data_dir = f"data/unit/{name}"
+    if fresh and os.path.exists(data_dir): shutil.rmtree(data_dir)
+    return open_partition(0, data_dir, node or NodeStub(), kwargs.pop("role", "leader"), **kwargs)
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Kondisi tidak tercapai sebelum batas waktu"
+        time.sleep(0.01)
+
+def wait_flushed(partition):
+    """Menunggu sampai semua memtable yang penuh selesai di-flush ke disk."""
+    while partition.flush_queue: time.sleep(0.01)
+
+def fill_memtable(partition, prefix, value_fn):
+    """PUT tepat sebanyak batas memtable agar memtable-nya langsung di-flush. Mengembalikan {key: value}."""
+    items = {f"{prefix}:{i}": value_fn(i) for i in range(partition.HOT_STORAGE_LIMIT)}
+    partition.put_many(list(items.items()))
+    wait_flushed(partition)
+    return items
+
+def run_segment_map_test():
+    print("\n--- Baca Record yang Melewati Akhir mmap Segmen ---")
+    partition = open_test_partition("segment_map")
+    items = fill_memtable(partition, "mapkey", lambda i: {"data": os.urandom(1000).hex()})
+    # Map yang dibuat saat record terakhir baru setengah tertulis: header-nya masuk map, ekornya belum
+    segment = partition.active_segment
+    with open(segment.path, 'rb') as f:
+        segment.map = mmap.mmap(f.fileno(), segment.size - 100, access=mmap.ACCESS_READ)
+    for key, value in items.items():
+        assert partition.get(key) == value, f"Value {key} terpotong"
+    partition.close()
+    print("✅  Record di ujung map dibaca utuh setelah segmen di-map ulang.")
+
+def run_serializer_test():
+    print("\n--- Serializer Skema 4 dan Kompresi ---")
+    value = {"nama": "ñame 名前", "angka": [0, -1, 127, -129, 2 ** 40, -2 ** 63, 1.5], "flag": [True, False, None],
+             "bersarang": {"daftar": list(range(300)), "teks": "x" * 300}, "kosong": {}}
+    v4, v3 = Serializer(4, None), Serializer(3, None)
+    encoded = v4.encode_value(value)
+    assert encoded[0] == 4 and v4.decode_to_value(encoded) == value
+    assert v3.encode_value(value)[0] == 3 and v4.decode_to_value(v3.encode_value(value)) == value
+    record = {"user": "budi", "umur": 30, "aktif": True, "skor": [10, 20, 30], "alamat": {"kota": "Bandung"}}
+    assert len(v4.encode_value(record)) < len(v3.encode_value(record))
+    # Dict dengan key bukan string tetap disimpan sebagai JSON (skema 3)
+    assert v4.encode_value({1: "a"})[0] == 3
+    # Kompresi hanya di atas ambang, ditandai di byte versi, dan tetap cocok dengan TTL
+    compressing = Serializer(4, 1024)
+    assert not compressing.encode_value({"kecil": "x" * 10})[0] & COMPRESSED_FLAG
+    big = compressing.encode_value(value, expires_at=12345)
+    assert big[0] & COMPRESSED_FLAG and len(big) < len(encoded)
+    assert compressing.decode_with_expiry(big) == (value, 12345)
+    # Record versi lama (1-3) yang sudah ada di disk tetap terbaca
+    text = "halo".encode('utf-8')
+    assert v4.decode_to_value(b'\x01' + struct.pack('!I', len(text)) + text) == "halo"
+    legacy = b'\x02' + struct.pack('!I', len(text)) + text + struct.pack('!Q', 99)
+    assert v4.decode_to_value(legacy) == {"data": "halo", "timestamp": 99}
+    as_json = json.dumps({"a": [1, 2]}).encode('utf-8')
+    assert v4.decode_to_value(b'\x03' + struct.pack('!I', len(as_json)) + as_json) == {"a": [1, 2]}
+    print("✅  Skema 4 round-trip dan lebih ringkas dari JSON, kompresi ditandai di byte versi, versi 1-3 tetap terbaca.")
+
+def run_memtable_flush_test():
+    print("\n--- Flush Memtable di Latar Belakang ---")
+    partition = open_test_partition("memtable_flush")
+    items = fill_memtable(partition, "flushkey", lambda i: {"data": f"nilai {i}"})
+    # Batas jumlah entri tercapai: memtable ditukar dan ditulis flusher ke segment.log
+    assert not partition.hot_storage and partition.active_segment.size > 0
+    for key, value in items.items():
+        assert partition.get_key_location(key) == "COLD_STORAGE" and partition.get(key) == value
+    # Batas byte juga memicu flush walaupun jumlah entrinya masih jauh dari batas
+    partition.HOT_STORAGE_MAX_BYTES = 1000
+    partition.put("flushkey:besar", {"data": "x" * 2000})
+    wait_flushed(partition)
+    assert not partition.hot_storage and partition.get_key_location("flushkey:besar") == "COLD_STORAGE"
+    partition.close()
+    print("✅  Memtable di-flush begitu batas entri atau byte tercapai, dan datanya tetap terbaca.")
+
+def fill_segments(partition, prefix, rounds):
+    """Menulis ulang kunci yang sama sebanyak rounds kali, masing-masing ke segmen sendiri. Mengembalikan versi terakhir."""
+    partition.SEGMENT_MAX_BYTES = 1
+    for version in range(rounds):
+        items = fill_memtable(partition, prefix, lambda i: {"data": f"nilai {i} versi {version}"})
+        # Flusher menutup segmen begitu melewati batas ukuran; tunggu sampai segment.log baru dimulai
+        while partition.active_segment.size: time.sleep(0.01)
+    return items
+
+def run_compaction_test():
+    print("\n--- Segment Rolling dan Compaction ---")
+    partition = open_test_partition("compaction")
+    items = fill_segments(partition, "compactkey", 3)
+    assert partition.segment_stats()["segments"] == 4
+    reclaimed = partition.compact()
+    # Tiga segmen tertutup digabung menjadi satu yang hanya berisi versi terbaru tiap kunci
+    assert reclaimed > 0 and partition.segment_stats()["segments"] == 2
+    for key, value in items.items(): assert partition.get(key) == value
+    partition.close()
+    partition = open_test_partition("compaction", fresh=False)
+    for key, value in items.items(): assert partition.get(key) == value
+    partition.close()
+    print(f"✅  Compaction membebaskan {reclaimed} byte, versi terbaru tetap terbaca sebelum dan sesudah restart.")
+
+def run_sstable_test():
+    print("\n--- Storage Engine SSTable dan Bloom Filter ---")
+    partition = open_test_partition("sstable", storage_engine="sstable")
+    fill_memtable(partition, "sstkey", lambda i: {"versi": 1})
+    items = fill_memtable(partition, "sstkey", lambda i: {"versi": 2})
+    items.update(fill_memtable(partition, "lain", lambda i: {"versi": 1}))
+    assert len(partition.tables) == 3
+    for key, value in items.items(): assert partition.get(key) == value
+    # Bloom filter menyaring hampir semua kunci yang tidak ada tanpa membaca blok data
+    absent = [bloom_hash(f"absen:{i}") for i in range(1000)]
+    false_positives = sum(table.bloom.might_contain(h) for table in partition.tables for h in absent)
+    assert false_positives < 0.05 * len(absent) * len(partition.tables)
+    assert partition.get("absen:0") is None
+    assert partition.compact() > 0 and len(partition.tables) == 1
+    partition.close()
+    partition = open_test_partition("sstable", fresh=False, storage_engine="sstable")
+    for key, value in items.items(): assert partition.get(key) == value
+    partition.close()
+    # Data engine 'log' tidak dibuka diam-diam oleh engine 'sstable'
+    log_partition = open_test_partition("sstable_log")
+    fill_memtable(log_partition, "logkey", lambda i: {"versi": 1})
+    log_partition.close()
+    try:
+        open_test_partition("sstable_log", fresh=False, storage_engine="sstable")
+        assert False, "Data engine 'log' seharusnya ditolak"
+    except ValueError: pass
+    print(f"✅  SSTable melayani versi terbaru, bloom filter: {false_positives} false positive dari "
+          f"{len(absent) * 3} pengecekan, compaction menyisakan satu tabel.")
+
+def run_key_index_test():
+    print("\n--- Index Hash Ringkas ---")
+    original_key_hash = keyindex.key_hash
+    # Hash dibuat sering sama (hanya 3 nilai) agar kunci berbeda harus dibedakan lewat fingerprint-nya saja
+    keyindex.key_hash = lambda key: (2 + len(key) % 3, original_key_hash(key)[1])
+    try:
+        index, expected = CompactKeyIndex(capacity=16), {}
+        for i in range(200):
+            index[f"k{i}"] = expected[f"k{i}"] = i
+        for i in range(0, 200, 2):
+            index[f"k{i}"] = expected[f"k{i}"] = i + 1000
+        for i in range(0, 200, 5):
+            del index[f"k{i}"]; del expected[f"k{i}"]
+        assert len(index) == len(expected) and index.capacity > 16
+        assert all(index.get(key) == location for key, location in expected.items())
+        assert index.get("k0") is None and index.pop("tidak-ada") is None
+        os.makedirs("data/unit", exist_ok=True)
+        index.save("data/unit/index.snapshot", {"segments": []})
+        loaded = CompactKeyIndex.load("data/unit/index.snapshot")
+        assert len(loaded) == len(expected) and all(loaded[key] == location for key, location in expected.items())
+    finally:
+        keyindex.key_hash = original_key_hash
+    print(f"✅  {len(expected)} kunci dengan hash bertabrakan dibedakan lewat fingerprint, juga setelah snapshot dimuat ulang.")
+
+def scan_all(partition, start, end, limit):
+    """Semua entri SCAN partisi, halaman demi halaman mengikuti cursor-nya."""
+    entries, cursor = [], None
+    while True:
+        page, cursor = partition.scan(cursor + '\0' if cursor is not None else start, end, limit)
+        entries.extend(page)
+        if cursor is None: return entries
+
+def run_scan_test():
+    print("\n--- SCAN Rentang Kunci di Memtable dan Cold Storage ---")
+    for engine in ("log", "sstable"):
+        partition = open_test_partition(f"scan_{engine}", storage_engine=engine)
+        fill_memtable(partition, "scan:a", lambda i: f"lama {i}")
+        fill_memtable(partition, "scan:b", lambda i: f"disk {i}")
+        # Versi baru di memtable menutupi versi di disk, dan kunci yang dihapus tidak ikut
+        partition.put("scan:a:1", "baru"); partition.delete("scan:b:0"); partition.put("zzz", "di luar rentang")
+        entries = scan_all(partition, "scan:", "scan;", 3)
+        keys = [key for key, _ in entries]
+        expected = sorted(f"scan:{p}:{i}" for p in "ab" for i in range(partition.HOT_STORAGE_LIMIT) if (p, i) != ("b", 0))
+        assert keys == expected, keys
+        values = dict((key, partition.serializer.decode_to_value(value)) for key, value in entries)
+        assert values["scan:a:1"] == "baru" and values["scan:b:2"] == "disk 2"
+        partition.close()
+    print("✅  SCAN per halaman urut dan lengkap di engine 'log' dan 'sstable', tanpa kunci terhapus.")
+
+def run_ttl_test():
+    print("\n--- TTL per Kunci dan Timer Wheel ---")
+    wheel = TimerWheel(100, 8)
+    now = now_ms()
+    wheel.add("cepat", now + 50); wheel.add("lambat", now + 5000)
+    # Entri yang lebih dari satu putaran lagi (8 x 100 ms) tetap di slotnya sampai waktunya lewat
+    assert wheel.advance(now + 200) == [("cepat", now + 50)] and len(wheel) == 1
+    assert wheel.advance(now + 1000) == [] and wheel.advance(now + 5100) == [("lambat", now + 5000)]
+
+    partition = open_test_partition("ttl")
+    expires_at = now_ms() + 500
+    # Satu memtable penuh kunci ber-TTL, sehingga langsung di-flush ke segmen
+    items = {f"ttlkey:{i}": f"sementara {i}" for i in range(partition.HOT_STORAGE_LIMIT)}
+    for key, value in items.items(): partition.put(key, value, expires_at=expires_at)
+    wait_flushed(partition)
+    partition.put("ttl:memtable", "sementara", expires_at=expires_at)
+    # Ditimpa tanpa TTL: entri lamanya di timer wheel menjadi basi dan diabaikan
+    partition.put("ttlkey:0", "permanen")
+    assert partition.get("ttlkey:1") == "sementara 1" and partition.get("ttl:memtable") == "sementara"
+    # SCAN pertama membangun daftar kunci terurut, yang juga harus kehilangan kunci yang kedaluwarsa
+    partition.scan("ttlkey:", "ttlkey;")
+    wait_until(lambda: partition.get("ttlkey:1") is None and partition.get("ttl:memtable") is None)
+    assert partition.get("ttlkey:0") == "permanen"
+    # Sweep berikutnya membuang kunci kedaluwarsa dari index dan memtable
+    wait_until(lambda: partition.ttl_stats()["expired"] >= len(items))
+    assert "ttlkey:1" not in partition.cold_storage_index and "ttl:memtable" not in partition.hot_storage
+    assert partition.sorted_keys.range("ttlkey:", "ttlkey;", 10) == ["ttlkey:0"]
+    partition.close()
+    # expires_at ada di record, jadi kunci kedaluwarsa tetap NOT_FOUND setelah index dibangun ulang dari hint
+    os.remove(os.path.join(partition.data_dir, "index.snapshot"))
+    partition = open_test_partition("ttl", fresh=False)
+    assert partition.get("ttlkey:1") is None and partition.get("ttlkey:0") == "permanen"
+    partition.close()
+    print("✅  Kunci ber-TTL hilang tepat waktu, dibuang sweep timer wheel, dan tetap hilang setelah restart.")
+
+def run_concurrent_read_test(engine="log"):
+    print(f"\n--- GET Konkuren Selama PUT, Flush, dan Compaction (engine '{engine}') ---")
+    partition = open_test_partition(f"concurrent_{engine}", storage_engine=engine, durability_mode="per-write")
+    num_keys, rounds = 20, 60
+    committed = [None] * num_keys # versi terakhir yang PUT-nya sudah kembali, ditulis hanya oleh thread penulis
+    partition.put_many([(f"rebut:{k}", "0000") for k in range(num_keys)])
+    committed[:] = ["0000"] * num_keys
+    done, failures, reads = threading.Event(), [], [0]
+    def reader(seed):
+        rng = random.Random(seed)
+        while not done.is_set():
+            k = rng.randrange(num_keys)
+            floor = committed[k]
+            value = partition.get(f"rebut:{k}")
+            # Versi yang terbaca tidak boleh lebih lama dari PUT yang sudah selesai sebelum GET dimulai
+            if value is None or value < floor: failures.append((k, floor, value)); return
+            reads[0] += 1
+    readers = [threading.Thread(target=reader, args=(seed,)) for seed in range(4)]
+    for t in readers: t.start()
+    for version in range(1, rounds + 1):
+        for k in range(num_keys):
+            partition.put(f"rebut:{k}", f"{version:04d}")
+            committed[k] = f"{version:04d}"
+        if version % 20 == 0: wait_flushed(partition); partition.compact()
+    done.set()
+    for t in readers: t.join()
+    assert not failures, f"GET membaca versi basi atau hilang: {failures[:3]}"
+    assert all(partition.get(f"rebut:{k}") == f"{rounds:04d}" for k in range(num_keys))
+    partition.close()
+    print(f"✅  {reads[0]} GET tanpa lock selama {num_keys * rounds} PUT tidak pernah membaca versi basi.")
+
+def run_chunked_upload_test():
+    print("\n--- Perakitan Upload Bertahap ---")
+    uploads = ChunkedUploads(timeout=0.2, max_bytes=100)
+    data = bytes(range(30))
+    # Potongan tiba tidak berurutan; value baru dikembalikan saat byte terakhir diterima
+    assert uploads.add((0, "k", 1), 20, 30, data[20:]) is None and uploads.add((0, "k", 1), 0, 30, data[:10]) is None
+    assert uploads.add((0, "k", 1), 10, 30, data[10:20]) == data and len(uploads) == 0
+    # Potongan yang dikirim ulang tidak dihitung dua kali: value tidak lengkap selama masih ada lubang
+    assert uploads.add((0, "ulang", 6), 0, 8, b"AAAA") is None and uploads.add((0, "ulang", 6), 0, 8, b"AAAA") is None
+    assert uploads.add((0, "ulang", 6), 4, 8, b"BBBB") == b"AAAABBBB"
+    uploads.add((0, "tumpuk", 7), 0, 8, b"AAAA")
+    for bad in (lambda: uploads.add((0, "k", 2), 0, 200, b"x"), lambda: uploads.add((0, "k", 3), 25, 30, data[:10]),
+                lambda: uploads.add((0, "tumpuk", 7), 2, 8, b"CCCC"), lambda: uploads.add((0, "tumpuk", 7), 0, 8, b"AA")):
+        try: bad(); assert False, "Upload yang tidak valid diterima"
+        except ValueError: pass
+    uploads.add((0, "putus", 4), 0, 30, data[:10])
+    time.sleep(0.3) # termasuk upload "tumpuk" yang tidak pernah lengkap
+    uploads.add((0, "k", 5), 0, 30, data[:10])
+    assert len(uploads) == 1 # upload yang ditinggal klien dibuang
+    print("✅  Potongan acak dirakit utuh, potongan ulang diabaikan, upload kebesaran, meluber, atau tumpang tindih ditolak, dan upload terbengkalai dibuang.")
+
+def check_streaming(coordinator):
+    print("\n--- PUT Bertahap dan GET Streaming ---")
+    key = "stream:besar"
+    value = "".join(f"baris {i} ä€\n" for i in range(120000)) # karakter multi-byte terpotong di batas potongan
+    encoded = value.encode('utf-8')
+    chunks = (encoded[i:i + 100000] for i in range(0, len(encoded), 100000))
+    assert coordinator.put_stream(key, chunks, len(encoded)).startswith("SUCCESS")
+    partition_id = coordinator._get_partition_for_key(key)
+    info = CLUSTER_TOPOLOGY['nodes'][CLUSTER_TOPOLOGY['partitions'][partition_id]['leader']]
+    # Value melewati MEMTABLE_MAX_BYTES sehingga langsung di-flush; GET-nya lalu dikirim dari file segmen
+    wait_until(lambda: send_request(info['host'], info['port'], f"STATUS {partition_id} {key}") == "COLD_STORAGE")
+    assert b"".join(coordinator.get_stream(key)).decode('utf-8') == value
+    assert coordinator.get(key) == value
+    try: coordinator.get_stream("stream:tidak-ada"); assert False, "Kunci yang tidak ada tidak ditolak"
+    except KeyError: pass
+    print(f"✅  Value {len(encoded)} byte di-PUT bertahap dan dibaca ulang utuh lewat GET streaming dari cold storage.")
+
+def run_metrics_test():
+    print("\n--- Histogram Latensi dan Format Prometheus ---")
+    histogram = Histogram(bounds=(1, 2, 5, 10))
+    for value, times in ((0.5, 50), (3, 40), (20, 10)):
+        for _ in range(times): histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100 and snapshot["max_ms"] == 20 and snapshot["buckets"]["+Inf"] == 100
+    # Persentil diperkirakan di dalam bucket tempat peringkatnya jatuh
+    assert 0 < snapshot["p50_ms"] <= 1 and 2 < snapshot["p90_ms"] <= 5 and 10 < snapshot["p99_ms"] <= 20
+    registry = MetricsRegistry(partition=0)
+    registry.counter("command_errors", command="GET").inc(2)
+    registry.gauge("index_keys").set(7)
+    registry.histogram("write_ms").observe(0.3)
+    assert registry.snapshot()["command_errors"] == {"GET": 2} and registry.snapshot()["index_keys"] == 7
+    text = format_prometheus([registry])
+    assert 'kv_command_errors_total{partition="0",command="GET"} 2' in text
+    assert 'kv_index_keys{partition="0"} 7' in text
+    assert 'kv_write_ms_bucket{partition="0",le="+Inf"} 1' in text and 'kv_write_ms_count{partition="0"} 1' in text
+    print("✅  Persentil histogram, snapshot JSON, dan teks Prometheus sesuai dengan metrik yang dicatat.")
+
+def run_load_summary_test():
+    print("\n--- Ringkasan Benchmark Beban ---")
+    summary = performancetest.latency_summary([float(ms) for ms in range(1000, 0, -1)])
+    # Nearest-rank: p99 dari 1..1000 ms adalah sampel ke-990, bukan hasil interpolasi
+    assert (summary["count"], summary["p50_ms"], summary["p99_ms"], summary["p999_ms"], summary["max_ms"]) == (1000, 500, 990, 999, 1000)
+    assert performancetest.latency_summary([]) == {"count": 0}
+    zipfian, rng = performancetest.ZipfianGenerator(1000), random.Random(7)
+    samples = [zipfian.next(rng) for _ in range(20000)]
+    assert all(0 <= i < 1000 for i in samples) and samples.count(0) > samples.count(500) * 20
+    run = {"workload": "balanced", "distribution": "uniform", "clients": 4, "client_mode": "thread",
+           "throughput": 1200.0, "latency": {"all": {"p99_ms": 3.0}}}
+    old = dict(run, throughput=1000.0, latency={"all": {"p99_ms": 4.0}})
+    [change] = performancetest.compare_load_results({"load": [old]}, [run])
+    assert round(change["throughput_change_pct"]) == 20 and round(change["p99_change_pct"]) == -25
+    print("✅  Persentil nearest-rank, distribusi Zipfian, dan perbandingan baseline sesuai.")
+
+def check_load(topology):
+    print("\n--- Benchmark Beban Singkat ---")
+    [run] = performancetest.benchmark_load(topology, ["balanced"], [3], duration=1, records=200)
+    latency = run["latency"]
+    assert run["ops"] > 0 and run["errors"] == 0 and sum(run["timeline"]) == run["ops"]
+    assert latency["read"]["count"] + latency["update"]["count"] == run["ops"] == latency["all"]["count"]
+    print(f"✅  3 klien konkuren menjalankan {run['ops']} operasi tanpa error, p99 {latency['all']['p99_ms']:.2f} ms.")
+
+def check_stats(all_keys):
+    print("\n--- STATS Node ---")
+    info = CLUSTER_TOPOLOGY['nodes'][CLUSTER_TOPOLOGY['partitions'][0]['leader']]
+    stats = json.loads(send_request(info['host'], info['port'], "STATS"))
+    assert any(histogram["count"] > 0 for histogram in stats["commands"]["command_ms"].values())
+    partition_stats = stats["partitions"]["partition_0"]
+    assert partition_stats["write_ms"]["count"] > 0 and partition_stats["index_keys"] >= 0
+    # Leader partisi 0 punya stream replikasi ke setiap follower-nya
+    assert set(stats["replication"]["partition_0"]) == {f"follower_{f}" for f in CLUSTER_TOPOLOGY['partitions'][0]['followers']}
+    text = send_request(info['host'], info['port'], "STATS prometheus")
+    assert "# TYPE kv_command_ms histogram" in text and 'kv_write_ms_count{partition="0"}' in text
+    assert send_request(info['host'], info['port'], "STATS xml").startswith("ERROR")
+    print("✅  STATS JSON dan Prometheus memuat metrik perintah, partisi, dan replikasi.")
+
+def check_scan(coordinator):
+    print("\n--- SCAN Lintas Partisi ---")
+    mapping = {f"scan:{i:03d}": f"nilai {i}" for i in range(30)}
+    assert all(message.startswith("SUCCESS") for message in coordinator.mput(mapping).values())
+    assert len({coordinator._get_partition_for_key(key) for key in mapping}) > 1
+    # Halaman kecil memaksa beberapa round-trip per partisi; hasilnya tetap urut di seluruh cluster
+    assert list(coordinator.scan(prefix="scan:", page_size=4)) == sorted(mapping.items())
+    assert [key for key, _ in coordinator.scan("scan:010", "scan:015")] == [f"scan:{i:03d}" for i in range(10, 15)]
+    print(f"✅  SCAN prefix mengembalikan {len(mapping)} kunci dari beberapa partisi secara urut.")
+
+def run_startup_index_test():
+    print("\n--- Hint File dan Snapshot Index saat Startup ---")
+    partition = open_test_partition("startup_index")
+    items = fill_segments(partition, "hintkey", 2)
+    partition.close()
+    data_dir = partition.data_dir
+    snapshot_path = os.path.join(data_dir, "index.snapshot")
+    hint_paths = [os.path.join(data_dir, name) for name in os.listdir(data_dir) if name.endswith(".hint")]
+    assert os.path.exists(snapshot_path) and len(hint_paths) == 2
+    # Tiga jalur startup: snapshot index, hint (snapshot hilang), dan scan log penuh (hint juga hilang).
+    # Snapshot ditulis lagi setiap close, jadi dihapus ulang sebelum startup ketiga
+    for remove in ([], [snapshot_path], [snapshot_path] + hint_paths):
+        for path in remove:
+            if os.path.exists(path): os.remove(path)
+        partition = open_test_partition("startup_index", fresh=False)
+        for key, value in items.items(): assert partition.get(key) == value
+        partition.close()
+    # Scan penuh menulis ulang hint, agar startup berikutnya tidak perlu scan lagi
+    assert all(os.path.exists(path) for path in hint_paths)
+    print("✅  Index dipulihkan dari snapshot, dari hint, dan dari scan log; hint ditulis ulang setelah scan.")
+
+def write_and_crash(name, durability_mode, items):
+    """Dijalankan di proses terpisah: PUT lalu mati tanpa close(), sehingga memtable-nya tidak pernah di-flush."""
+    partition = open_test_partition(name, durability_mode=durability_mode)
+    partition.put_many(list(items.items()))
+    partition.delete("walkey:0")
+    os._exit(0)
+
+def run_wal_test():
+    print("\n--- Write-Ahead Log dan Crash Recovery ---")
+    items = {f"walkey:{i}": {"data": f"nilai {i}"} for i in range(3)}
+    for mode in DURABILITY_MODES:
+        name = f"wal_{mode}"
+        process = multiprocessing.Process(target=write_and_crash, args=(name, mode, items))
+        process.start(); process.join()
+        partition = open_test_partition(name, fresh=False, durability_mode=mode)
+        if mode == DURABILITY_NONE:
+            # Tanpa WAL, isi memtable hilang bersama prosesnya
+            assert all(partition.get(key) is None for key in items)
+        else:
+            # PUT dan DELETE yang sudah dibalas berhasil dipulihkan dari WAL, dalam urutan yang sama
+            assert partition.get("walkey:0") is None
+            for key in ("walkey:1", "walkey:2"): assert partition.get(key) == items[key]
+        partition.close()
+    print(f"✅  Write yang sudah di-ack selamat dari crash di mode {DURABILITY_MODES[1:]}, dan hilang di mode 'none'.")
+
+def delete_and_compact(name, engine, mode):
+    """
+    Dijalankan di proses terpisah: menghapus kunci yang sudah ada di disk, lalu (mode 'done' atau 'crash') compaction.
+    Mode 'crash' mematikan proses tepat setelah compaction di-commit, sebelum input-nya dihapus.
+    """
+    partition = open_test_partition(name, storage_engine=engine)
+    partition.SEGMENT_MAX_BYTES = 1
+    keys = list(fill_memtable(partition, "hapus", lambda i: f"nilai {i}"))
+    partition.delete_many(keys[:3])
+    partition.put_many([(f"isi:{i}", "isi") for i in range(partition.HOT_STORAGE_LIMIT - 3)])
+    wait_flushed(partition)
+    while engine == "log" and partition.active_segment.size: time.sleep(0.01)
+    if mode == "crash":
+        import partition as partition_module
+        partition_module.finish_compaction = lambda *args: os._exit(0)
+    if mode != "none": assert partition.compact() is not None
+    partition.close()
+
+def run_delete_compaction_test():
+    print("\n--- DELETE, Compaction, dan Restart ---")
+    for engine in ("log", "sstable"):
+        for mode in ("none", "done", "crash"):
+            name = f"delete_{engine}_{mode}"
+            process = multiprocessing.Process(target=delete_and_compact, args=(name, engine, mode))
+            process.start(); process.join()
+            data_dir = f"data/unit/{name}/partition_0"
+            assert any(n.endswith(".compacted") for n in os.listdir(data_dir)) == (mode == "crash")
+            # Tanpa snapshot, index engine 'log' dibangun ulang dari hint atau scan segmen (termasuk tombstone-nya)
+            if os.path.exists(os.path.join(data_dir, "index.snapshot")): os.remove(os.path.join(data_dir, "index.snapshot"))
+            partition = open_test_partition(name, fresh=False, storage_engine=engine)
+            assert all(partition.get(f"hapus:{i}") is None for i in range(3)), (engine, mode)
+            assert partition.get("hapus:3") == "nilai 3" and partition.get("isi:0") == "isi"
+            assert [key for key, _ in partition.scan("hapus:", "hapus;")[0]] == ["hapus:3", "hapus:4"]
+            if engine == "log": assert not any(f"hapus:{i}" in partition.cold_storage_index for i in range(3))
+            assert not any(n.endswith(".compacted") for n in os.listdir(data_dir))
+            partition.close()
+    print("✅  Kunci yang dihapus tidak muncul lagi setelah restart, juga jika node mati di tengah compaction.")
+
+def run_replication_stream_test():
+    print("\n--- Nomor Urut, Deteksi Celah, dan Resync Replikasi ---")
+    follower = open_test_partition("replication_seq", role="follower")
+    value = Serializer().encode_value({"data": "nilai"})
+    assert follower.apply_replication(1, [(1, "a", value), (2, "b", value)]) == 2
+    # Batch yang dikirim ulang dilewati, batch yang melompati nomor urut ditolak
+    assert follower.apply_replication(1, [(2, "b", value), (3, "c", value)]) == 1
+    try:
+        follower.apply_replication(1, [(5, "e", value)])
+        assert False, "Celah nomor urut tidak terdeteksi"
+    except ReplicationGapError:
+        pass
+    assert follower.replicated_seq == 3 and follower.get("e") is None
+    follower.close()
+
+    # Leader dan follower sungguhan lewat TCP: follower "mati", antrean leader penuh dan dibuang, lalu resync
+    leader_node = LeaderNodeStub()
+    leader = open_test_partition("replication_leader", node=leader_node)
+    follower = open_test_partition("replication_follower", role="follower")
+    follower_node = FollowerNodeStub(follower)
+    server = NodeTCPServer(("localhost", 8100), NodeTCPHandler)
+    server.node = follower_node
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stream = ReplicationStream(7, leader, 1, "localhost", 8100)
+    stream.MAX_QUEUE_ENTRIES, stream.RETRY_INTERVAL = 5, 0.05
+    leader_node.streams.append(stream)
+    try:
+        leader.put_many([(f"repkey:{i}", {"data": f"nilai {i}"}) for i in range(5)])
+        wait_until(lambda: stream.acked_seq == leader_node.seq)
+        follower.put("repkey:basi", {"data": "hanya ada di follower"})
+        follower_node.down = True
+        leader.put_many([(f"repkey:{i}", {"data": f"nilai baru {i}"}) for i in range(5, 10)])
+        wait_until(lambda: not stream.healthy)
+        leader.delete("repkey:0")
+        assert stream.resync_pending and stream.dropped > 0
+        follower_node.down = False
+        wait_until(lambda: stream.resyncs == 1 and stream.acked_seq == leader_node.seq)
+        # Write setelah resync kembali lewat stream biasa
+        leader.put("repkey:setelah", {"data": "setelah resync"})
+        wait_until(lambda: stream.acked_seq == leader_node.seq)
+        for key in ["repkey:0", "repkey:basi", "repkey:setelah"] + [f"repkey:{i}" for i in range(1, 10)]:
+            assert follower.get(key) == leader.get(key), key
+        assert follower.get("repkey:0") is None and follower.get("repkey:basi") is None
+    finally:
+        stream.close(timeout=0)
+        server.shutdown(); server.server_close()
+        leader.close(); follower.close()
+    print("✅  Entri duplikat dilewati, celah nomor urut ditolak, dan follower yang tertinggal disusulkan lewat resync.")
+
+def run_read_cache_test():
+    print("\n--- Read Cache LRU untuk Cold Storage ---")
+    cache = LRUCache(max_entries=10, max_bytes=100)
+    for key in ("a", "b", "c"): cache.put(key, key, 40)
+    # Batas byte terlampaui: entri yang paling lama tidak dipakai ("a") dibuang lebih dulu
+    assert "a" not in cache and "b" in cache and cache.stats()["evictions"] == 1
+    cache.get("b"); cache.put("d", "d", 40)
+    assert "b" in cache and "c" not in cache
+
+    partition = open_test_partition("read_cache")
+    items = fill_memtable(partition, "cachekey", lambda i: {"data": f"nilai {i}"})
+    key = "cachekey:0"
+    assert partition.get(key) == items[key] and partition.get_key_location(key) == "READ_CACHE"
+    hits = partition.read_cache.stats()["hits"]
+    assert partition.get(key) == items[key] and partition.read_cache.stats()["hits"] == hits + 1
+    # PUT meng-invalidate entri cache, jadi GET berikutnya tidak membaca value lama
+    partition.put(key, {"data": "nilai baru"})
+    assert key not in partition.read_cache and partition.get(key) == {"data": "nilai baru"}
+    partition.close()
+    print("✅  Cache membuang entri LRU, melayani GET berulang, dan di-invalidate oleh PUT.")
+
+def check_pooled_connections(key, partition_id):
+    print("\n--- Koneksi Persisten dari Pool ---")
+    info = CLUSTER_TOPOLOGY['nodes'][CLUSTER_TOPOLOGY['partitions'][partition_id]['leader']]
+    pool = get_pool(info['host'], info['port'])
+    sockets = set()
+    for _ in range(5):
+        response = send_request(info['host'], info['port'], f"GET {partition_id} {key}")
+        assert not response.startswith("Error"), response
+        sockets.update(sock for sock, _ in pool.idle)
+    # Request berurutan memakai ulang satu koneksi yang sama, dan koneksi itu kembali ke pool setelah dipakai
+    assert len(sockets) == 1 and len(pool.idle) == 1 and pool.in_use == 0
+    print("✅  Lima request memakai satu koneksi yang sama dari pool.")
+
+def check_pipelined_requests(all_keys):
+    print("\n--- Pipelining Request Biner ---")
+    serializer = Serializer()
+    futures = []
+    # Semua GET dikirim dulu tanpa menunggu balasan; satu koneksi per leader membawa semuanya
+    for partition_id, keys in all_keys.items():
+        info = CLUSTER_TOPOLOGY['nodes'][CLUSTER_TOPOLOGY['partitions'][partition_id]['leader']]
+        conn = get_pipeline(info['host'], info['port'])
+        for key in keys:
+            futures.append((key, conn.submit(protocol.OP_GET, partition_id, key)))
+        assert get_pipeline(info['host'], info['port']) is conn
+    for key, future in futures:
+        status, body = future.result(5)
+        # Balasan dicocokkan lewat request_id, jadi setiap future mendapat value kuncinya sendiri
+        assert status == protocol.STATUS_OK and serializer.decode_to_value(body)['data'] == f"ini adalah nilai untuk {key}"
+    print(f"✅  {len(futures)} request pipelined mendapat balasan yang benar.")
+
+def run_pipeline_timeout_test():
+    print("\n--- Timeout Request Pipelined ---")
+    # Node yang menerima koneksi (backlog listen) tetapi tidak pernah membalas
+    hung = socket.create_server(("localhost", 0))
+    port = hung.getsockname()[1]
+    try:
+        for _ in range(3):
+            conn = get_pipeline("localhost", port)
+            status, body = send_binary_request("localhost", port, protocol.OP_GET, 0, "kunci", timeout=0.2)
+            assert status == protocol.STATUS_ERROR and b"No response" in body
+            # Request yang timeout tidak tertinggal di pending, dan koneksinya ditutup serta dibuang dari cache
+            assert not conn.pending and conn.closed and ("localhost", port) not in network._pipelines
+    finally:
+        hung.close()
+    print("✅  Request yang timeout dilepas, koneksi ke node yang macet ditutup dan tidak dipakai ulang.")
+
+def check_batch_commands(coordinator):
+    print("\n--- MPUT/MGET Lintas Partisi ---")
+    mapping = {f"batch:{i}": {"data": f"nilai batch {i}"} for i in range(20)}
+    # 20 kunci tersebar di beberapa partisi, dikirim sebagai satu request per node leader
+    assert len({coordinator._get_partition_for_key(key) for key in mapping}) > 1
+    results = coordinator.mput(mapping)
+    assert all(message.startswith("SUCCESS") for message in results.values()), results
+    values = coordinator.mget(list(mapping) + ["batch:tidak-ada"])
+    for key, value in mapping.items():
+        assert values[key]['data'] == value['data']
+    assert values["batch:tidak-ada"] is None
+    print(f"✅  MPUT dan MGET {len(mapping)} kunci berhasil, kunci yang tidak ada bernilai None.")
+
+def check_follower_reads(all_keys):
+    print("\n--- Follower Read dengan Round-Robin dan Batas Lag ---")
+    roles = CLUSTER_TOPOLOGY['partitions'][0]
+    coordinator = Coordinator(CLUSTER_TOPOLOGY, read_policy="round-robin", max_lag_entries=0)
+    # Replikasi sudah selesai (lag 0): leader dan follower bergiliran melayani GET
+    assert {coordinator._choose_read_replica(0) for _ in range(4)} == {roles['leader']} | set(roles['followers'])
+    for key in all_keys[0]:
+        assert coordinator.get(key)['data'] == f"ini adalah nilai untuk {key}"
+    # Follower yang lag-nya tidak diketahui atau melewati batas tidak dipilih
+    coordinator.replication_lag = {(0, f_id): {"lag_entries": 5, "lag_ms": 0.0, "healthy": True} for f_id in roles['followers']}
+    coordinator.lag_fetched_at = time.monotonic()
+    assert {coordinator._choose_read_replica(0) for _ in range(4)} == {roles['leader']}
+    print("✅  GET bergiliran ke leader dan follower, follower yang tertinggal dilewati.")
+
+def start_cluster(server_mode=None, workers=None):
+    """Menjalankan semua node di CLUSTER_TOPOLOGY, masing-masing di proses terpisah."""
+    processes = []
+    for node_id, info in CLUSTER_TOPOLOGY['nodes'].items():
+        process = multiprocessing.Process(target=start_node_process,
+                                          args=(node_id, info['host'], info['port'], CLUSTER_TOPOLOGY, server_mode, workers))
+        processes.append(process)
+        process.start()
+        print(f"Starting Node-{node_id} process...")
+    print("\nWaiting for all nodes to start...")
+    time.sleep(2)
+    return processes
+
+def stop_cluster(processes):
+    """SHUTDOWN ke semua node, lalu menghentikan proses yang masih tersisa (juga setelah assert gagal)."""
+    for info in CLUSTER_TOPOLOGY['nodes'].values():
+        send_request(info['host'], info['port'], "SHUTDOWN")
+    time.sleep(1)
+    for p in processes:
+        if p.is_alive(): p.terminate()
+
+def run_server_mode_test(server_mode):
+    print(f"\n--- Cluster dengan Server '{server_mode}' ---")
+    if os.path.exists("data"): shutil.rmtree("data")
+    processes = start_cluster(server_mode=server_mode)
+    try:
+        coordinator = Coordinator(CLUSTER_TOPOLOGY)
+        all_keys = {i: find_keys_for_partition(i, 3) for i in CLUSTER_TOPOLOGY['partitions']}
+        for keys in all_keys.values():
+            for key in keys:
+                assert coordinator.put(key, {"data": f"ini adalah nilai untuk {key}"}).startswith("SUCCESS")
+        for keys in all_keys.values():
+            assert coordinator.get(keys[0])['data'] == f"ini adalah nilai untuk {keys[0]}"
+        check_pipelined_requests(all_keys)
+        # Server asyncio memproses potongan satu koneksi secara bersamaan, jadi bisa tiba tidak berurutan
+        check_streaming(coordinator)
+        # Perintah teks (CLI) dilayani server yang sama
+        info = CLUSTER_TOPOLOGY['nodes'][CLUSTER_TOPOLOGY['partitions'][0]['leader']]
+        assert json.loads(send_request(info['host'], info['port'], f"GET 0 {all_keys[0][1]}"))['data'].endswith(all_keys[0][1])
+    finally:
+        stop_cluster(processes)
+    print(f"✅  PUT, GET, pipelining, dan perintah teks berhasil di server '{server_mode}'.")
+
+def run_worker_mode_test(workers=2):
+    print(f"\n--- Cluster Multi-Proses ({workers} Worker per Node) ---")
+    if os.path.exists("data"): shutil.rmtree("data")
+    processes = start_cluster(workers=workers)
+    try:
+        coordinator = Coordinator(CLUSTER_TOPOLOGY)
+        all_keys = {i: find_keys_for_partition(i, 3) for i in CLUSTER_TOPOLOGY['partitions']}
+        for keys in all_keys.values():
+            for key in keys:
+                assert coordinator.put(key, {"data": f"ini adalah nilai untuk {key}"}).startswith("SUCCESS")
+        check_pipelined_requests(all_keys)
+        # MPUT/MGET dipecah front-end ke worker pemilik masing-masing partisi
+        check_batch_commands(coordinator)
+        time.sleep(1) # replikasi ke follower, yang juga dilayani worker
+        check_follower_reads(all_keys)
+        # Node 0 memegang partisi 0 dan 2 (worker 0) serta 3 (worker 1); STATS menggabungkan keduanya
+        info = CLUSTER_TOPOLOGY['nodes'][0]
+        stats = json.loads(send_request(info['host'], info['port'], "STATS"))
+        assert set(stats["workers"]) == {f"worker_{i}" for i in range(workers)}
+        assert set(stats["partitions"]) == {"partition_0", "partition_2", "partition_3"}
+        assert set(stats["replication"]) == {"partition_0", "partition_3"}
+        assert 'worker="1"' in send_request(info['host'], info['port'], "STATS prometheus")
+    finally:
+        stop_cluster(processes)
+    print(f"✅  PUT, GET, batch, follower read, dan STATS berhasil dengan {workers} worker per node.")
+
+def run_failover_test():
+    print("\n--- Failover Leader dan Restart Leader Lama ---")
+    if os.path.exists("data"): shutil.rmtree("data")
+    processes = start_cluster()
+    try:
+        coordinator = Coordinator(CLUSTER_TOPOLOGY)
+        old_leader = CLUSTER_TOPOLOGY['partitions'][0]['leader']
+        info = CLUSTER_TOPOLOGY['nodes'][old_leader]
+        key_before, key_after = find_keys_for_partition(0, 2)
+        assert coordinator.put(key_before, {"data": "sebelum"}).startswith("SUCCESS")
+        time.sleep(1) # replikasi ke follower
+        processes[old_leader].terminate(); processes[old_leader].join()
+        # Follower dipromosikan setelah FAILURE_TIMEOUT; koordinator menemukan leader baru lewat refresh_routes
+        wait_until(lambda: coordinator.put(key_after, {"data": "sesudah"}).startswith("SUCCESS"), timeout=FAILURE_TIMEOUT * 5)
+        assert coordinator.get(key_before)['data'] == "sebelum"
+        # Leader lama di-restart: sejak start hanya follower, lalu mengikuti epoch baru dari node lain
+        processes[old_leader] = multiprocessing.Process(target=start_node_process,
+                                                        args=(old_leader, info['host'], info['port'], CLUSTER_TOPOLOGY))
+        processes[old_leader].start()
+        put = f'PUT 0 {key_after} {json.dumps({"data": "basi"})}'
+        wait_until(lambda: not send_request(info['host'], info['port'], "STATS").startswith("Error"))
+        assert send_request(info['host'], info['port'], put).startswith("ERROR: Not a leader")
+        def synced_roles():
+            status, body = send_binary_request(info['host'], info['port'], protocol.OP_TOPOLOGY, 0, '')
+            return status == protocol.STATUS_OK and decode_topology(body)['partitions'][0]['epoch'] > 0
+        wait_until(synced_roles)
+        assert decode_topology(send_binary_request(info['host'], info['port'], protocol.OP_TOPOLOGY, 0, '')[1])['partitions'][0]['leader'] != old_leader
+        assert send_request(info['host'], info['port'], put).startswith("ERROR: Not a leader")
+        assert coordinator.get(key_after)['data'] == "sesudah"
+    finally:
+        stop_cluster(processes)
+    print("✅  Follower dipromosikan saat leader mati, dan leader lama kembali sebagai follower.")
+
+def run_migration_test():
+    print("\n--- Menambah Partisi dan Migrasi Rentang Kunci Online ---")
+    if os.path.exists("data"): shutil.rmtree("data")
+    # Direktori data dari routing modulo (partisi tanpa penanda layout) ditolak saat start
+    os.makedirs("data/unit/legacy/partition_0")
+    try:
+        check_ring_layout("data/unit/legacy")
+        assert False, "Data routing modulo seharusnya ditolak"
+    except RuntimeError: pass
+    check_ring_layout("data/unit/fresh"); check_ring_layout("data/unit/fresh")
+    processes = start_cluster()
+    try:
+        coordinator = Coordinator(CLUSTER_TOPOLOGY)
+        keys = [f"migrasi:{i}" for i in range(300)]
+        for key in keys: assert coordinator.put(key, {"versi": 1}).startswith("SUCCESS")
+        new_id = max(CLUSTER_TOPOLOGY['partitions']) + 1
+        assert coordinator.add_partition(new_id, 1, [2]).startswith("SUCCESS")
+        # Write selama migrasi ikut pindah (lewat pelacakan dirty atau routing baru)
+        for key in keys[::3]: assert coordinator.put(key, {"versi": 2}).startswith("SUCCESS")
+        def migrated():
+            coordinator.refresh_routes()
+            return len(coordinator.cluster_topology['partitions'][new_id].get('active_vnodes') or []) == VNODES_PER_PARTITION
+        wait_until(migrated, timeout=30)
+        moved = [key for key in keys if coordinator.ring.partition_for(key) == new_id]
+        assert moved
+        for index, key in enumerate(keys):
+            assert coordinator.get(key)['versi'] == (2 if index % 3 == 0 else 1), key
+        # Salinan di partisi sumber dihapus begitu rentangnya selesai pindah
+        old_ring = HashRing(CLUSTER_TOPOLOGY['partitions'])
+        def source_copies(key):
+            p_id = old_ring.partition_for(key)
+            info = CLUSTER_TOPOLOGY['nodes'][coordinator.cluster_topology['partitions'][p_id]['leader']]
+            return send_request(info['host'], info['port'], f"GET {p_id} {key}")
+        wait_until(lambda: all(source_copies(key) == "null" for key in moved))
+        # Leader sumber di-restart: kepemilikan rentang dibaca dari topologi yang disimpan, jadi write dari
+        # routing lama tetap ditolak (koordinator lalu memperbarui route-nya) dan tidak hilang
+        key = next(key for key in moved if old_ring.partition_for(key) == 0)
+        source = CLUSTER_TOPOLOGY['partitions'][0]['leader']
+        info = CLUSTER_TOPOLOGY['nodes'][source]
+        processes[source].terminate(); processes[source].join()
+        processes[source] = multiprocessing.Process(target=start_node_process,
+                                                    args=(source, info['host'], info['port'], CLUSTER_TOPOLOGY))
+        processes[source].start()
+        unmoved = next(k for k in keys if old_ring.partition_for(k) == 0 and k not in moved)
+        def leader_put(k, value):
+            # Leader partisi 0 saat ini: node yang di-restart, atau follower-nya jika restart melewati FAILURE_TIMEOUT
+            coordinator.refresh_routes()
+            leader = CLUSTER_TOPOLOGY['nodes'][coordinator.cluster_topology['partitions'][0]['leader']]
+            return send_request(leader['host'], leader['port'], f'PUT 0 {k} {json.dumps(value)}')
+        wait_until(lambda: leader_put(unmoved, {"versi": 1}).startswith("SUCCESS"), timeout=FAILURE_TIMEOUT * 5)
+        assert leader_put(key, {"versi": 3}).startswith("ERROR")
+        assert Coordinator(CLUSTER_TOPOLOGY).put(key, {"versi": 3}).startswith("SUCCESS")
+        assert coordinator.get(key)['versi'] == 3
+    finally:
+        stop_cluster(processes)
+    print(f"✅  {len(moved)} dari {len(keys)} kunci pindah ke Partisi {new_id} tanpa kehilangan write dan dihapus dari sumbernya; "
+          f"data modulo lama ditolak.")
+
 def run_replication_test():
     print("--- MULAI PENGUJIAN AKHIR (VERSI DINAMIS) ---\n")
     
@@ -37,15 +827,7 @@ def run_replication_test():
     
 
     # Jalankan semua node di proses terpisah
-    processes = []
-    for node_id, info in CLUSTER_TOPOLOGY['nodes'].items():
-        process = multiprocessing.Process(target=start_node_process, args=(node_id, info['host'], info['port'], CLUSTER_TOPOLOGY))
-        processes.append(process)
-        process.start()
-        print(f"Starting Node-{node_id} process...")
-
-    print("\nWaiting for all nodes to start...")
-    time.sleep(2)
+    processes = start_cluster()
 
     coordinator = Coordinator(CLUSTER_TOPOLOGY)
     
@@ -55,7 +837,7 @@ def run_replication_test():
     # Loop untuk setiap partisi yang didefinisikan di config.py
     for i in range(num_partitions):
         print(f"\n--- Mencari dan Melakukan PUT untuk Memicu Flush di Partisi {i} ---")
-        keys_for_p = find_keys_for_partition(i, 5, num_partitions)
+        keys_for_p = find_keys_for_partition(i, 5)
         all_keys[i] = keys_for_p # Simpan daftar kunci untuk partisi ini
         print(f"Kunci untuk P{i}: {keys_for_p}")
         for key in keys_for_p:
@@ -72,6 +854,15 @@ def run_replication_test():
         print(f"GET {key_to_get} (from P{i}) -> {value}")
         assert value['data'] == f"ini adalah nilai untuk {key_to_get}"
     print("✅  GET requests successful for all partitions.")
+
+    check_pooled_connections(all_keys[0][0], 0)
+    check_pipelined_requests(all_keys)
+    check_batch_commands(coordinator)
+    check_follower_reads(all_keys)
+    check_scan(coordinator)
+    check_stats(all_keys)
+    check_streaming(coordinator)
+    check_load(CLUSTER_TOPOLOGY)
     
     print("\n--- Sending SHUTDOWN command to all nodes ---")
     for node_id, info in CLUSTER_TOPOLOGY['nodes'].items():
@@ -99,10 +890,33 @@ def run_replication_test():
     print("\n--- Menutup proses utama ---")
     for p in processes:
         if p.is_alive(): p.terminate()
-        
+
+if __name__ == "__main__":
+    run_serializer_test()
+    run_pipeline_timeout_test()
+    run_memtable_flush_test()
+    run_segment_map_test()
+    run_read_cache_test()
+    run_compaction_test()
+    run_sstable_test()
+    run_key_index_test()
+    run_startup_index_test()
+    run_scan_test()
+    run_ttl_test()
+    run_concurrent_read_test("log")
+    run_concurrent_read_test("sstable")
+    run_chunked_upload_test()
+    run_metrics_test()
+    run_load_summary_test()
+    run_wal_test()
+    run_delete_compaction_test()
+    run_replication_stream_test()
+    run_replication_test()
+    run_server_mode_test("asyncio")
+    run_worker_mode_test()
+    run_failover_test()
+    run_migration_test()
+
     print("\n\n**********************************************")
     print("      SELURUH SISTEM BERHASIL DIUJI!")
     print("**********************************************")
-
-if __name__ == "__main__":
-    run_replication_test()
\ No newline at end of file
@@ -0,0 +1,49 @@
+# ttl.py
+import time
+
+def now_ms() -> int:
+    """Waktu sekarang dalam milidetik sejak epoch, satuan yang dipakai expires_at di seluruh sistem."""
+    return int(time.time() * 1000)
+
+def expires_at_for(ttl_seconds) -> int:
+    """expires_at absolut untuk TTL relatif (detik), atau None jika tanpa TTL."""
+    return None if ttl_seconds is None else now_ms() + int(ttl_seconds * 1000)
+
+class TimerWheel:
+    """
+    Hashed timing wheel untuk kunci ber-TTL: setiap (key, expires_at) ditaruh di slot tick-nya
+    (tick = expires_at / tick_ms dibulatkan ke atas, modulo jumlah slot). Setiap kali jarum maju, hanya slot yang dilewati
+    yang diperiksa, bukan semua kunci. Entri yang kedaluwarsanya lebih dari satu putaran lagi tetap di
+    slotnya dan diperiksa ulang setiap putaran. Entri basi (kunci sudah ditimpa) disaring oleh pemanggil.
+    Tidak thread-safe: pemanggil yang memegang lock.
+    """
+    def __init__(self, tick_ms: int, num_slots: int):
+        self.tick_ms = tick_ms
+        self.slots = [[] for _ in range(num_slots)]
+        self.current_tick = now_ms() // tick_ms
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key, expires_at: int):
+        # Dibulatkan ke atas, sehingga begitu jarum mencapai tick ini semua entri di slotnya sudah lewat waktunya.
+        # Yang sudah lewat (mis. hasil replay atau replikasi yang terlambat) diproses di tick berikutnya.
+        tick = max(-(-expires_at // self.tick_ms), self.current_tick + 1)
+        self.slots[tick % len(self.slots)].append((key, expires_at))
+        self.size += 1
+
+    def advance(self, now: int) -> list:
+        """Memajukan jarum sampai now dan mengembalikan [(key, expires_at), ...] yang sudah kedaluwarsa."""
+        target = now // self.tick_ms
+        due = []
+        # Jika jarum tertinggal lebih dari satu putaran, cukup setiap slot diperiksa sekali
+        for tick in range(max(self.current_tick + 1, target - len(self.slots) + 1), target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if not slot: continue
+            keep = []
+            for entry in slot: (due if entry[1] <= now else keep).append(entry)
+            self.slots[tick % len(self.slots)] = keep
+        self.current_tick = max(self.current_tick, target)
+        self.size -= len(due)
+        return due
@@ -0,0 +1,157 @@
+# wal.py
+import os
+import re
+import struct
+import zlib
+import threading
+import time
+
+# Record WAL: [crc32 (4b)] [key_len (4b)] [value_len (4b)] [key] [value], crc32 dihitung dari key + value
+WAL_RECORD_HEADER = struct.Struct('!III')
+_WAL_FILE_RE = re.compile(r'^wal_(\d+)\.log$')
+
+DURABILITY_NONE = "none"           # tanpa WAL: data di memtable hilang jika node mati sebelum flush
+DURABILITY_BATCHED = "batched"     # group commit: PUT yang datang berdekatan berbagi satu fsync
+DURABILITY_PER_WRITE = "per-write" # satu fsync untuk setiap request PUT/MPUT/DELETE
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_BATCHED, DURABILITY_PER_WRITE)
+
+def wal_file_name(generation: int) -> str:
+    return f"wal_{generation:06d}.log"
+
+def list_wal_generations(data_dir: str) -> list:
+    generations = []
+    for name in os.listdir(data_dir):
+        match = _WAL_FILE_RE.match(name)
+        if match: generations.append(int(match.group(1)))
+    return sorted(generations)
+
+def encode_wal_record(key: str, value_bytes: bytes) -> bytes:
+    key_bytes = key.encode('utf-8')
+    return WAL_RECORD_HEADER.pack(zlib.crc32(key_bytes + value_bytes), len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+
+def read_wal_file(path: str) -> list:
+    """Membaca record WAL [(key, value_bytes), ...]. Berhenti di record terpotong/rusak (tulisan terakhir sebelum crash)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []; offset = 0
+    while offset + WAL_RECORD_HEADER.size <= len(data):
+        checksum, key_len, value_len = WAL_RECORD_HEADER.unpack_from(data, offset)
+        start = offset + WAL_RECORD_HEADER.size
+        payload = data[start:start + key_len + value_len]
+        if len(payload) < key_len + value_len or zlib.crc32(payload) != checksum: break
+        records.append((payload[:key_len].decode('utf-8'), payload[key_len:]))
+        offset = start + key_len + value_len
+    return records
+
+def remove_wal_files(data_dir: str, generations):
+    """Menghapus file WAL yang memtable-nya sudah tersimpan permanen di segmen."""
+    for generation in generations:
+        path = os.path.join(data_dir, wal_file_name(generation))
+        if os.path.exists(path): os.remove(path)
+
+class WriteAheadLog:
+    """
+    WAL append-only untuk memtable sebuah partisi. Setiap memtable punya file sendiri (wal_<generation>.log)
+    yang dihapus begitu memtable tersebut selesai di-flush ke segmen.
+
+    Mode 'batched' memakai group commit: satu thread committer menulis semua record yang menunggu lalu
+    melakukan satu fsync. PUT yang datang selama fsync berjalan dikumpulkan untuk fsync berikutnya, dan
+    `window` (opsional) menambah jeda agar batch-nya lebih besar.
+
+    Di kedua mode, append hanya mencatat record (dipanggil di bawah lock partisi); fsync-nya ditunggu lewat
+    wait_durable setelah lock partisi dilepas, sehingga tidak ada fsync yang menahan penulis lain di partisi itu.
+    """
+    def __init__(self, data_dir: str, mode: str, window: float):
+        self.data_dir = data_dir
+        self.mode = mode
+        self.window = window
+        existing = list_wal_generations(data_dir)
+        self.generation = existing[-1] + 1 if existing else 1
+        self.file = open(os.path.join(data_dir, wal_file_name(self.generation)), 'ab')
+        self.pending = []
+        self.next_seq = 0
+        self.durable_seq = 0
+        self.closing = False
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # io_lock menjaga agar file tidak ditukar (rotate) saat committer sedang menulis/fsync
+        self.io_lock = threading.Lock()
+        if mode == DURABILITY_BATCHED:
+            self.committer = threading.Thread(target=self._committer_loop)
+            self.committer.daemon = True; self.committer.start()
+
+    def append(self, key: str, value_bytes: bytes) -> int:
+        """Menambahkan satu record dan mengembalikan nomor urutnya untuk wait_durable."""
+        record = encode_wal_record(key, value_bytes)
+        with self.lock:
+            self.next_seq += 1
+            if self.mode == DURABILITY_PER_WRITE:
+                self.file.write(record)
+            else:
+                self.pending.append(record)
+                self.cond.notify_all()
+            return self.next_seq
+
+    def wait_durable(self, seq: int):
+        if self.mode == DURABILITY_PER_WRITE:
+            # Setiap request melakukan fsync-nya sendiri; record di file lama sudah di-fsync oleh rotate
+            with self.io_lock:
+                self._write_batch(self.file, *self._take_pending())
+            return
+        with self.cond:
+            while self.durable_seq < seq:
+                self.cond.wait()
+
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _take_pending(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+            return batch, self.next_seq
+
+    def _write_batch(self, f, batch, target_seq):
+        """Menulis batch record dengan satu write dan satu fsync. io_lock harus sudah dipegang."""
+        if batch: f.write(b''.join(batch))
+        # Di mode per-write record sudah ditulis oleh append, tinggal di-fsync
+        if batch or self.mode == DURABILITY_PER_WRITE: self._sync(f)
+        with self.cond:
+            self.durable_seq = max(self.durable_seq, target_seq)
+            self.cond.notify_all()
+
+    def _committer_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                if not self.pending: return
+            # Beri kesempatan PUT lain yang datang hampir bersamaan untuk ikut dalam fsync yang sama
+            if self.window: time.sleep(self.window)
+            with self.io_lock:
+                self._write_batch(self.file, *self._take_pending())
+
+    def rotate(self) -> int:
+        """Menutup file WAL saat ini (memtable-nya akan di-flush) dan memulai file baru. Mengembalikan generation lama."""
+        with self.io_lock:
+            with self.lock:
+                old_file, old_generation = self.file, self.generation
+                batch, self.pending = self.pending, []
+                target_seq = self.next_seq
+                self.generation += 1
+                self.file = open(os.path.join(self.data_dir, wal_file_name(self.generation)), 'ab')
+            self._write_batch(old_file, batch, target_seq)
+            old_file.close()
+        return old_generation
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        if self.mode == DURABILITY_BATCHED: self.committer.join()
+        with self.io_lock:
+            self._write_batch(self.file, *self._take_pending())
+            empty = self.file.tell() == 0
+            self.file.close()
+        # File kosong (semua memtable sudah di-flush) tidak perlu di-replay saat startup berikutnya
+        if empty: remove_wal_files(self.data_dir, [self.generation])